@@ -177,13 +177,13 @@ def low_rank_approximation(low_rank, svd_u, svd_v, singular_values):
     """
     Low-rank approximation from the SVD.
     """
-    effective_rank = _effective_rank(singular_values)
+    schmidt_rank = effective_rank(singular_values)
 
-    if 0 < low_rank < effective_rank:
-        effective_rank = low_rank
+    if 0 < low_rank < schmidt_rank:
+        schmidt_rank = low_rank
 
     # To use isometries, the rank needs to be a power of 2.
-    rank = int(2 ** ceil(log2(effective_rank)))
+    rank = int(2 ** ceil(log2(schmidt_rank)))
 
     return rank, svd_u[:, :rank], singular_values[:rank], svd_v[:rank, :]
 
@@ -257,10 +257,34 @@ def _undo_separation_matrix(n_qubits, sep_matrix, partition):
     return state_vector
 
 
-def _effective_rank(singular_values):
+def effective_rank(singular_values):
+    """
+    Number of singular values above the threshold ``1e-7`` (the Schmidt rank
+    used by ``schmidt_decomposition``).
+    """
     return sum(j > 10**-7 for j in singular_values)
 
 
+def schmidt_coefficients(state_vector, partition):
+    """
+    Schmidt coefficients of a state vector, in descending order, without
+    computing the Schmidt bases.
+
+    Parameters
+    ----------
+    state_vector: list of complex
+        A unit vector representing a quantum state.
+
+    partition: list of int
+        Set of qubit indices that represent a part of the bipartition (see
+        ``schmidt_decomposition``).
+    """
+    n_qubits = _to_qubits(len(state_vector))
+    sep_matrix = _separation_matrix(n_qubits, np.asarray(state_vector), partition)
+
+    return np.linalg.svd(sep_matrix, compute_uv=False)
+
+
 def schmidt_composition(svd_u, svd_v, singular_values, partition):
     """
     Execute the Schmidt composition of a state vector.
@@ -1,3 +1,4 @@
 from .mcg import Mcg
 from .mcx import LinearMcx, McxVchainDirty
-from .ucr import Ucr
\ No newline at end of file
+from .ucr import Ucr
+from .ucg import Ucg
@@ -128,7 +128,7 @@ class Ldmcu(Gate):
 
         sqgate = QuantumCircuit(1, name="U^1/" + str(coef))
         sqgate.unitary(gate, 0)  # pylint: disable=maybe-no-member
-        csqgate = sqgate.control(1)
+        csqgate = sqgate.control(1, annotated=False)
 
         return csqgate
 
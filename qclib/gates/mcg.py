@@ -59,7 +59,7 @@ class Mcg(Gate):
             u_gate = QuantumCircuit(1)
             u_gate.unitary(self.unitary, 0)
             self.definition.append(
-                u_gate.control(num_ctrl, ctrl_state=self.ctrl_state),
+                u_gate.control(num_ctrl, ctrl_state=self.ctrl_state, annotated=False),
                 [*self.controls, self.target]
             )
         else:
@@ -96,3 +96,23 @@ class Mcg(Gate):
             Mcg(unitary, len(controls), ctrl_state=ctrl_state),
             [*controls, target]
         )
+
+
+# Exact CNOT counts of the SU(2) decomposition (``Ldmcsu``) up to seven
+# controls. Beyond that, the count grows linearly.
+_SU2_CNOTS = (0, 2, 4, 14, 24, 38, 54, 80)
+
+
+def mcg_cnot_count(num_controls, special_unitary=True):
+    """
+    Number of CNOTs of the ``Mcg`` decomposition with ``num_controls``
+    controls. It does not depend on the gate, only on whether it is in SU(2)
+    (``special_unitary=True``) or in U(2).
+    """
+    if special_unitary:
+        if num_controls < len(_SU2_CNOTS):
+            return _SU2_CNOTS[num_controls]
+        return 16 * (num_controls + 1) - 40
+    if num_controls == 0:
+        return 0
+    return 4 * num_controls * (num_controls - 1) + 2
@@ -0,0 +1,132 @@
+# Copyright 2021 qclib project.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Uniformly controlled single-qubit gate (multiplexor) decomposition"""
+
+import numpy as np
+from qiskit import QuantumCircuit, QuantumRegister
+from qiskit.circuit import Gate
+from qiskit.circuit.library import DiagonalGate
+
+_HADAMARD = np.array([[1.0, 1.0], [1.0, -1.0]]) / np.sqrt(2)
+_S_DAGGER = np.diag([1.0, -1.0j])
+
+
+class Ucg(Gate):
+    """
+    Uniformly controlled single-qubit gate.
+
+    Applies ``unitaries[i]`` to the target when the controls are in the state
+    ``|i>``. The qubits are ordered as ``[target, control_0, control_1, ...]``,
+    ``control_j`` being the bit ``j`` of ``i`` (the layout of qiskit's
+    ``UCGate``).
+
+    Bergholm et al., Quantum circuits with uniformly controlled one-qubit gates
+    https://arxiv.org/abs/quant-ph/0410066
+
+    With ``k`` controls, the circuit has ``2^k`` single-qubit gates on the
+    target and ``2^k - 1`` CNOTs. If ``up_to_diagonal`` is ``True``, it
+    implements the gate up to the diagonal returned by ``diagonal()``: the
+    circuit implements ``U'`` such that ``D U' = U``.
+    """
+
+    def __init__(self, unitaries, up_to_diagonal: bool = False, label=None):
+        self.unitaries = np.asarray(unitaries, dtype=complex)
+        self.up_to_diagonal = up_to_diagonal
+        self._decomposition = None
+
+        n_controls = np.log2(self.unitaries.shape[0])
+        if self.unitaries.shape[1:] != (2, 2) or not n_controls.is_integer():
+            raise ValueError(
+                "The number of 2x2 unitaries is not a non-negative power of 2."
+            )
+
+        if label is None:
+            label = "UCG"
+
+        super().__init__("ucg", int(n_controls) + 1, [], label=label)
+
+    def diagonal(self):
+        """
+        Diagonal ``D`` left by the decomposition, in the computational basis of
+        ``(control_k-1, ..., control_0, target)``: the entry ``2 * i + t`` is
+        the phase of the target state ``|t>`` when the controls are in ``|i>``.
+        """
+        return self._decompose()[1]
+
+    def _decompose(self):
+        if self._decomposition is None:
+            self._decomposition = ucg_decomposition(self.unitaries)
+        return self._decomposition
+
+    def _define(self):
+        gates, diagonal = self._decompose()
+
+        target = QuantumRegister(1)
+        controls = QuantumRegister(self.num_qubits - 1)
+        self.definition = QuantumCircuit(target, controls)
+        for i, gate in enumerate(gates):
+            if i > 0:
+                # The i-th CNOT is controlled by the qubit of the lowest set bit of i.
+                control = (i & -i).bit_length() - 1
+                self.definition.cx(controls[control], target[0])
+            self.definition.unitary(gate, target[0])  # pylint: disable=maybe-no-member
+
+        if not self.up_to_diagonal and self.num_qubits > 1:
+            self.definition.append(DiagonalGate(list(diagonal)), [target[0], *controls])
+
+
+def ucg_decomposition(unitaries):
+    """
+    Decomposes the uniformly controlled gate of ``unitaries`` (shape
+    ``(2^k, 2, 2)``) into ``2^k`` single-qubit gates, applied in this order and
+    interleaved with the CNOTs of ``Ucg``, followed by a diagonal gate.
+    Returns ``(gates, diagonal)``; see ``Ucg.diagonal``.
+    """
+    unitaries = np.asarray(unitaries, dtype=complex)
+    if unitaries.shape[0] == 1:
+        return [unitaries[0]], np.ones(2, dtype=complex)
+
+    # Demultiplexes the most significant control "c": a = R^dag u d v and
+    # b = R u d^dag v, with d = diag(e^{i pi/4}, e^{-i pi/4}) and R diagonal.
+    half = unitaries.shape[0] // 2
+    a, b = unitaries[:half], unitaries[half:]
+    x = a @ np.conj(np.swapaxes(b, 1, 2))
+
+    # R is chosen so that R x R has the eigenvalues (i, -i).
+    phi = np.angle(np.linalg.det(x))
+    psi = np.angle(x[:, 0, 0])
+    r_diag = np.exp(1j * np.stack((np.pi / 4 - psi / 2, psi / 2 - phi / 2 - np.pi / 4), axis=1))
+    y = r_diag[:, :, None] * x * r_diag[:, None, :]
+    # y is anti-Hermitian: -iy has the eigenvalues (-1, 1).
+    _, u = np.linalg.eigh(-1j * y)
+    u = u[:, :, ::-1]
+    d = np.array([np.exp(1j * np.pi / 4), np.exp(-1j * np.pi / 4)])
+    v = d[None, :, None] * (np.conj(np.swapaxes(u, 1, 2)) * np.conj(r_diag)[:, None, :]) @ b
+
+    # The controlled d is e^{i pi/4} (S^dag x S^dag) CZ; the diagonal part on
+    # "c" commutes with the rest of the circuit and joins the diagonal.
+    gates_v, diagonal_v = ucg_decomposition(v)
+    # The diagonal left by v commutes with the CZ and merges into u.
+    gates_u, diagonal_u = ucg_decomposition(u * diagonal_v.reshape(half, 1, 2))
+
+    gates = gates_v[:-1] + [_HADAMARD @ gates_v[-1]]
+    gates += [gates_u[0] @ _S_DAGGER @ _HADAMARD] + gates_u[1:]
+
+    diagonal_u = diagonal_u.reshape(half, 2) * np.exp(1j * np.pi / 4)
+    diagonal = np.concatenate(
+        (np.conj(r_diag) * diagonal_u, -1j * r_diag * diagonal_u)
+    ).reshape(-1)
+
+    return gates, diagonal
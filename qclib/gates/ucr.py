@@ -13,73 +13,138 @@
 # limitations under the License.
 
 
-from math import log2, pi
-from typing import List, Union, Type
+from heapq import heapify, heappop, heappush
+from math import log2, pi, inf
+from time import perf_counter
+from typing import List, Tuple, Union, Type
 import numpy as np
 from qiskit import QuantumCircuit, QuantumRegister
-from qiskit.circuit import Gate
+from qiskit.circuit import CircuitInstruction, Gate, ParameterVector
 from qiskit.circuit.library import RZGate, RYGate, CXGate, CZGate
+from qclib.gates.mcg import Mcg, mcg_cnot_count
 
-from sympy import symbols, Or, And, Not
-from sympy.logic.boolalg import simplify_logic as sp_simplify_logic
-from qclib.gates import Mcg
-
-_mcg_cnot_count = {1:2, 2:4, 3:14, 4:24, 5:40, 6:56, 7:80}
+# Budget of `simplify_logic`: maximum number of implicants generated. Past
+# it, the binary strings are not simplified. It does not depend on the
+# machine, so the same input always gives the same circuit.
+_SIMPLIFY_MAX_TERMS = 2**18
 
 def multiplexor(
     r_gate: Union[Type[RZGate], Type[RYGate]],
     angles: List[float],
     c_gate: Union[Type[CXGate], Type[CZGate]] = CXGate,
     last_control: bool = True,
+    atol: float = 10**-8,
 ) -> QuantumCircuit:
     """
     Constructs a multiplexor rotation gate.
 
+    Rotations with an angle not greater than ``atol`` in absolute value are
+    omitted.
+
     Synthesis of Quantum Logic Circuits
     https://arxiv.org/abs/quant-ph/0406176
     """
-    size = len(angles)
-    n_qubits = int(log2(size)) + 1
-
-    reg = QuantumRegister(n_qubits)
-    circuit = QuantumCircuit(reg)
+    return _multiplexor(
+        r_gate, multiplexor_angles(angles), c_gate, last_control, atol=atol
+    )
 
-    target = reg[0]
-    control = reg[n_qubits - 1]
 
-    if n_qubits == 1:
-        if abs(angles[0]) > 10**-8:
-            circuit.compose(r_gate(angles[0]), [target], inplace=True)
-        return circuit
+def multiplexor_template(
+    r_gate: Union[Type[RZGate], Type[RYGate]],
+    n_controls: int,
+    c_gate: Union[Type[CXGate], Type[CZGate]] = CXGate,
+    last_control: bool = True,
+) -> Tuple[QuantumCircuit, ParameterVector]:
+    """
+    Constructs a parameterized multiplexor rotation gate with the layout of
+    `multiplexor` (no rotation is skipped). The i-th parameter is the angle
+    of the i-th rotation, and its values are given by `multiplexor_angles`.
+    """
+    angles = ParameterVector("theta", 2**n_controls)
+    return _multiplexor(r_gate, angles, c_gate, last_control, skip_zeros=False), angles
 
-    angle_multiplexor = np.kron(
-        [[0.5, 0.5], [0.5, -0.5]], np.identity(2 ** (n_qubits - 2))
-    )
-    multiplexed_angles = angle_multiplexor @ angles
 
+def multiplexor_angles(angles) -> np.ndarray:
+    """
+    Rotation angles of `multiplexor`, in the order they are applied. A batch
+    of angle lists can be given as an array of shape (..., 2**n_controls).
+    """
     # Figure 2 from Synthesis of Quantum Logic Circuits:
     #   The recursive decomposition of a multiplexed Rz gate.
-    #   The boxed CNOT gates may be canceled.
-    # This is why "last_cnot=False" in both calls of "rotation_multiplexor()" and
-    # also why the multiplexer in the second "circuit.append()" is reversed.
-    mult = multiplexor(r_gate, multiplexed_angles[: size // 2], c_gate, False)
-    circuit.compose(mult, reg[0:-1], inplace=True)
+    # Unrolling the recursion, the rotation angles are the Walsh-Hadamard
+    # transform of the input angles, applied in the binary reflected Gray code
+    # order (the second half of each level is reversed).
+    values = _walsh_hadamard(angles)
+    gray_code = np.arange(values.shape[-1])
+    gray_code ^= gray_code >> 1
+
+    return values[..., gray_code]
+
 
-    circuit.compose(c_gate(), [control, target], inplace=True)
+def _multiplexor(r_gate, angles, c_gate, last_control, skip_zeros=True, atol=10**-8):
+    """
+    Emits the rotations with the given angles interleaved with the CNOTs.
+    """
+    size = len(angles)
+    n_qubits = int(log2(size)) + 1
+
+    reg = QuantumRegister(n_qubits)
+    circuit = QuantumCircuit(reg)
+
+    qubits = list(reg)
+    target = (qubits[0],)
 
-    mult = multiplexor(r_gate, multiplexed_angles[size // 2 :], c_gate, False)
-    circuit.compose(mult.reverse_ops(), reg[0:-1], inplace=True)
+    # The CNOT between the rotations i and i+1 is controlled by the qubit of
+    # the bit flipped by the Gray code, i.e. the lowest set bit of i+1. The
+    # boxed CNOT gates of Figure 2 are canceled.
+    if isinstance(angles, np.ndarray):
+        angles = angles.tolist()
+
+    instructions = []
+    for i, angle in enumerate(angles):
+        if not skip_zeros or abs(angle) > atol:
+            instructions.append(CircuitInstruction(r_gate(angle), target))
+        if i < size - 1:
+            control = ((i + 1) & -(i + 1)).bit_length()
+            instructions.append(CircuitInstruction(c_gate(), (qubits[control], *target)))
 
     # The following condition allows saving CNOTs when two multiplexors are used
     # in sequence. Any multiplexor can have its operation reversed. Therefore, if
     # the second multiplexor is reverted, its last CNOT will be cancelled by the
     # last CNOT of the first multiplexer. In this condition, both last CNOTs are
     # unnecessary.
-    if last_control:
-        circuit.compose(c_gate(), [control, target], inplace=True)
+    if last_control and n_qubits > 1:
+        instructions.append(CircuitInstruction(c_gate(), (qubits[-1], *target)))
+
+    # The instructions are valid by construction, so the checks of `append`
+    # are skipped.
+    for instruction in instructions:
+        circuit._append(instruction)  # pylint: disable=protected-access
 
     return circuit
 
+
+def _walsh_hadamard(angles):
+    """
+    In-place fast Walsh-Hadamard transform over the last axis, O(n*2^n),
+    normalized by 1/2 per level. The most significant bit is transformed
+    first, as in the recursive multiplexor.
+    """
+    values = np.array(angles, dtype=float)
+    shape = values.shape
+    half = shape[-1] // 2
+    while half > 0:
+        blocks = values.reshape(*shape[:-1], -1, 2, half)
+        first = blocks[..., 0, :].copy()
+        blocks[..., 0, :] += blocks[..., 1, :]
+        blocks[..., 0, :] *= 0.5
+        blocks[..., 1, :] -= first
+        blocks[..., 1, :] *= -0.5
+        half //= 2
+
+    return values
+
+
 class Ucr(Gate):
     """
     Builds a uniformly controlled rotation gate.
@@ -179,39 +244,40 @@ class Ucr(Gate):
 
         else:
             num_controls = len(self.controls)
+            full_mask = 2**num_controls - 1
 
             # Collects data for the decomposition.
-            groups = self._group_binary_strings(self.params)
+            leaders, labels = self._group_angles(self.params)
 
             # Ignores the most repeated angle controls.
-            # Find the item with the largest number of lists.
-            global_angle = 0.0
-            max_item = max(groups.items(), key=lambda item: len(item[1]))
-            global_angle = max_item[0]
-            groups[global_angle] = []
+            # Find the group with the largest number of angles.
+            global_group = int(np.argmax(np.bincount(labels)))
+            global_angle = leaders[global_group]
 
-            # Performs simplification.
-            indexes, ctrl_states = self._ctrl_states(groups)
+            # Performs simplification. Each group is a list of implicants
+            # (value, mask), where the bits of `mask` are don't-care controls.
+            groups = self._implicants(labels, len(leaders), global_group, num_controls)
 
             # Search for separability (qubits not used after simplification).
-            # Returns the number of qubits that can be ignored,
-            # reducing the length of the control register.
-            missing_indexes = self._search_separability(indexes, num_controls)
+            # The controls that are a don't-care in every implicant can be
+            # ignored, reducing the length of the control register.
+            care_masks = np.array(
+                [full_mask & ~mask for implicants in groups for _, mask in implicants],
+                dtype=np.int64
+            )
+            used_mask = int(np.bitwise_or.reduce(care_masks)) if len(care_masks) else 0
+            controls = [i for i in range(num_controls) if used_mask >> i & 1]
+            missing_indexes = self.complement(num_controls, controls)
             num_controls -= len(missing_indexes)
 
             # Estimates the cost of a MCG decomposition to
             # autoselect between `multiplexor`and `mcg`.
-            mcg_cnot_count = 2**num_controls + 1
+            mcg_cnots = 2**num_controls + 1
             if self.method == 'auto':
-                mcg_cnot_count = 0
-                for k, v in groups.items():
-                    for bin_str in v:
-                        idx = indexes[bin_str]
-                        n_controls = len(idx)
-                        if n_controls < 8:
-                            mcg_cnot_count += _mcg_cnot_count[n_controls]
-                        else:
-                            mcg_cnot_count += 16*(n_controls+1)-40
+                mcg_cnots = 0
+                for care_mask in care_masks:
+                    n_controls = bin(care_mask).count('1')
+                    mcg_cnots += mcg_cnot_count(n_controls)
 
             if global_angle != 0.0:
                 r_gate = self.r_gate(global_angle)
@@ -222,7 +288,7 @@ class Ucr(Gate):
                 )
 
             if self.method == 'multiplexor' or (
-                self.method == 'auto' and 2**num_controls < mcg_cnot_count
+                self.method == 'auto' and 2**num_controls < mcg_cnots
             ):
                 if len(missing_indexes) == 0:
                     # It is not possible to separate the state.
@@ -232,39 +298,18 @@ class Ucr(Gate):
                     # It is possible to separate the state.
                     #
                     # Reduces the number of control bits, eliminating ignored
-                    # indexes, and assembles an ordered and reduced list of
-                    # angles according to the active bit patterns corresponding
-                    # to each angle value.
-                    angles = {}
-                    controls = self.complement(len(self.controls), missing_indexes)
-
-                    for k, v in groups.items():
-                        for bin_str in v:
-                            reduced_bin_str = \
-                                [
-                                    char for i, char in enumerate(bin_str[::-1]) if i in controls
-                                ][::-1]
-                            dontcares_indexes = \
-                                [
-                                    i for i, char in enumerate(reduced_bin_str) if char == '-'
-                                ]
-                            n_placeholders = len(dontcares_indexes)
-                            for i in range(2**n_placeholders):
-                                pattern = f'{i:0{n_placeholders}b}'
-                                for j, dontcare_index in enumerate(dontcares_indexes):
-                                    reduced_bin_str[dontcare_index] = pattern[j]
-                                angles["".join(reduced_bin_str)] = k - global_angle
-
-                    # Completes the positions of the missing bit patterns
-                    # (if any) with zeros.
-                    if len(angles) < 2**num_controls:
-                        for i in range(2**num_controls):
-                            bin_str = f'{i:0{num_controls}b}'
-                            if bin_str not in angles:
-                                angles[bin_str] = 0.0
-
-                    angles = dict(sorted(angles.items()))
-                    params = list(angles.values())
+                    # indexes, and assembles the reduced list of angles. As
+                    # the ignored bits are don't-cares in every implicant,
+                    # all the indexes mapped to the same reduced index belong
+                    # to the same group.
+                    indexes = np.arange(len(labels))
+                    reduced_indexes = np.zeros_like(indexes)
+                    for k, control in enumerate(controls):
+                        reduced_indexes |= ((indexes >> control) & 1) << k
+
+                    params = np.zeros(2**num_controls)
+                    params[reduced_indexes] = leaders[labels] - global_angle
+                    controls = [self.controls[i] for i in controls]
 
                 # `multiplexor` qubit index 0 is the target.
                 ucr = multiplexor(self.r_gate, params)
@@ -276,12 +321,15 @@ class Ucr(Gate):
 
             else:
                 # 'mcg'
-                for k, v in groups.items():
-                    gate_matrix = self.r_gate(k - global_angle).to_matrix()
-
-                    for bin_str in v:
-                        idx = indexes[bin_str]
-                        ctrl_state = ctrl_states[bin_str]
+                for leader, implicants in zip(leaders, groups):
+                    gate_matrix = self.r_gate(leader - global_angle).to_matrix()
+
+                    for value, mask in implicants:
+                        idx = [
+                            i for i in range(len(self.controls)) if not mask >> i & 1
+                        ]
+                        # Qiskit control states are read from the last control.
+                        ctrl_state = ''.join(str(value >> i & 1) for i in idx[::-1])
                         mcg = Mcg(
                             gate_matrix,
                             len(idx),
@@ -289,47 +337,35 @@ class Ucr(Gate):
                         )
                         circuit.compose(
                             mcg,
-                            [*self.controls[idx], *self.target],
+                            [*[self.controls[i] for i in idx], *self.target],
                             inplace=True
                         )
 
         return circuit
 
-    def _ctrl_states(self, groups):
-        indexes = {}
-        ctrl_states = {}
-
-        full_control_register = list(range(len(self.controls)))
+    @staticmethod
+    def _implicants(labels, num_groups, global_group, num_controls):
+        """
+        Minimized implicants (value, mask) of the indexes of each group. The
+        global group is left empty. A group with a single index is not
+        simplified (it is controlled by the full register).
+        """
+        order = np.argsort(labels, kind='stable')
+        bounds = np.cumsum(np.bincount(labels, minlength=num_groups))[:-1]
 
-        for value, binary_strings in groups.items():
-            if len(binary_strings) > 1:
-                groups[value] = simplify_logic(binary_strings)
-                for binary_string in groups[value]:
-                    indexes[binary_string], \
-                    ctrl_states[binary_string] = \
-                        self._ctrl_state(binary_string)
-            else:
-                # Note that zero binary strings does not produce a result, as
+        groups = []
+        for group, indexes in enumerate(np.split(order, bounds)):
+            if group == global_group:
+                # Note that zero implicants does not produce a result, as
                 # expected, possibly allowing separation of the multiplexor
                 # or reduction in the number of UCGs.
-                for binary_string in binary_strings:
-                    indexes[binary_string] = full_control_register
-                    ctrl_states[binary_string] = binary_string
-
-        return indexes, ctrl_states
+                groups.append([])
+            elif len(indexes) > 1:
+                groups.append(_minimize(set(indexes.tolist()), num_controls))
+            else:
+                groups.append([(int(indexes[0]), 0)])
 
-    @staticmethod
-    def _ctrl_state(binary_string):
-        indexes = []
-        ctrl_state = []
-        n = len(binary_string)
-        for i, b in enumerate(binary_string):
-            if b != '-':
-                # Indexes are inverted on Qiskit circuits.
-                indexes.append(n-i-1)
-                ctrl_state.append(b)
-        # Sorts indexes in ascending order.
-        return indexes[::-1], ''.join(ctrl_state)
+        return groups
 
     @staticmethod
     def complement(length, indexes):
@@ -340,108 +376,166 @@ class Ucr(Gate):
         return complement
 
     @staticmethod
-    def _search_separability(idx_list, num_controls):
+    def _group_angles(values):
         """
-        If `len(missing)>0`, the `multiplexor` is separable.
-        That is, it is possible to use `multiplexor` over a
-        reduced number of controls.
+        Groups the angles that are close (relative tolerance of 1e-7 to the
+        smallest angle of the group). Returns the smallest angle of each group,
+        in ascending order, and the group label of each index.
         """
-        def list_missing(n, lists):
-            all_numbers = set(num for lst in lists for num in lst)
-            full_range = set(range(n))
-            missing = full_range - all_numbers
-            return sorted(missing)
-
-        missing = list_missing(num_controls, list(idx_list.values()))
-        return missing
-
-    @staticmethod
-    def _group_binary_strings(values):
-        groups = {}
-
-        n = int(log2(len(values)))
-
-        original_groups = dict(
-            sorted(enumerate(values), key=lambda item: item[1])
-        )
-        last_value = float('inf')
-        for i, value in original_groups.items():
-            binary_string = f'{i:0{n}b}'
-
-            if np.isclose(value, last_value, atol=0.0, rtol=1e-07):
-                groups[last_value].append(binary_string)
-            else:
-                groups[value] = [binary_string]
-                last_value = value
+        values = np.asarray(values, dtype=float)
+        order = np.argsort(values, kind='stable')
+        sorted_values = values[order]
+
+        leaders = []
+        labels = np.empty(len(values), dtype=int)
+        start = 0
+        while start < len(values):
+            leader = sorted_values[start]
+            end = np.searchsorted(
+                sorted_values, leader + 1e-07 * abs(leader), side='right'
+            )
+            labels[order[start:end]] = len(leaders)
+            leaders.append(leader)
+            start = end
 
-        return groups
+        return np.array(leaders), labels
 
-def simplify_logic(binary_strings):
+def simplify_logic(binary_strings, max_terms=_SIMPLIFY_MAX_TERMS, max_time=None):
     """
-    Convert each binary string into a logical expression
-    expressions, sum (OR) the logical expressions, and
-    simplify the boolean expression using SymPy.
+    Sum (OR) the minterms represented by the binary strings and minimize
+    the resulting boolean expression. The product terms are returned as
+    strings where '-' marks a don't-care bit.
+
+    The prime implicants are found with the Quine-McCluskey method over
+    integer bitmasks and are selected with a greedy cover (essential prime
+    implicants first). If more than ``max_terms`` implicants are generated,
+    or if ``max_time`` is given and the minimization takes more than
+    ``max_time`` seconds, the binary strings are returned without
+    simplification. The time limit is opt-in, as it makes the result depend
+    on the machine speed and load.
     """
-    # Step 0: Nothing to do
+    # Nothing to do
     if len(binary_strings) <= 1:
         return binary_strings
 
-    # Step 1: Define the number of variables
     n = len(binary_strings[0])
+    minterms = {int(binary_string, 2) for binary_string in binary_strings}
+    implicants = _minimize(minterms, n, max_terms, max_time)
 
-    # Step 2: Create a vector of symbolic variables dynamically
-    variables = symbols(f'x0:{n}')
+    return [_pattern(value, mask, n) for value, mask in implicants]
 
-    # Step 3: Convert each binary string into a logical expression
-    def binary_string_to_expression(binary_str, variables):
-        terms = []
-        for i, bit in enumerate(binary_str):
-            if bit == '1':
-                # Add the variable directly for '1'
-                terms.append(variables[i])
-            else:
-                # Add the negation for '0'
-                terms.append(Not(variables[i]))
-        return And(*terms)  # Return the conjunction (AND) of terms
-
-    # Convert each binary string into a logical expression
-    expressions = [
-        binary_string_to_expression(bin_str, variables)
-        for bin_str in binary_strings
-    ]
-
-    # Step 4: Sum (OR) the logical expressions
-    summation_expr = Or(*expressions)
-
-    # Step 5: Simplify the Boolean expression using SymPy
-    simplified_expr = sp_simplify_logic(summation_expr, form='dnf', force=True, deep=False)
-
-    # Step 6: Convert the simplified expression back into binary strings
-    def expression_to_binary_strings(simplified_expr, variables):
-        binary_strings = []
-        dontcares = ['-'] * len(variables)
-
-        # Ensure we're working with a list of terms
-        terms = simplified_expr.args \
-            if not isinstance(simplified_expr, And) else [simplified_expr]
 
-        for term in terms:
-            binary_string = dontcares.copy()
+def _minimize(minterms, n, max_terms=_SIMPLIFY_MAX_TERMS, max_time=None):
+    """
+    Integer core of `simplify_logic`. Returns the implicants (value, mask)
+    sorted by their binary strings, or the minterms themselves (mask=0) if
+    the budget is exceeded.
+    """
+    deadline = inf if max_time is None else perf_counter() + max_time
 
-            # Ensure each term is iterable (a single variable might not be in a list)
-            literals = term.args if isinstance(term, And) else [term]
+    primes = _prime_implicants(minterms, n, max_terms, deadline)
+    cover = None if primes is None else _greedy_cover(primes, minterms, deadline)
+    if cover is None:
+        return [(minterm, 0) for minterm in sorted(minterms)]
 
-            for literal in literals:
-                variable = literal.args[0] if isinstance(literal, Not) else literal
-                idx = variables.index(variable)
-                binary_string[idx] = '0' if isinstance(literal, Not) else '1'
+    return sorted(cover, key=lambda implicant: _pattern(*implicant, n))
 
-            binary_strings.append("".join(binary_string))
 
-        return binary_strings
+def _prime_implicants(minterms, n, max_terms, deadline):
+    """
+    Quine-McCluskey merging. Implicants are (value, mask) pairs, where the
+    bits set in ``mask`` are don't-cares (and are zero in ``value``). Returns
+    None if the budget is exceeded.
+    """
+    primes = []
+    n_terms = len(minterms)
+    level = {0: minterms}
+    while level:
+        next_level = {}
+        for mask, values in level.items():
+            merged = set()
+            for i in range(n):
+                bit = 1 << i
+                if mask & bit:
+                    continue
+                pairs = {value for value in values if not value & bit and value | bit in values}
+                if pairs:
+                    next_level.setdefault(mask | bit, set()).update(pairs)
+                    merged.update(pairs)
+                    merged.update(value | bit for value in pairs)
+            primes.extend((value, mask) for value in values - merged)
+
+            if perf_counter() > deadline:
+                return None
+
+        n_terms += sum(len(values) for values in next_level.values())
+        if n_terms > max_terms:
+            return None
+        level = next_level
+
+    return primes
+
+
+def _greedy_cover(primes, minterms, deadline):
+    """
+    Selects the essential prime implicants and then, greedily, the one that
+    covers more uncovered minterms (with fewer literals on ties). Returns
+    None if the time budget is exceeded.
+    """
+    covers = [set(_expand(value, mask)) for value, mask in primes]
+
+    owners = {}
+    for i, cover in enumerate(covers):
+        for minterm in cover:
+            owners.setdefault(minterm, []).append(i)
+    selected = sorted({idx[0] for idx in owners.values() if len(idx) == 1})
+
+    uncovered = set(minterms)
+    for i in selected:
+        uncovered -= covers[i]
+
+    # Lazy greedy: the gains in the heap are upper bounds, as they only
+    # decrease when minterms are covered.
+    essential = set(selected)
+    heap = [
+        (-len(covers[i] & uncovered), -bin(mask).count("1"), i)
+        for i, (_, mask) in enumerate(primes)
+        if i not in essential
+    ]
+    heapify(heap)
+    while uncovered:
+        if perf_counter() > deadline:
+            return None
+        _, literals, i = heappop(heap)
+        gain = len(covers[i] & uncovered)
+        if gain == 0:
+            continue
+        if heap and (-gain, literals, i) > heap[0]:
+            heappush(heap, (-gain, literals, i))
+            continue
+        selected.append(i)
+        uncovered -= covers[i]
+
+    return [primes[i] for i in selected]
+
+
+def _expand(value, mask):
+    """
+    Minterms covered by the implicant (value, mask).
+    """
+    subset = mask
+    while True:
+        yield value | subset
+        if subset == 0:
+            break
+        subset = (subset - 1) & mask
 
-    # Step 7: Output the result
-    binary_strings_output = \
-        expression_to_binary_strings(simplified_expr, variables)
 
-    return binary_strings_output
+def _pattern(value, mask, n):
+    """
+    Binary string of the implicant (value, mask), with '-' on don't-cares.
+    The first character is the most significant bit.
+    """
+    return "".join(
+        "-" if mask >> i & 1 else str(value >> i & 1) for i in range(n - 1, -1, -1)
+    )
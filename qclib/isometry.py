@@ -17,18 +17,42 @@ Implements the decomposition of isometries using the methods
 defined at https://arxiv.org/abs/1501.06911.
 """
 
+from functools import lru_cache
 from math import log2
 import numpy as np
 import scipy
-import qiskit.quantum_info as qi
+from numpy.random import default_rng
 from qiskit import QuantumCircuit, QuantumRegister, transpile
 from qiskit.circuit.library import DiagonalGate
 from qiskit.circuit.library import UnitaryGate
 from qiskit.circuit.library import UCGate
+from qiskit.quantum_info import Operator
+from qclib.gates.mcg import Mcg, mcg_cnot_count
+from qclib.gates.ucg import Ucg
+from qclib.gates.util import u2_to_su2
 from qclib.unitary import unitary as decompose_unitary, cnot_count as unitary_cnot_count
-
-
-def decompose(isometry: np.ndarray, scheme="ccd"):
+from qclib.unitary import cnot_cost as unitary_cnot_cost
+from qclib.unitary import cnot_count_generic as unitary_cnot_count_generic
+from qclib.util import parallel_map
+
+# Amplitudes below this are treated as already cleared by the sparse CCD.
+_SPARSE_ATOL = 1e-12
+
+# Number of random vectors used by the orthonormality check, and the seed of
+# their generator (the check is deterministic for a given input).
+_PROBES = 2
+_PROBES_SEED = 7
+
+
+def decompose(
+    isometry: np.ndarray,
+    scheme="ccd",
+    sparse=False,
+    executor=None,
+    depth_weight=0.0,
+    trusted=False,
+    eig=None,
+):
     """
     Decompose an isometry from m to n qubits.
     In particular, it decomposes unitaries on n qubits (m=n) or prepare a
@@ -37,8 +61,31 @@ def decompose(isometry: np.ndarray, scheme="ccd"):
     Args:
         isometry (list): an isometry from m to n qubits (n>=2 and m<=n), i.e., a
             complex 2^n x 2^m array with orthonormal columns.
-        scheme (str): method to decompose the isometry ('knill', 'ccd', 'csd').
-            Default is scheme='ccd'.
+        scheme (str): method to decompose the isometry ('knill', 'ccd', 'csd',
+            'auto'). 'auto' evaluates the cost model of each scheme and
+            synthesizes the one that minimizes cnots + depth_weight * depth
+            (the CNOT count bounds the depth of 'ccd' and 'knill', which have
+            no depth model). The scheme used is reported in
+            circuit.metadata["scheme"]. Default is scheme='ccd'.
+        sparse (bool): if True, the 'ccd' scheme skips the single-qubit
+            gates whose amplitude pair is already cleared and drops the
+            controls the remaining gates do not depend on, emitting reduced
+            multiplexors or multicontrolled gates. Default is sparse=False.
+        executor (concurrent.futures.Executor): optional executor (usually a
+            ProcessPoolExecutor). With scheme='knill', the state preparations
+            of the eigenvectors are synthesized by it; with scheme='csd', it
+            is passed to the unitary decomposition. The output is identical
+            to the serial one.
+        depth_weight (float): weight of the CNOT depth against the CNOT
+            count for scheme='auto'. Default is depth_weight=0.0.
+        trusted (bool): if True, the columns are assumed to be orthonormal
+            (e.g. the output of an SVD) and only the shape is validated.
+            Default is trusted=False.
+        eig (tuple): eigendecomposition of the unitary extension used by
+            scheme='knill' and scheme='auto', as returned by
+            ``knill_eigendecomposition(isometry)``. It can be shared with
+            ``cnot_count`` to avoid computing it twice. If None, it is
+            computed when needed. Default is eig=None.
     Returns:
         QuantumCircuit: a quantum circuit with the isometry attached.
     Raises:
@@ -55,22 +102,68 @@ def decompose(isometry: np.ndarray, scheme="ccd"):
     log_lines = log2(lines)
     log_cols = log2(cols)
 
-    _check_isometry(iso, log_lines, log_cols)
+    _check_isometry(iso, log_lines, log_cols, trusted)
 
     log_lines = int(log_lines)
     log_cols = int(log_cols)
 
+    # Eigendecomposition used by Knill, shared by its cost and its synthesis.
+    if scheme == "auto":
+        if log_lines >= 2 and eig is None:
+            eig = _knill_eig(iso, log_lines, log_cols)
+        scheme = _auto_scheme(iso, log_lines, log_cols, sparse, depth_weight, eig)
+
     if scheme == "csd":
-        return _csd(iso, log_lines, log_cols)
+        circuit = _csd(iso, log_lines, log_cols, executor)
+    elif scheme == "ccd":
+        circuit = _ccd(iso, log_lines, log_cols, sparse)
+    else:
+        circuit = _knill(iso, log_lines, log_cols, executor, eig)
+
+    circuit.metadata = {**circuit.metadata, "scheme": scheme}
+
+    return circuit
+
+
+def _auto_scheme(iso, log_lines, log_cols, sparse=False, depth_weight=0.0, eig=None):
+    """
+    Scheme with the lowest modeled cost ``cnots + depth_weight * depth`` (the
+    first one on ties, in the order 'ccd', 'csd', 'knill').
+    """
+    costs = _scheme_costs(iso, log_lines, log_cols, sparse, eig)
+    return _cheapest_scheme(costs, depth_weight)
+
+
+def _cheapest_scheme(costs, depth_weight=0.0):
+    return min(costs, key=lambda scheme: costs[scheme][0] + depth_weight * costs[scheme][1])
+
 
-    if scheme == "ccd":
-        return _ccd(iso, log_lines, log_cols)
+def _scheme_costs(iso, log_lines, log_cols, sparse=False, eig=None):
+    """
+    Modeled ``(cnots, cnot depth)`` of each scheme. Only 'csd' has a depth
+    model; the CNOT count bounds the depth of the others. ``eig`` is the
+    output of ``_knill_eig``, computed if not given.
+    """
+    if sparse:
+        cnots = _cnot_count_estimate_ccd_sparse(iso.copy(), log_lines, log_cols)
+    else:
+        cnots = _cnot_count_estimate_ccd(log_lines, log_cols)
+    costs = {"ccd": (cnots, cnots)}
+
+    unitary_gate = _extend_to_unitary(iso, log_lines, log_cols)
+    costs["csd"] = unitary_cnot_cost(
+        unitary_gate, "qsd", iso=log_lines - log_cols, apply_a2=True
+    )
+
+    if log_lines >= 2:
+        cnots = _cnot_count_estimate_knill(iso, log_lines, log_cols, eig)
+        costs["knill"] = (cnots, cnots)
 
-    return _knill(iso, log_lines, log_cols)
+    return costs
 
 
 # General
-def _check_isometry(iso, log_lines, log_cols):
+def _check_isometry(iso, log_lines, log_cols, trusted=False):
     if not log_lines.is_integer() or log_lines < 0:
         raise ValueError(
             "The number of rows of the isometry is not a non negative power of 2."
@@ -81,35 +174,58 @@ def _check_isometry(iso, log_lines, log_cols):
         )
     if log_cols > log_lines:
         raise ValueError("The input matrix has more columns than rows.")
-    if not _is_isometry(iso, log_cols):
+    if not trusted and not _is_isometry(iso):
         raise ValueError("The input matrix has non orthonormal columns.")
 
 
-def _is_isometry(iso, log_cols):
-    identity = np.conj(iso.T).dot(iso)
-    return np.allclose(identity, np.eye(int(2**log_cols)))
+def _is_isometry(iso):
+    """
+    Randomized orthonormality test. ``iso^dagger iso x = x`` is checked for a
+    few random complex vectors ``x`` instead of building the Gram matrix, which
+    costs O(rows*cols) instead of O(rows*cols^2). The vectors are drawn from a
+    generator with a fixed seed, so the result only depends on ``iso``.
+
+    The entries are compared with the tolerance of ``np.allclose`` (``atol=1e-8``,
+    ``rtol=1e-5``, relative to the entries of ``x``). For an input whose
+    ``iso^dagger iso - I`` exceeds it, the test can only pass if the vectors
+    happen to lie (almost) in the kernel of that matrix, which happens with
+    negligible probability over the random draw. Inputs known to be orthonormal
+    can skip the test with ``decompose(..., trusted=True)``.
+    """
+    if iso.shape[1] <= _PROBES:
+        # The Gram matrix is not more expensive than the probes.
+        gram = np.conj(iso.T) @ iso
+        return np.allclose(gram, np.identity(iso.shape[1]))
+
+    rng = default_rng(_PROBES_SEED)
+    shape = (iso.shape[1], _PROBES)
+    probes = rng.standard_normal(size=shape) + 1j * rng.standard_normal(size=shape)
+    return np.allclose(np.conj(iso.T) @ (iso @ probes), probes)
 
 
 # Cosine-Sine
-def _csd(iso, log_lines, log_cols):
+def _csd(iso, log_lines, log_cols, executor=None):
     unitary_gate = _extend_to_unitary(iso, log_lines, log_cols)
 
     return decompose_unitary(
-        unitary_gate, decomposition="qsd", iso=log_lines - log_cols, apply_a2=True
+        unitary_gate,
+        decomposition="qsd",
+        iso=log_lines - log_cols,
+        apply_a2=True,
+        executor=executor,
     )
 
 
 #   Knill
-def _knill(iso, log_lines, log_cols):
+def _knill(iso, log_lines, log_cols, executor=None, eig=None):
     if log_lines < 2:
         raise ValueError(
             "Knill decomposition does not work on a 1 qubit isometry (N=2)."
         )
 
-    unitary = _extend_to_unitary(iso, log_lines, log_cols)
-
-    eigval, eigvec = np.linalg.eig(unitary)
-    arg = np.angle(eigval)
+    if eig is None:
+        eig = _knill_eig(iso, log_lines, log_cols)
+    arg, eigvec = eig
 
     reg = QuantumRegister(log_lines)
     circuit = QuantumCircuit(reg)
@@ -117,23 +233,62 @@ def _knill(iso, log_lines, log_cols):
     # pylint: disable=import-outside-toplevel
     from qclib.state_preparation import LowRankInitialize
 
-    for i in range(2**log_lines):
-        # The eigenvalues are not necessarily ordered.
-        if np.abs(arg[i]) > 10**-7:
-            state = eigvec[:, i]
-            gate = LowRankInitialize(state)
+    # The eigenvalues are not necessarily ordered.
+    indexes = [i for i in range(2**log_lines) if np.abs(arg[i]) > 10**-7]
+    # The state preparations are independent. They are synthesized first (by
+    # the executor, if any) and assembled in the order of the eigenvalues.
+    states = [eigvec[:, i] for i in indexes]
+    definitions = parallel_map(_knill_definition, states, executor)
+
+    for i, state, definition in zip(indexes, states, definitions):
+        gate = LowRankInitialize(state)
+        gate.definition = definition
 
-            circuit.compose(gate.inverse(), reg, inplace=True)
+        circuit.compose(gate.inverse(), reg, inplace=True)
 
-            circuit.x(list(range(log_lines)))
-            circuit.mcp(arg[i], list(range(log_lines - 1)), log_lines - 1)
-            circuit.x(list(range(log_lines)))
+        circuit.x(list(range(log_lines)))
+        circuit.mcp(arg[i], list(range(log_lines - 1)), log_lines - 1)
+        circuit.x(list(range(log_lines)))
 
-            circuit.compose(gate, reg, inplace=True)
+        circuit.compose(gate, reg, inplace=True)
 
     return circuit
 
 
+def _knill_definition(state):
+    # pylint: disable=import-outside-toplevel
+    from qclib.state_preparation import LowRankInitialize
+
+    return LowRankInitialize(state).definition
+
+
+def knill_eigendecomposition(isometry):
+    """
+    Eigenphases and eigenvectors of the unitary extension of the isometry
+    used by the Knill scheme. The result can be passed as ``eig`` to
+    ``decompose`` and ``cnot_count``, so that the eigendecomposition is
+    computed once for both.
+    """
+    iso = isometry.astype(complex)
+    if len(iso.shape) == 1:
+        iso = iso.reshape(iso.shape[0], 1)
+
+    return _knill_eig(iso, int(log2(iso.shape[0])), int(log2(iso.shape[1])))
+
+
+def _knill_eig(iso, log_lines, log_cols):
+    """
+    Eigenphases and eigenvectors of the unitary extension of ``iso``. Within a
+    call of ``decompose`` or ``cnot_count``, they are computed once (unless
+    given) and passed to the cost model and to the synthesis.
+    """
+    unitary = _extend_to_unitary(iso, log_lines, log_cols)
+
+    eigval, eigvec = np.linalg.eig(unitary)
+
+    return np.angle(eigval), eigvec
+
+
 def _extend_to_unitary(iso, log_lines, log_cols):
     if log_lines == log_cols:
         # The isometry v is already unitary.
@@ -158,12 +313,12 @@ def _extend_to_unitary(iso, log_lines, log_cols):
 
 
 # Column-by-column
-def _ccd(iso, log_lines, log_cols):
+def _ccd(iso, log_lines, log_cols, sparse=False):
     reg = QuantumRegister(log_lines)
     circuit = QuantumCircuit(reg)
 
     for k in range(2**log_cols):  # iteration through columns.
-        g_k = _g_k(iso, log_lines, k)
+        g_k = _g_k(iso, log_lines, k, sparse)
         g_k.name = "G" + str(k)
 
         circuit.append(g_k.to_instruction(), reg)
@@ -179,7 +334,7 @@ def _ccd(iso, log_lines, log_cols):
     return circuit.inverse()
 
 
-def _g_k(iso, log_lines, col_index):
+def _g_k(iso, log_lines, col_index, sparse=False):
     # Gate G columns index k, to be created. Binary representation of column index k.
     # G_k's subgate bit index i (s in the paper).
     g_k = QuantumCircuit(log_lines)
@@ -193,9 +348,11 @@ def _g_k(iso, log_lines, col_index):
             # Condition defined in the first paragraph of the
             # second column on page 16. Generates single-qubit gate
             # matrix for the multicontrolled operation.
-            unitary = _mc_unitary(iso, col_index, i)
+            unitary = _mc_unitary(iso, col_index, i, sparse)
 
-            mcg = _mc_gate(unitary, log_lines, control + ancilla, target, k_bin)
+            mcg = _mc_gate(
+                unitary, log_lines, control + ancilla, target, k_bin, sparse
+            )
             mcg = mcg.reverse_bits()  # Qiskit little-endian.
             _update_isometry(iso, mcg)
 
@@ -203,8 +360,8 @@ def _g_k(iso, log_lines, col_index):
             g_k.compose(mcg, list(range(log_lines)), inplace=True)
 
         # Generates single-qubit gates matrices for the uniformly controlled operation.
-        unitaries = _uc_unitaries(iso, log_lines, col_index, i)
-        ucg = _uc_gate(unitaries, log_lines, control, target)
+        unitaries = _uc_unitaries(iso, log_lines, col_index, i, sparse)
+        ucg = _uc_gate(unitaries, log_lines, control, target, sparse)
         ucg = ucg.reverse_bits()  # Qiskit little-endian.
         _update_isometry(iso, ucg)
 
@@ -213,9 +370,7 @@ def _g_k(iso, log_lines, col_index):
     return g_k
 
 
-def _mc_gate(unitary, n_qubits, control, target, k_bin):
-    gate = QuantumCircuit(n_qubits)
-
+def _mc_gate(unitary, n_qubits, control, target, k_bin, sparse=False):
     controls = []
     for i in control:
         if k_bin[i] == "1":
@@ -223,18 +378,19 @@ def _mc_gate(unitary, n_qubits, control, target, k_bin):
 
     unitaries = [np.identity(2) for _ in range(2 ** len(controls))]
     unitaries[-1] = unitary
-    ucg = UCGate(unitaries, up_to_diagonal=True)
-    gate.append(ucg, [target] + controls[::-1])
 
-    return gate
+    return _uc_gate(unitaries, n_qubits, controls, target, sparse)
+
 
+def _uc_gate(unitaries, n_qubits, control, target, sparse=False):
+    if sparse:
+        return _sparse_uc_gate(unitaries, n_qubits, control, target)
 
-def _uc_gate(unitaries, n_qubits, control, target):
     gate = QuantumCircuit(n_qubits)
 
     if len(control) > 0:
         # "control" is reversed due to UCGate implementation.
-        uc_gate = UCGate(unitaries, up_to_diagonal=True)
+        uc_gate = UCGate(list(unitaries), up_to_diagonal=True)
         gate.append(uc_gate, [target] + control[::-1])
     else:
         # UCGate does not work with target only.
@@ -244,13 +400,128 @@ def _uc_gate(unitaries, n_qubits, control, target):
     return gate
 
 
-def _update_isometry(iso, gate):
-    # "gate" matrix representation. Updates isometry.
-    gate_matrix = qi.Operator(gate).data
-    iso[:, :] = gate_matrix @ iso
+def _simplify_controls(unitaries, control):
+    # Removes the controls the blocks do not depend on. Returns the remaining
+    # blocks, shape (2^k, 2, 2), and controls.
+    # Axis "j" of "blocks" is selected by control[j] ("control" is reversed
+    # in the Ucg qubit list).
+    control = list(control)
+    blocks = np.asarray(unitaries).reshape((2,) * len(control) + (2, 2))
+    for j in reversed(range(len(control))):
+        block_0 = np.take(blocks, 0, axis=j)
+        if np.allclose(block_0, np.take(blocks, 1, axis=j), rtol=0, atol=_SPARSE_ATOL):
+            blocks = block_0
+            del control[j]
+
+    return blocks.reshape(-1, 2, 2), control
+
+
+def _sparse_uc_gate(unitaries, n_qubits, control, target):
+    # Same multiplexor as "_uc_gate", without its identity blocks and the
+    # controls the blocks do not depend on. The remaining blocks are emitted
+    # as a UCG or, when cheaper, as one multicontrolled gate per block.
+    gate = QuantumCircuit(n_qubits)
+
+    blocks, control = _simplify_controls(unitaries, control)
+    active = [
+        index
+        for index, block in enumerate(blocks)
+        if not np.allclose(block, np.identity(2), rtol=0, atol=_SPARSE_ATOL)
+    ]
+    if not active:
+        return gate
+
+    n_controls = len(control)
+    if n_controls == 0:
+        gate.append(UnitaryGate(blocks[0]), [target])
+    elif len(active) * mcg_cnot_count(n_controls) < 2**n_controls - 1:
+        # Only the zeroed amplitude matters, so each block may be replaced by
+        # its SU(2) version, which has the cheaper decomposition.
+        for index in active:
+            su_2, _ = u2_to_su2(blocks[index])
+            mcg = Mcg(su_2, n_controls, ctrl_state=f"{index:0{n_controls}b}")
+            gate.append(mcg, control[::-1] + [target])
+    else:
+        ucg = Ucg(blocks, up_to_diagonal=True)
+        gate.append(ucg, [target] + control[::-1])
+
+    return gate
 
 
-def _mc_unitary(iso, col_index, bit_index):
+def _update_isometry(iso, gate):
+    # Applies the uniformly controlled gates held by the circuit "gate"
+    # directly to the rows of "iso", without building its 2^n x 2^n matrix.
+    for instruction in gate.data:
+        operation = instruction.operation
+        qubits = [gate.find_bit(qubit).index for qubit in instruction.qubits]
+        if isinstance(operation, Mcg):
+            # Exact multicontrolled gate: a multiplexor with a single block.
+            target, controls = qubits[-1], qubits[:-1]
+            index = int(operation.ctrl_state, 2)
+            unitaries = np.array([np.identity(2)] * 2 ** len(controls), dtype=complex)
+            unitaries[index] = operation.unitary
+            _apply_multiplexor(iso, unitaries, target, controls)
+        elif isinstance(operation, Ucg):
+            diagonal = operation.diagonal() if operation.up_to_diagonal else None
+            _apply_multiplexor(iso, operation.unitaries, qubits[0], qubits[1:], diagonal)
+        elif isinstance(operation, UCGate):
+            _apply_multiplexor(iso, _ucgate_blocks(operation), qubits[0], qubits[1:])
+        else:
+            _apply_multiplexor(iso, np.asarray(operation.params), qubits[0], qubits[1:])
+
+
+def _ucgate_blocks(operation):
+    # Blocks of the multiplexor implemented by the definition of a UCGate,
+    # which leaves a diagonal when built with up_to_diagonal=True. The
+    # definition holds single-qubit gates on the target (qubit 0) and CNOTs
+    # from the controls to the target, so the blocks are multiplied in a batch.
+    definition = operation.definition
+    select = np.arange(2 ** (operation.num_qubits - 1))
+    blocks = np.empty((select.shape[0], 2, 2), dtype=complex)
+    blocks[:] = np.identity(2)
+    for instruction in definition.data:
+        qubits = [definition.find_bit(qubit).index for qubit in instruction.qubits]
+        if qubits == [0]:
+            blocks = instruction.operation.to_matrix() @ blocks
+        elif instruction.operation.name == "cx" and qubits[1] == 0:
+            flip = ((select >> (qubits[0] - 1)) & 1) == 1
+            blocks[flip] = blocks[flip][:, ::-1]
+        else:
+            # Unexpected definition: reads the blocks off its operator.
+            matrix = Operator(operation).data
+            return np.array([matrix[2 * i : 2 * i + 2, 2 * i : 2 * i + 2] for i in select])
+
+    return blocks * np.exp(1j * definition.global_phase)
+
+
+def _apply_multiplexor(iso, unitaries, target, controls, diagonal=None):
+    # The 2x2 blocks are multiplied in a batch over the row pairs differing
+    # only in the target bit, so each update costs O(2^n * cols).
+    rows = np.arange(iso.shape[0] // 2)
+    # Row indices with the target bit cleared, paired with the target bit set.
+    low = rows & ((1 << target) - 1)
+    rows0 = ((rows - low) << 1) | low
+    rows1 = rows0 | (1 << target)
+
+    # Index of each pair in the multiplexor, over all of its controls.
+    select = np.zeros(rows0.shape[0], dtype=int)
+    for i, control in enumerate(controls):
+        select |= ((rows0 >> control) & 1) << i
+
+    pairs = np.stack((iso[rows0], iso[rows1]), axis=1)  # (pairs, 2, cols)
+    pairs = unitaries[select] @ pairs
+    iso[rows0] = pairs[:, 0]
+    iso[rows1] = pairs[:, 1]
+
+    if diagonal is not None:
+        # Ucg(up_to_diagonal=True) implements the multiplexor followed by
+        # the inverse of its diagonal, indexed as (controls..., target).
+        diagonal = np.conj(diagonal)
+        iso[rows0] *= diagonal[2 * select][:, None]
+        iso[rows1] *= diagonal[2 * select + 1][:, None]
+
+
+def _mc_unitary(iso, col_index, bit_index, sparse=False):
     col = iso[:, col_index]
     idx1 = 2 * _a(col_index, bit_index + 1) * 2**bit_index + _b(
         col_index, bit_index + 1
@@ -259,49 +530,53 @@ def _mc_unitary(iso, col_index, bit_index):
         col_index, bit_index + 1
     )
 
-    return _unitary([[col[idx1]], [col[idx2]]], basis=0)
+    return _unitaries(col[[[idx1, idx2]]], basis=0, sparse=sparse)[0]
 
 
-def _uc_unitaries(iso, n_qubits, col_index, bit_index):
+def _uc_unitaries(iso, n_qubits, col_index, bit_index, sparse=False):
     start = _a(col_index, bit_index + 1) + 1
     if _b(col_index, bit_index + 1) == 0:
         start -= 1
 
-    gates = []
-    for i in range(start):
-        gates.append(np.identity(2))
-
+    # Amplitude pairs (idx1, idx2) of every control state, strided by 2^(s+1).
     col = iso[:, col_index]
-    for i in range(start, 2 ** (n_qubits - bit_index - 1)):
-        idx1 = 2 * i * 2**bit_index + _b(col_index, bit_index)
-        idx2 = (2 * i + 1) * 2**bit_index + _b(col_index, bit_index)
-
-        gates.append(
-            _unitary([[col[idx1]], [col[idx2]]], basis=_k_s(col_index, bit_index))
-        )
+    idx1 = 2 * np.arange(start, 2 ** (n_qubits - bit_index - 1)) * 2**bit_index
+    idx1 += _b(col_index, bit_index)
+    pairs = np.stack((col[idx1], col[idx1 + 2**bit_index]), axis=1)
+
+    gates = np.empty((2 ** (n_qubits - bit_index - 1), 2, 2), dtype=complex)
+    gates[:start] = np.identity(2)
+    gates[start:] = _unitaries(
+        pairs, basis=_k_s(col_index, bit_index), sparse=sparse
+    )
 
     return gates
 
 
-def _unitary(iso, basis=0):  # Lemma2 of https://arxiv.org/abs/1501.06911
-    iden = np.identity(2)
-    iso_norm = np.linalg.norm(iso, axis=0)[0]
-
-    if iso_norm != 0.0:
-        psi = iso / iso_norm
-
-        psi_dagger = np.conj(psi.T)
-
-        phi = -psi_dagger.dot(iden[:, [1]]) * iden[:, [0]]
-        phi = phi + psi_dagger.dot(iden[:, [0]]) * iden[:, [1]]
-        phi_dagger = np.conj(phi.T)
+def _unitaries(pairs, basis=0, sparse=False):
+    """
+    Vectorized Lemma 2 of https://arxiv.org/abs/1501.06911: for each
+    amplitude pair in ``pairs`` (shape (k, 2)), the 2x2 unitary mapping the
+    normalized pair onto ``|basis>``. Returns an array of shape (k, 2, 2);
+    null pairs give the identity, as do the pairs already on ``|basis>`` if
+    ``sparse`` is True.
+    """
+    pairs = np.asarray(pairs, dtype=complex)
+    norms = np.linalg.norm(pairs, axis=1)
 
-        unitary = np.kron(iden[:, [basis]], psi_dagger)
-        unitary = unitary + np.kron(iden[:, [-(basis + 1)]], phi_dagger)
+    unitaries = np.empty((pairs.shape[0], 2, 2), dtype=complex)
+    unitaries[:] = np.identity(2)
 
-        return unitary
+    nonzero = norms != 0.0
+    if sparse:
+        nonzero &= np.abs(pairs[:, 1 - basis]) > _SPARSE_ATOL
+    psi = pairs[nonzero] / norms[nonzero, None]
+    # Row "basis" is psi^dagger, the other row is its orthogonal complement.
+    unitaries[nonzero, basis] = np.conj(psi)
+    unitaries[nonzero, 1 - basis, 0] = -psi[:, 1]
+    unitaries[nonzero, 1 - basis, 1] = psi[:, 0]
 
-    return iden
+    return unitaries
 
 
 def _a(col_index, bit_index):  # col_index >> bit_index.
@@ -323,15 +598,16 @@ def _k_s(col_index, bit_index):
     return (col_index & 2**bit_index) // 2**bit_index
 
 
-def cnot_count(isometry, scheme="ccd", method="estimate"):
+def cnot_count(isometry, scheme="ccd", method="estimate", sparse=False, eig=None):
     """
-    Count the number of CNOTs to decompose the isometry.
+    Count the number of CNOTs to decompose the isometry. ``eig`` is the
+    optional output of ``knill_eigendecomposition`` (see ``decompose``).
     """
     if method == "estimate":
-        return _cnot_count_estimate(isometry, scheme)
+        return _cnot_count_estimate(isometry, scheme, sparse, eig)
 
     # Exact count
-    circuit = decompose(isometry, scheme)
+    circuit = decompose(isometry, scheme, sparse, eig=eig)
     transpiled_circuit = transpile(
         circuit, basis_gates=["u", "cx"], optimization_level=0
     )
@@ -342,7 +618,7 @@ def cnot_count(isometry, scheme="ccd", method="estimate"):
     return 0
 
 
-def _cnot_count_estimate(isometry, scheme="ccd"):
+def _cnot_count_estimate(isometry, scheme="ccd", sparse=False, eig=None):
     """
     Estimate the number of CNOTs to decompose the isometry.
     """
@@ -353,13 +629,20 @@ def _cnot_count_estimate(isometry, scheme="ccd"):
     log_lines = int(log2(iso.shape[0]))
     log_cols = int(log2(iso.shape[1]))
 
+    if scheme == "auto":
+        costs = _scheme_costs(iso, log_lines, log_cols, sparse, eig)
+        return costs[_cheapest_scheme(costs)][0]
+
     if scheme == "knill":
-        return _cnot_count_estimate_knill(isometry, log_lines, log_cols)
+        return _cnot_count_estimate_knill(iso, log_lines, log_cols, eig)
 
     if scheme == "csd":
-        return _cnot_count_estimate_csd(isometry, log_lines, log_cols)
+        return _cnot_count_estimate_csd(iso, log_lines, log_cols)
 
     # CCD
+    if sparse:
+        return _cnot_count_estimate_ccd_sparse(iso, log_lines, log_cols)
+
     return _cnot_count_estimate_ccd(log_lines, log_cols)
 
 
@@ -371,14 +654,13 @@ def _cnot_count_estimate_csd(iso, log_lines, log_cols):
     )
 
 
-def _cnot_count_estimate_knill(iso, log_lines, log_cols):
+def _cnot_count_estimate_knill(iso, log_lines, log_cols, eig=None):
     """
     Estimate the number of CNOTs to decompose the isometry using Knill.
     """
-    unitary = _extend_to_unitary(iso, log_lines, log_cols)
-
-    eigval, eigvec = np.linalg.eig(unitary)
-    arg = np.angle(eigval)
+    if eig is None:
+        eig = _knill_eig(iso, log_lines, log_cols)
+    arg, eigvec = eig
 
     # pylint: disable=import-outside-toplevel
     from qclib.state_preparation.lowrank import cnot_count as schmidt_cnot_count
@@ -388,21 +670,51 @@ def _cnot_count_estimate_knill(iso, log_lines, log_cols):
         if np.abs(arg[i]) > 10**-7:
             state = eigvec[:, i]
 
-            # Two times Schmidt state preparation
-            cnots += 2 * schmidt_cnot_count(state)
+            # Two times Schmidt state preparation, estimated from the Schmidt
+            # coefficients of the eigenvector only.
+            cnots += 2 * schmidt_cnot_count(state, method="spectrum")
 
             # MCP
-            circuit = QuantumCircuit(log_lines)
-            circuit.mcp(3.0, list(range(log_lines - 1)), log_lines - 1)
-            transpiled_circuit = transpile(
-                circuit, basis_gates=["u", "cx"], optimization_level=0
-            )
-            if "cx" in transpiled_circuit.count_ops():
-                cnots += transpiled_circuit.count_ops()["cx"]
+            cnots += _mcp_cnots(log_lines)
 
     return cnots
 
 
+@lru_cache(maxsize=None)
+def _mcp_cnots(n_qubits):
+    # Number of CNOTs of the multicontrolled phase used by Knill.
+    circuit = QuantumCircuit(n_qubits)
+    circuit.mcp(3.0, list(range(n_qubits - 1)), n_qubits - 1)
+    transpiled_circuit = transpile(
+        circuit, basis_gates=["u", "cx"], optimization_level=0
+    )
+    return transpiled_circuit.count_ops().get("cx", 0)
+
+
+@lru_cache(maxsize=None)
+def cnot_count_generic(log_lines, log_cols, scheme="ccd"):
+    """
+    Estimate the number of CNOTs to decompose a generic isometry, from its
+    shape only.
+    """
+    if scheme == "auto":
+        schemes = ["ccd", "csd"] + (["knill"] if log_lines >= 2 else [])
+        return min(cnot_count_generic(log_lines, log_cols, sch) for sch in schemes)
+
+    if scheme == "knill":
+        # pylint: disable=import-outside-toplevel
+        from qclib.state_preparation.lowrank import cnot_count_generic as state_cnot_count
+
+        # Eigenvectors with a non-trivial phase in the unitary extension.
+        n_eigvec = min(2**log_lines, 2 ** (log_cols + 1))
+        return n_eigvec * (2 * state_cnot_count(log_lines) + _mcp_cnots(log_lines))
+
+    if scheme == "csd":
+        return unitary_cnot_count_generic(log_lines, "qsd", log_lines - log_cols, True)
+
+    return _cnot_count_estimate_ccd(log_lines, log_cols)
+
+
 def _cnot_count_estimate_ccd(log_lines, log_cols):
     """
     Estimate the number of CNOTs to decompose the isometry using CCD.
@@ -430,3 +742,27 @@ def _cnot_count_estimate_ccd(log_lines, log_cols):
         cnots += 2**log_cols - 2
 
     return cnots
+
+
+def _cnot_count_estimate_ccd_sparse(iso, log_lines, log_cols):
+    """
+    Estimate the number of CNOTs to decompose the isometry using the
+    sparsity-aware CCD. The reduced gates depend on the isometry, so the
+    column updates are carried out (without transpiling the gates).
+    """
+    cnots = 0
+    for k in range(2**log_cols):
+        g_k = _g_k(iso, log_lines, k, sparse=True)
+        for instruction in g_k.data:
+            operation = instruction.operation
+            if isinstance(operation, Mcg):
+                cnots += mcg_cnot_count(operation.num_qubits - 1)
+            elif isinstance(operation, Ucg):
+                # UCG up to a diagonal.
+                cnots += 2 ** (operation.num_qubits - 1) - 1
+
+    # Diagonal
+    if log_cols > 0:
+        cnots += 2**log_cols - 2
+
+    return cnots
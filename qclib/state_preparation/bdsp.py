@@ -23,12 +23,18 @@ from qiskit import QuantumCircuit
 
 from qclib.gates.initialize import Initialize
 from qclib.state_preparation.util.state_tree_preparation import (
-    Amplitude,
-    state_decomposition,
+    state_decomposition_array,
+)
+from qclib.state_preparation.util.angle_tree_preparation import (
+    create_angles_tree_array,
+    prune_angles_tree_array,
+)
+from qclib.state_preparation.util.tree_register import add_register_array
+from qclib.state_preparation.util.tree_walk import (
+    top_down_array,
+    top_down_pruned,
+    bottom_up_array,
 )
-from qclib.state_preparation.util.angle_tree_preparation import create_angles_tree
-from qclib.state_preparation.util.tree_register import add_register
-from qclib.state_preparation.util.tree_walk import top_down, bottom_up
 
 
 class BdspInitialize(Initialize):
@@ -47,19 +53,49 @@ class BdspInitialize(Initialize):
             A unit vector representing a quantum state.
             Values are amplitudes.
 
-        opt_params: {'split': split}
-            split: int
+        opt_params: {'split': split, 'max_qubits': max_qubits, 'max_depth': max_depth,
+                     'max_fidelity_loss': max_fidelity_loss}
+            split: int or str
                 Level (enumerated from bottom to top, where 1 ≤ s ≤ n)
                 at which the angle tree is split.
+                ``split='auto'`` selects the level with ``cost_model``,
+                without building candidate circuits (see ``auto_split``).
                 Default value is ``ceil(n_qubits/2)`` (sublinear).
+            max_qubits: int
+                Qubit budget for ``split='auto'``.
+                Default is ``max_qubits=None`` (no budget).
+            max_depth: int
+                CNOT depth target for ``split='auto'``.
+                Default is ``max_depth=None`` (no target).
+            max_fidelity_loss: float
+                Allowed fidelity error between the states prepared by the
+                approximated and the exact circuits, ancillae included
+                (0<=``max_fidelity_loss``<=1). If ``max_fidelity_loss`` is not in the
+                valid range, it will be ignored.
+                The angles with the smallest fidelity contribution are rounded (to zero,
+                or RY angles below the split level to pi). Zeroed RY angles above the
+                split level skip their CSWAPs. The multiplexors whose angles all vanish
+                are dropped, and the sparse ones are replaced by multicontrolled
+                rotations. The exact fidelity loss is stored in the
+                ``'fidelity_loss'`` entry of the definition's metadata.
+                Default is ``max_fidelity_loss=0.0``.
         """
         if opt_params is None:
+            opt_params = {}
+
+        self.max_fidelity_loss = opt_params.get("max_fidelity_loss")
+        if self.max_fidelity_loss is None or not 0 <= self.max_fidelity_loss <= 1:
+            self.max_fidelity_loss = 0.0
+
+        self.split = opt_params.get("split")
+        if self.split is None:
             self.split = int(ceil(log2(len(params)) / 2))  # sublinear
-        else:
-            if opt_params.get("split") is None:
-                self.split = int(ceil(log2(len(params)) / 2))  # sublinear
-            else:
-                self.split = opt_params.get("split")
+        elif self.split == "auto":
+            self.split = auto_split(
+                int(log2(len(params))),
+                max_qubits=opt_params.get("max_qubits"),
+                max_depth=opt_params.get("max_depth"),
+            )
 
         self._name = "bdsp"
         self._get_num_qubits(params)
@@ -74,16 +110,23 @@ class BdspInitialize(Initialize):
 
     def _define_initialize(self):
         n_qubits = int(np.log2(len(self.params)))
-        data = [Amplitude(i, a) for i, a in enumerate(self.params)]
-
-        state_tree = state_decomposition(n_qubits, data)
-        angle_tree = create_angles_tree(state_tree)
+        mag, arg = state_decomposition_array(n_qubits, self.params)
+        angle_tree = create_angles_tree_array(mag, arg)
+        start_level = n_qubits - self.split
 
         circuit = QuantumCircuit()
-        add_register(circuit, angle_tree, n_qubits - self.split)
+        if self.max_fidelity_loss > 0.0:
+            angle_tree, fidelity_loss = prune_angles_tree_array(
+                angle_tree, start_level, self.max_fidelity_loss
+            )
+            add_register_array(circuit, angle_tree, start_level)
+            top_down_pruned(angle_tree, circuit, start_level)
+            circuit.metadata = {"fidelity_loss": fidelity_loss}
+        else:
+            add_register_array(circuit, angle_tree, start_level)
+            top_down_array(angle_tree, circuit, start_level)
 
-        top_down(angle_tree, circuit, n_qubits - self.split)
-        bottom_up(angle_tree, circuit, n_qubits - self.split)
+        bottom_up_array(angle_tree, circuit, start_level)
 
         return circuit
 
@@ -105,3 +148,95 @@ class BdspInitialize(Initialize):
             )
         else:
             q_circuit.append(BdspInitialize(state, opt_params=opt_params), qubits)
+
+
+def cost_model(n_qubits, split):
+    """
+    Analytic cost of the BDSP circuit of a generic ``n_qubits`` state.
+
+    Parameters
+    ----------
+    n_qubits: int
+        Number of qubits of the state.
+
+    split: int
+        Level at which the angle tree is split (1 ≤ split ≤ n_qubits).
+
+    Returns
+    -------
+    (qubits, cnots, depth): (int, int, int)
+        Width, CNOT count and CNOT depth of the circuit transpiled to
+        ``['u', 'cx']`` (CSWAP gates cost 8 CNOTs). States with zero angles
+        (e.g. real or sparse states) need fewer CNOTs.
+    """
+    start_level = n_qubits - split
+    qubits = (split + 1) * 2**start_level - 1
+
+    # Each subtree is a top-down circuit of ``split`` qubits whose level ``k``
+    # has one RY and one RZ multiplexor with ``2**k`` CNOTs each, two of them
+    # cancelling between the pair.
+    top_down = 2 ** (split + 1) - 2 * split - 2
+
+    # Nodes above ``start_level`` swap their subtrees with a chain of
+    # ``n_qubits-1-level`` CSWAPs sharing the node qubit as control. Chains of
+    # the same level run in parallel. A CSWAP is a sequence of 8 CNOTs whose
+    # control is used by the 3rd to the 7th, so the CSWAPs of a chain start 5
+    # layers apart. Every chain starts one layer before the end of the
+    # previous one (its first CSWAP targets the previous control), adding
+    # ``5 * length + 2`` layers. The first chain overlaps the top-down part.
+    chains = range(split, n_qubits)
+    cnots = 2**start_level * top_down + 8 * sum(
+        2 ** (n_qubits - 1 - length) * length for length in chains
+    )
+    depth = top_down + sum(
+        _first_chain_depth(length) if length == split else 5 * length + 2
+        for length in chains
+    )
+
+    return qubits, cnots, depth
+
+
+def _first_chain_depth(length):
+    """
+    Layers added by the first CSWAP chain after the top-down part. The CSWAP
+    followed by ``i >= 1`` others in the chain targets the qubits that the
+    last top-down multiplexors, whose CNOTs follow the Gray code, release
+    ``2**(i-1) - 1`` layers before their end. Therefore, the last CSWAP
+    starts ``max(5 * i + 1 - 2**(i-1))`` layers after the top-down part (or
+    right at its end). The maximum is reached at ``i=4``, so the depth is
+    constant from ``length=5`` onwards.
+    """
+    start = max([0] + [5 * i + 1 - 2 ** (i - 1) for i in range(1, length)])
+    return start + 8
+
+
+def auto_split(n_qubits, max_qubits=None, max_depth=None):
+    """
+    Split level selected by ``cost_model``.
+
+    With ``max_qubits``, the shallowest circuit within the qubit budget. With
+    ``max_depth``, the narrowest circuit within the depth target. With both,
+    the shallowest circuit satisfying both. With neither, the circuit that
+    minimizes ``qubits * depth``. Ties are resolved in favor of fewer CNOTs.
+    """
+    costs = {split: cost_model(n_qubits, split) for split in range(1, n_qubits + 1)}
+
+    feasible = [
+        split
+        for split, (qubits, _, depth) in costs.items()
+        if (max_qubits is None or qubits <= max_qubits)
+        and (max_depth is None or depth <= max_depth)
+    ]
+    if not feasible:
+        raise ValueError(
+            f"No split of a {n_qubits}-qubit state satisfies "
+            f"max_qubits={max_qubits} and max_depth={max_depth}."
+        )
+
+    if max_qubits is None and max_depth is not None:
+        return min(feasible, key=lambda split: (costs[split][0], costs[split][1]))
+    if max_qubits is not None or max_depth is not None:
+        return min(feasible, key=lambda split: (costs[split][2], costs[split][1]))
+    return min(
+        feasible, key=lambda split: (costs[split][0] * costs[split][2], costs[split][1])
+    )
@@ -23,12 +23,13 @@ from qiskit import QuantumCircuit
 
 from qclib.gates.initialize import Initialize
 from qclib.state_preparation.util.state_tree_preparation import (
-    Amplitude,
-    state_decomposition,
+    state_decomposition_array,
 )
-from qclib.state_preparation.util.angle_tree_preparation import create_angles_tree
-from qclib.state_preparation.util.tree_register import add_register
-from qclib.state_preparation.util.tree_walk import bottom_up
+from qclib.state_preparation.util.angle_tree_preparation import (
+    create_angles_tree_array,
+)
+from qclib.state_preparation.util.tree_register import add_register_array
+from qclib.state_preparation.util.tree_walk import bottom_up_array
 
 
 class DcspInitialize(Initialize):
@@ -61,15 +62,13 @@ class DcspInitialize(Initialize):
 
     def _define_initialize(self):
         n_qubits = int(log2(len(self.params)))
-        data = [Amplitude(i, a) for i, a in enumerate(self.params)]
-
-        state_tree = state_decomposition(n_qubits, data)
-        angle_tree = create_angles_tree(state_tree)
+        mag, arg = state_decomposition_array(n_qubits, self.params)
+        angle_tree = create_angles_tree_array(mag, arg)
 
         circuit = QuantumCircuit()
-        add_register(circuit, angle_tree, n_qubits - 1)
+        add_register_array(circuit, angle_tree, n_qubits - 1)
 
-        bottom_up(angle_tree, circuit, n_qubits)
+        bottom_up_array(angle_tree, circuit, n_qubits)
 
         return circuit
 
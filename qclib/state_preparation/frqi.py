@@ -17,12 +17,15 @@ Implements the state preparation
 defined at https://link.springer.com/article/10.1007/s11128-010-0177-y
 """
 
+from functools import lru_cache
 from math import log2, pi
 
 import numpy as np
 from qiskit import QuantumCircuit, QuantumRegister
+from qiskit.circuit.library import RYGate
 from qclib.gates.initialize import Initialize
 from qclib.gates import Ucr
+from qclib.gates.ucr import multiplexor_angles, multiplexor_template
 
 # pylint: disable=maybe-no-member
 
@@ -171,3 +174,77 @@ class FrqiInitialize(Initialize):
                 ).definition,
                 qubits
             )
+
+    @staticmethod
+    def encode_batch(images, opt_params=None, stream=False):
+        """
+        Builds the FRQI circuits of a batch of images of the same size.
+
+        With ``simplify=False`` (and a method other than ``'mcg'``), the
+        layout of the circuit depends only on the image size. The multiplexor
+        is then built once as a parameterized circuit, the angles of all the
+        images are computed as a batch, and each circuit is obtained by
+        parameter assignment. Rotations by zero are kept, so the circuits are
+        equivalent, but not always identical, to
+        ``FrqiInitialize(image, opt_params).definition``. Otherwise, the
+        circuits are built one by one.
+
+        Parameters
+        ----------
+        images: array of shape (n_images, 2**n)
+            Each row is a vector representing an image.
+
+        opt_params: {'parameter': value}
+            Same options as in the ``FrqiInitialize`` constructor.
+
+        stream: bool
+            If ``True``, returns a generator of circuits instead of a list.
+            Default is ``stream=False``.
+
+        Returns
+        -------
+        circuits: list or generator of QuantumCircuit
+        """
+        opt_params = {} if opt_params is None else opt_params
+        simplify = opt_params.get("simplify") is None or opt_params.get("simplify")
+        init_index_register = opt_params.get("init_index_register") is None or \
+            opt_params.get("init_index_register")
+
+        if simplify or opt_params.get("method") == 'mcg':
+            circuits = (
+                FrqiInitialize(image, opt_params=opt_params).definition
+                for image in images
+            )
+        else:
+            images = np.array(images, dtype=float, ndmin=2)
+            if opt_params.get("rescale"):
+                minimum = np.min(images, axis=1, keepdims=True)
+                maximum = np.max(images, axis=1, keepdims=True)
+                images = (images - minimum) / (maximum - minimum) * pi
+
+            # Validates the size.
+            num_qubits = FrqiInitialize(images[0], opt_params=opt_params).num_qubits
+            template = _frqi_template(num_qubits, bool(init_index_register))
+            angles = multiplexor_angles(images)
+            circuits = (template.assign_parameters(values) for values in angles)
+
+        return circuits if stream else list(circuits)
+
+
+@lru_cache(maxsize=8)
+def _frqi_template(num_qubits, init_index_register):
+    """
+    Parameterized FRQI circuit, with the layout of
+    ``FrqiInitialize(image, {'simplify': False}).definition``.
+    """
+    controls = QuantumRegister(num_qubits-1)
+    target = QuantumRegister(1)
+    circuit = QuantumCircuit(controls, target)
+    if init_index_register:
+        circuit.h(controls)
+
+    ucr, _ = multiplexor_template(RYGate, num_qubits-1)
+    # `multiplexor` qubit index 0 is the target.
+    circuit.compose(ucr, [*target, *controls], inplace=True)
+
+    return circuit
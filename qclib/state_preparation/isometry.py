@@ -75,7 +75,8 @@ class IsometryInitialize(Initialize):
             )
             return circuit
 
-        return decompose(np.array(self.params), scheme=self.scheme)
+        # The norm of params is validated by Initialize.
+        return decompose(np.array(self.params), scheme=self.scheme, trusted=True)
 
     @staticmethod
     def initialize(q_circuit, state, qubits=None, opt_params=None):
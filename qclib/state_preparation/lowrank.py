@@ -17,12 +17,21 @@ Implements the state preparation
 defined at https://arxiv.org/abs/1003.5760.
 """
 
+from functools import lru_cache
+from math import ceil, log2
 import numpy as np
 from qiskit import QuantumCircuit
 from qclib.unitary import unitary as decompose_unitary, cnot_count as cnots_unitary
+from qclib.unitary import cnot_count_generic as cnots_unitary_generic
 from qclib.isometry import decompose as decompose_isometry, cnot_count as cnots_isometry
+from qclib.isometry import cnot_count_generic as cnots_isometry_generic
 from qclib.gates.initialize import Initialize
-from qclib.entanglement import schmidt_decomposition, _to_qubits
+from qclib.entanglement import (
+    schmidt_decomposition,
+    schmidt_coefficients,
+    effective_rank,
+    _to_qubits,
+)
 from .topdown import TopDownInitialize
 
 # pylint: disable=maybe-no-member
@@ -45,8 +54,10 @@ class LowRankInitialize(Initialize):
             Values are amplitudes.
 
         opt_params: {'lr': low_rank,
+                     'max_fidelity_loss': max_fidelity_loss,
                      'iso_scheme': isometry_scheme,
                      'unitary_scheme': unitary_scheme,
+                     'depth_weight': depth_weight,
                      'partition': partition}
             low_rank: int
                 ``state`` low-rank approximation (1 <= ``low_rank`` < 2**(n_qubits//2)).
@@ -55,17 +66,35 @@ class LowRankInitialize(Initialize):
                 of the state decomposition is greater than ``low_rank``, a low-rank
                 approximation is applied.
 
+            max_fidelity_loss: float
+                ``state`` allowed (fidelity) error for approximation
+                (0<=``max_fidelity_loss``<=1). If ``max_fidelity_loss`` is not in the valid
+                range, it will be ignored.
+                The budget is spread across the recursion levels. At each level, the rank
+                is reduced to the smallest power of two whose discarded singular-value
+                energy fits the level's share of the budget. The unused share is passed
+                down to the next levels. If ``low_rank`` is also set, the smaller rank is
+                used.
+                Default is ``max_fidelity_loss=0.0``.
+
             iso_scheme: string
                 Scheme used to decompose isometries.
-                Possible values are ``'knill'`` and ``'ccd'`` (column-by-column decomposition).
+                Possible values are ``'knill'``, ``'ccd'`` (column-by-column decomposition)
+                and ``'auto'`` (the scheme with the lowest modeled cost, for each isometry).
                 Default is ``isometry_scheme='ccd'``.
 
             unitary_scheme: string
                 Scheme used to decompose unitaries.
-                Possible values are ``'csd'`` (cosine-sine decomposition) and ``'qsd'`` (quantum
-                Shannon decomposition).
+                Possible values are ``'csd'`` (cosine-sine decomposition), ``'qsd'`` (quantum
+                Shannon decomposition) and ``'auto'`` (the decomposition with the lowest
+                modeled cost, for each unitary).
                 Default is ``unitary_scheme='qsd'``.
 
+            depth_weight: float
+                Weight of the CNOT depth against the CNOT count in the cost minimized by the
+                ``'auto'`` schemes.
+                Default is ``depth_weight=0.0``.
+
             partition: list of int
                 Set of qubit indices that represent a part of the bipartition.
                 The other partition will be the relative complement of the full set of qubits
@@ -86,10 +115,14 @@ class LowRankInitialize(Initialize):
             self.isometry_scheme = "ccd"
             self.unitary_scheme = "qsd"
             self.low_rank = 0
+            self.max_fidelity_loss = 0.0
             self.partition = None
             self.svd = "auto"
+            self.depth_weight = 0.0
         else:
             self.low_rank = 0 if opt_params.get("lr") is None else opt_params.get("lr")
+            self.max_fidelity_loss = 0.0 if opt_params.get("max_fidelity_loss") is None \
+                else opt_params.get("max_fidelity_loss")
             self.partition = opt_params.get("partition")
             if opt_params.get("iso_scheme") is None:
                 self.isometry_scheme = "ccd"
@@ -106,6 +139,11 @@ class LowRankInitialize(Initialize):
             else:
                 self.svd = opt_params.get("svd")
 
+            self.depth_weight = 0.0 if opt_params.get("depth_weight") is None \
+                else opt_params.get("depth_weight")
+
+        if self.max_fidelity_loss < 0 or self.max_fidelity_loss > 1:
+            self.max_fidelity_loss = 0.0
 
         if label is None:
             label = "LRSP"
@@ -116,88 +154,200 @@ class LowRankInitialize(Initialize):
         self.definition = self._define_initialize()
 
     def _define_initialize(self):
+        if self.partition is None:
+            self.partition = _default_partition(self.num_qubits)
+
+        circuit = QuantumCircuit(self.num_qubits)
+
+        # The decomposition tree is walked once with an explicit stack. Each node
+        # appends its primitive instructions directly into ``circuit``, with its
+        # qubit mapping resolved when the node is expanded, instead of building a
+        # nested gate (and a temporary circuit) for every sub-state.
+        stack = [(
+            "state",
+            self.params,
+            list(range(self.num_qubits)),
+            self.low_rank,
+            self.partition,
+            self.max_fidelity_loss
+        )]
+        while stack:
+            kind, *args = stack.pop()
+            if kind == "state":
+                # Tasks are pushed in reverse order so that they are emitted in order.
+                stack.extend(reversed(self._expand(circuit, *args)))
+            elif kind == "cx":
+                circuit.cx(*args)
+            else:
+                data, qubits = args
+                circuit.compose(self._decompose(data), qubits, inplace=True)
+
+        return circuit
+
+    @staticmethod
+    def initialize(q_circuit, state, qubits=None, opt_params=None):
+        """
+        Appends a LowRankInitialize gate into the q_circuit
+        """
+        if qubits is None:
+            q_circuit.append(
+                LowRankInitialize(state, opt_params=opt_params), q_circuit.qubits
+            )
+        else:
+            q_circuit.append(LowRankInitialize(state, opt_params=opt_params), qubits)
+
+    def _expand(self, circuit, state, qubits, low_rank, partition, max_fidelity_loss):
+        """
+        Expands a node of the decomposition tree into the tasks (sub-states,
+        CNOTs, isometries and unitaries) that encode ``state`` on ``qubits``.
+        """
+        n_qubits = _to_qubits(len(state))
 
-        if self.num_qubits < 2:
-            return TopDownInitialize(self.params).definition
+        if n_qubits < 2:
+            # Appended as a gate, so that the definition can be controlled.
+            circuit.append(TopDownInitialize(state), qubits)
+            return []
 
-        circuit, reg_a, reg_b = self._create_quantum_circuit()
+        if partition is None:
+            partition = _default_partition(n_qubits)
+
+        complement = sorted(set(range(n_qubits)).difference(set(partition)))
+        reg_a = partition[::-1]
+        reg_b = complement[::-1]
+
+        # Local qubit ``i`` of the node is mapped to ``qubits[n_qubits-i-1]``
+        # (qiskit little-endian), which replaces the former ``reverse_bits()``.
+        mapped = qubits[::-1]
 
         # Schmidt decomposition
         rank, svd_u, singular_values, svd_v = schmidt_decomposition(
-            self.params, reg_a, rank=self.low_rank, svd=self.svd
+            state, reg_a, rank=low_rank, svd=self.svd
+        )
+
+        # Fidelity-targeted truncation.
+        rank, svd_u, singular_values, svd_v, max_fidelity_loss = _fidelity_truncation(
+            rank, svd_u, singular_values, svd_v, max_fidelity_loss, n_qubits
         )
 
         # Schmidt measure of entanglement
         e_bits = _to_qubits(rank)
 
+        tasks = []
+
         # Phase 1. Encodes the singular values.
         if e_bits > 0:
             reg_sv = reg_b[:e_bits]
             singular_values = singular_values / np.linalg.norm(singular_values)
-            self._encode(singular_values.reshape(rank, 1), circuit, reg_sv)
+            tasks.append(
+                _task(
+                    singular_values.reshape(rank, 1),
+                    [mapped[q] for q in reg_sv],
+                    max_fidelity_loss
+                )
+            )
+        else:
+            # Rank 1: the remaining budget is shared by the two product states.
+            max_fidelity_loss = _split_fidelity_loss(max_fidelity_loss)
 
         # Phase 2. Entangles only the necessary qubits, according to rank.
         for j in range(e_bits):
-            circuit.cx(reg_b[j], reg_a[j])
+            tasks.append(("cx", mapped[reg_b[j]], mapped[reg_a[j]]))
 
         # Phase 3 and 4 encode gates U and V.T
-        self._encode(svd_u, circuit, reg_b)
-        self._encode(svd_v.T, circuit, reg_a)
+        tasks.append(_task(svd_u, [mapped[q] for q in reg_b], max_fidelity_loss))
+        tasks.append(_task(svd_v.T, [mapped[q] for q in reg_a], max_fidelity_loss))
 
-        return circuit.reverse_bits()
+        return tasks
 
-    @staticmethod
-    def initialize(q_circuit, state, qubits=None, opt_params=None):
+    def _decompose(self, data):
         """
-        Appends a LowRankInitialize gate into the q_circuit
+        Decomposes an isometry or unitary using the most appropriate method.
         """
-        if qubits is None:
-            q_circuit.append(
-                LowRankInitialize(state, opt_params=opt_params), q_circuit.qubits
+        if data.shape[0] // 2 == data.shape[1]:
+            # isometry 2^(n-1) to 2^n.
+            return decompose_isometry(data, scheme="csd", trusted=True)
+
+        if data.shape[0] > data.shape[1]:
+            return decompose_isometry(
+                data,
+                scheme=self.isometry_scheme,
+                depth_weight=self.depth_weight,
+                trusted=True,
             )
-        else:
-            q_circuit.append(LowRankInitialize(state, opt_params=opt_params), qubits)
 
-    def _encode(self, data, circuit, reg):
-        """
-        Encodes data using the most appropriate method.
-        """
-        if data.shape[1] == 1:
-            # state preparation
-            gate_u = LowRankInitialize(data[:, 0], opt_params={
-                "iso_scheme": self.isometry_scheme,
-                "unitary_scheme": self.unitary_scheme,
-                "svd": self.svd
-            })
-
-        elif data.shape[0] // 2 == data.shape[1]:
-            # isometry 2^(n-1) to 2^n.
-            gate_u = decompose_isometry(data, scheme="csd")
+        return decompose_unitary(
+            data, decomposition=self.unitary_scheme, depth_weight=self.depth_weight
+        )
 
-        elif data.shape[0] > data.shape[1]:
-            gate_u = decompose_isometry(data, scheme=self.isometry_scheme)
 
-        else:
-            gate_u = decompose_unitary(data, decomposition=self.unitary_scheme)
+def _task(data, qubits, max_fidelity_loss):
+    """
+    Creates the task that encodes ``data`` on ``qubits``. Single-column data is
+    a sub-state, which is expanded in place instead of being decomposed.
+    """
+    if data.shape[1] == 1:
+        # state preparation
+        return ("state", data[:, 0], qubits, 0, None, max_fidelity_loss)
 
-        # Apply gate U to the register reg
-        circuit.compose(gate_u, reg, inplace=True)
+    return ("data", data, qubits)
 
-    def _create_quantum_circuit(self):
 
-        if self.partition is None:
-            self.partition = _default_partition(self.num_qubits)
+def _default_partition(n_qubits):
+    odd = n_qubits % 2
+    return list(range(n_qubits // 2 + odd))
 
-        complement = sorted(set(range(self.num_qubits)).difference(set(self.partition)))
 
-        circuit = QuantumCircuit(self.num_qubits)
+def _fidelity_truncation(rank, svd_u, singular_values, svd_v, max_fidelity_loss, n_qubits):
+    """
+    Reduces the rank of the Schmidt decomposition to the smallest power of two
+    whose discarded singular-value energy fits the share of ``max_fidelity_loss``
+    assigned to this recursion level. Returns the truncated decomposition and
+    the fidelity loss budget left to the next levels.
+    """
+    if max_fidelity_loss <= 0.0 or rank == 1:
+        return rank, svd_u, singular_values, svd_v, max_fidelity_loss
 
-        return circuit, self.partition[::-1], complement[::-1]
+    new_rank, max_fidelity_loss = _fidelity_rank(
+        rank, singular_values, max_fidelity_loss, n_qubits
+    )
 
+    return (
+        new_rank,
+        svd_u[:, :new_rank],
+        singular_values[:new_rank],
+        svd_v[:new_rank, :],
+        max_fidelity_loss
+    )
+
+
+def _fidelity_rank(rank, singular_values, max_fidelity_loss, n_qubits):
+    """
+    Rank chosen by ``_fidelity_truncation`` and the budget left to the next levels.
+    """
+    # Number of recursion levels (halving ``n_qubits`` until reaching one qubit).
+    levels = int(ceil(log2(n_qubits)))
+    level_loss = 1.0 - (1.0 - max_fidelity_loss) ** (1.0 / levels)
+
+    energy = np.cumsum(np.abs(singular_values[:rank]) ** 2)
+    energy = energy / energy[-1]
+
+    new_rank = 1
+    while new_rank < rank and 1.0 - energy[new_rank - 1] > level_loss:
+        new_rank *= 2
+
+    # The fidelity loss at this level is multiplicative with the next levels.
+    fidelity = energy[new_rank - 1]
+    max_fidelity_loss = max(0.0, 1.0 - (1.0 - max_fidelity_loss) / fidelity)
+
+    return new_rank, max_fidelity_loss
 
-def _default_partition(n_qubits):
-    odd = n_qubits % 2
-    return list(range(n_qubits // 2 + odd))
+
+def _split_fidelity_loss(max_fidelity_loss):
+    """
+    Splits the fidelity loss budget between the two factors of a product state,
+    so that the product of their fidelities is bounded by ``1-max_fidelity_loss``.
+    """
+    return 1.0 - np.sqrt(1.0 - max_fidelity_loss)
 
 
 def cnot_count(
@@ -207,10 +357,16 @@ def cnot_count(
     unitary_scheme="qsd",
     partition=None,
     method = "estimate",
-    svd="auto"
+    svd="auto",
+    max_fidelity_loss=0.0
 ):
     """
     Estimate the number of CNOTs to build the state preparation circuit.
+
+    ``method='spectrum'`` computes only the Schmidt coefficients of the first
+    bipartition (no singular vectors) and evaluates a closed-form model that
+    treats the Schmidt factors and the sub-states as generic. ``svd`` is
+    ignored and ``max_fidelity_loss`` only truncates the first level.
     """
 
     n_qubits = _to_qubits(len(state_vector))
@@ -220,6 +376,16 @@ def cnot_count(
     if partition is None:
         partition = _default_partition(n_qubits)
 
+    if method == "spectrum":
+        return _cnot_count_spectrum(
+            state_vector,
+            low_rank,
+            isometry_scheme,
+            unitary_scheme,
+            partition,
+            max_fidelity_loss,
+        )
+
     cnots = 0
 
     rank, svd_u, singular_values, svd_v = schmidt_decomposition(
@@ -229,6 +395,10 @@ def cnot_count(
         svd=svd
     )
 
+    rank, svd_u, singular_values, svd_v, max_fidelity_loss = _fidelity_truncation(
+        rank, svd_u, singular_values, svd_v, max_fidelity_loss, n_qubits
+    )
+
     # Schmidt measure of entanglement
     ebits = _to_qubits(rank)
 
@@ -236,26 +406,41 @@ def cnot_count(
     if ebits > 0:
         singular_values = singular_values / np.linalg.norm(singular_values)
         cnots += _cnots(
-            singular_values.reshape(rank, 1), isometry_scheme, unitary_scheme, method, svd
+            singular_values.reshape(rank, 1), isometry_scheme, unitary_scheme, method, svd,
+            max_fidelity_loss
         )
+    else:
+        max_fidelity_loss = _split_fidelity_loss(max_fidelity_loss)
+
     # Phase 2.
     cnots += ebits
 
     # Phases 3 and 4.
-    cnots += _cnots(svd_u, isometry_scheme, unitary_scheme, method, svd)
-    cnots += _cnots(svd_v.T, isometry_scheme, unitary_scheme, method, svd)
+    cnots += _cnots(svd_u, isometry_scheme, unitary_scheme, method, svd, max_fidelity_loss)
+    cnots += _cnots(svd_v.T, isometry_scheme, unitary_scheme, method, svd, max_fidelity_loss)
 
     return cnots
 
 
-def _cnots(data, iso_scheme="ccd", uni_scheme="qsd", method="estimate", svd="auto"):
+def cnot_count_generic(n_qubits, isometry_scheme="ccd", unitary_scheme="qsd"):
+    """
+    Estimate the number of CNOTs to build the state preparation circuit of a
+    generic ``n_qubits`` state (maximal Schmidt rank), from its size only.
+    """
+    return _cnots_generic(n_qubits, 1, isometry_scheme, unitary_scheme)
+
+
+def _cnots(
+    data, iso_scheme="ccd", uni_scheme="qsd", method="estimate", svd="auto", max_fidelity_loss=0.0
+):
     if data.shape[1] == 1:
         return cnot_count(
             data[:, 0],
             isometry_scheme=iso_scheme,
             unitary_scheme=uni_scheme,
             method=method,
-            svd=svd
+            svd=svd,
+            max_fidelity_loss=max_fidelity_loss
         )
 
     if data.shape[0] // 2 == data.shape[1]:
@@ -265,3 +450,70 @@ def _cnots(data, iso_scheme="ccd", uni_scheme="qsd", method="estimate", svd="aut
         return cnots_isometry(data, scheme=iso_scheme, method=method)
 
     return cnots_unitary(data, decomposition=uni_scheme, method=method)
+
+
+def _cnot_count_spectrum(
+    state_vector, low_rank, isometry_scheme, unitary_scheme, partition, max_fidelity_loss
+):
+    # pylint: disable=too-many-arguments
+    n_qubits = _to_qubits(len(state_vector))
+
+    singular_values = schmidt_coefficients(state_vector, partition)
+
+    # Same rank as ``schmidt_decomposition`` and ``_fidelity_truncation``.
+    schmidt_rank = effective_rank(singular_values)
+    if 0 < low_rank < schmidt_rank:
+        schmidt_rank = low_rank
+    rank = int(2 ** ceil(log2(schmidt_rank)))
+    if 0.0 < max_fidelity_loss <= 1.0 and rank > 1:
+        rank, _ = _fidelity_rank(rank, singular_values, max_fidelity_loss, n_qubits)
+
+    return _cnot_count_generic(
+        n_qubits, rank, len(partition), isometry_scheme, unitary_scheme
+    )
+
+
+@lru_cache(maxsize=None)
+def _cnot_count_generic(n_qubits, rank, n_partition, iso_scheme, uni_scheme):
+    """
+    CNOT count of a state with Schmidt rank ``rank`` across a bipartition with
+    ``n_partition`` qubits, whose Schmidt factors and sub-states are generic.
+    It follows the phases of ``cnot_count``.
+    """
+    if n_qubits < 2:
+        return 0
+
+    ebits = _to_qubits(rank)
+
+    # Phases 1 and 2.
+    cnots = ebits
+    if ebits > 0:
+        cnots += _cnots_generic(ebits, 1, iso_scheme, uni_scheme)
+
+    # Phases 3 and 4.
+    cnots += _cnots_generic(n_partition, rank, iso_scheme, uni_scheme)
+    cnots += _cnots_generic(n_qubits - n_partition, rank, iso_scheme, uni_scheme)
+
+    return cnots
+
+
+def _cnots_generic(n_qubits, cols, iso_scheme, uni_scheme):
+    # Mirrors ``_cnots`` for generic data of shape (2**n_qubits, cols).
+    if cols == 1:
+        # The maximal Schmidt rank of the default partition.
+        return _cnot_count_generic(
+            n_qubits,
+            2 ** (n_qubits // 2),
+            len(_default_partition(n_qubits)),
+            iso_scheme,
+            uni_scheme,
+        )
+
+    log_cols = _to_qubits(cols)
+    if n_qubits - 1 == log_cols:
+        return cnots_isometry_generic(n_qubits, log_cols, "csd")
+
+    if n_qubits > log_cols:
+        return cnots_isometry_generic(n_qubits, log_cols, iso_scheme)
+
+    return cnots_unitary_generic(n_qubits, uni_scheme)
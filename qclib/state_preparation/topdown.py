@@ -17,17 +17,26 @@
         https://arxiv.org/abs/2108.10182
 """
 
+from math import isclose
 import numpy as np
 from qiskit import QuantumCircuit, QuantumRegister
 
 from qclib.gates.initialize import Initialize
 from qclib.state_preparation.util.state_tree_preparation import (
-    Amplitude,
-    state_decomposition,
+    state_decomposition_array,
+    sparse_state_decomposition,
+)
+from qclib.state_preparation.util.angle_tree_preparation import (
+    create_angles_tree_array,
+    create_sparse_angles_tree,
+    prune_angles_tree_array,
+)
+from qclib.state_preparation.util.tree_register import add_register_array
+from qclib.state_preparation.util.tree_walk import (
+    top_down_array,
+    top_down_pruned,
+    top_down_sparse,
 )
-from qclib.state_preparation.util.angle_tree_preparation import create_angles_tree
-from qclib.state_preparation.util.tree_register import add_register
-from qclib.state_preparation.util.tree_walk import top_down
 
 
 class TopDownInitialize(Initialize):
@@ -43,21 +52,44 @@ class TopDownInitialize(Initialize):
         """
         Parameters
         ----------
-        params: list of complex
+        params: list of complex, dict or tuple
             A unit vector representing a quantum state.
             Values are amplitudes.
-
-        opt_params: {'global_phase': global_phase, 'lib': lib}
+            A sparse state can be given as a dictionary
+            ``{binary_string: amplitude}`` with the nonzero amplitudes (as
+            in the sparse initializers) or as a tuple
+            ``(indices, amplitudes)`` whose first element is an array of
+            indices. In this case, only the nonzero paths of the state tree
+            are built. Any other sequence (including a tuple of amplitudes)
+            is a dense state.
+
+        opt_params: {'global_phase': global_phase, 'lib': lib,
+                     'n_qubits': n_qubits, 'max_fidelity_loss': max_fidelity_loss}
             global_phase: bool
                 If ``True``, corrects the global phase.
                 Default value is ``True``.
             lib: str
                 Library to be used.
                 Default value is ``'qclib'``.
+            n_qubits: int
+                Number of qubits of a state given as ``(indices, amplitudes)``.
+                Default value is the bit length of the largest index.
+            max_fidelity_loss: float
+                ``state`` allowed (fidelity) error for approximation
+                (0<=``max_fidelity_loss``<=1). If ``max_fidelity_loss`` is not in the
+                valid range, it will be ignored.
+                The angles with the smallest fidelity contribution are rounded (to zero,
+                or RY angles to pi), which cuts the subtrees no longer reached. The
+                multiplexors whose angles all vanish are dropped, and the sparse ones
+                are replaced by multicontrolled rotations. The exact fidelity loss is stored in the
+                ``'fidelity_loss'`` entry of the definition's metadata.
+                Only used with dense states.
+                Default is ``max_fidelity_loss=0.0``.
         """
         self._name = "top-down"
-        self._get_num_qubits(params)
 
+        n_qubits = None
+        self.max_fidelity_loss = 0.0
         if opt_params is None:
             self.global_phase = True
             self.lib = "qclib"
@@ -72,6 +104,20 @@ class TopDownInitialize(Initialize):
             else:
                 self.lib = opt_params.get("lib")
 
+            n_qubits = opt_params.get("n_qubits")
+
+            if opt_params.get("max_fidelity_loss") is not None:
+                self.max_fidelity_loss = opt_params.get("max_fidelity_loss")
+
+        if self.max_fidelity_loss < 0 or self.max_fidelity_loss > 1:
+            self.max_fidelity_loss = 0.0
+
+        self.sparse = self._is_sparse(params)
+        if self.sparse:
+            params = self._sparse_params(params, n_qubits)
+
+        self._get_num_qubits(params)
+
         if label is None:
             label = "TDSP"
 
@@ -85,24 +131,111 @@ class TopDownInitialize(Initialize):
             reg = QuantumRegister(self.num_qubits)
             circuit = QuantumCircuit(reg)
             # pylint: disable=maybe-no-member
-            circuit.initialize(self.params)
+            circuit.initialize(self._dense_params())
 
             return circuit
 
-        data = [Amplitude(i, a) for i, a in enumerate(self.params)]
+        if self.sparse:
+            return self._define_sparse()
 
-        state_tree = state_decomposition(self.num_qubits, data)
-        angle_tree = create_angles_tree(state_tree)
+        mag, arg = state_decomposition_array(self.num_qubits, self.params)
+        angle_tree = create_angles_tree_array(mag, arg)
 
         circuit = QuantumCircuit()
-        add_register(circuit, angle_tree, 0)
+        if self.max_fidelity_loss > 0.0:
+            angle_tree, fidelity_loss = prune_angles_tree_array(
+                angle_tree, 0, self.max_fidelity_loss
+            )
+            add_register_array(circuit, angle_tree, 0)
+            top_down_pruned(angle_tree, circuit, 0)
+            circuit.metadata = {"fidelity_loss": fidelity_loss}
+        else:
+            add_register_array(circuit, angle_tree, 0)
+            top_down_array(angle_tree, circuit, 0)
 
-        top_down(angle_tree, circuit, 0)
         if self.global_phase:
             circuit.global_phase += sum(np.angle(self.params)) / len(self.params)
 
         return circuit
 
+    def _define_sparse(self):
+        indices = [int(binary_string, 2) for binary_string, _ in self.params]
+        amplitudes = [amplitude for _, amplitude in self.params]
+
+        levels = sparse_state_decomposition(self.num_qubits, indices, amplitudes)
+        angle_tree = create_sparse_angles_tree(levels)
+
+        # Same layout as `add_register_array` with start_level=0: the level
+        # l is encoded on the output qubit n-l-1.
+        output_register = QuantumRegister(self.num_qubits, name="output")
+        circuit = QuantumCircuit(output_register)
+
+        top_down_sparse(angle_tree, circuit, output_register[::-1])
+        if self.global_phase:
+            # The zero amplitudes contribute with a zero phase.
+            circuit.global_phase += sum(np.angle(amplitudes)) / 2**self.num_qubits
+
+        return circuit
+
+    def _dense_params(self):
+        if not self.sparse:
+            return self.params
+
+        state = np.zeros(2**self.num_qubits, dtype=complex)
+        for binary_string, amplitude in self.params:
+            state[int(binary_string, 2)] = amplitude
+        return state
+
+    @staticmethod
+    def _is_sparse(params):
+        """
+        Whether ``params`` is a sparse state: a dictionary, or a pair
+        ``(indices, amplitudes)`` of one-dimensional sequences.
+        """
+        if isinstance(params, dict):
+            return True
+
+        return (
+            isinstance(params, tuple)
+            and len(params) == 2
+            and np.ndim(params[0]) == 1
+            and np.ndim(params[1]) == 1
+        )
+
+    @staticmethod
+    def _sparse_params(params, n_qubits=None):
+        """
+        Converts a sparse state to a list of (binary_string, amplitude) pairs.
+        """
+        if isinstance(params, dict):
+            return list(params.items())
+
+        indices, amplitudes = params
+        indices = [int(index) for index in indices]
+        if n_qubits is None:
+            n_qubits = max(1, max(indices).bit_length())
+        return [
+            (f"{index:0{n_qubits}b}", amplitude)
+            for index, amplitude in zip(indices, amplitudes)
+        ]
+
+    def _get_num_qubits(self, params):
+        if not self.sparse:
+            super()._get_num_qubits(params)
+            return
+
+        self.num_qubits = len(params[0][0])
+
+        # Check if probabilities (amplitudes squared) sum to 1
+        amplitudes = [amplitude for _, amplitude in params]
+        if not isclose(sum(np.absolute(amplitudes) ** 2), 1.0, abs_tol=1e-10):
+            raise ValueError("Sum of amplitudes-squared does not equal one.")
+
+    def validate_parameter(self, parameter):
+        if isinstance(parameter, tuple):
+            return parameter[0], super().validate_parameter(parameter[1])
+        return super().validate_parameter(parameter)
+
     @staticmethod
     def initialize(q_circuit, state, qubits=None, opt_params=None):
         """
@@ -18,7 +18,8 @@ https://arxiv.org/abs/2108.10182
 
 import math
 from dataclasses import dataclass
-from qclib.state_preparation.util.tree_utils import is_leaf
+import numpy as np
+from qclib.state_preparation.util.tree_utils import is_leaf, level_slice
 
 
 @dataclass
@@ -74,3 +75,225 @@ def create_angles_tree(state_tree):
         node.left = create_angles_tree(state_tree.left)
 
     return node
+
+
+@dataclass
+class AngleTreeArray:
+    """
+    Heap-ordered angle tree used by the array tree walkers. The node ``index``
+    of ``level`` is stored at position ``2**level - 1 + index``.
+    """
+
+    angle_y: np.ndarray
+    angle_z: np.ndarray
+    # Circuit qubit index of each node (-1 if none), set by `add_register_array`.
+    qubits: np.ndarray = None
+
+    @property
+    def height(self):
+        """Number of levels of the tree."""
+        return (len(self.angle_y) + 1).bit_length() - 1
+
+
+def create_angles_tree_array(mag, arg):
+    """
+    Heap-ordered version of ``create_angles_tree``.
+    :param mag: magnitudes of the state tree, output of state_decomposition_array
+    :param arg: phases of the state tree, output of state_decomposition_array
+    :return: angle tree with one node per internal node of the state tree
+    """
+    n_nodes = len(mag) // 2
+    # The right child of the node k is 2k+2.
+    node_mag = mag[:n_nodes]
+    ratio = np.divide(
+        mag[2::2], node_mag, out=np.zeros(n_nodes), where=node_mag != 0.0
+    )
+
+    # Avoid out-of-domain value due to numerical error.
+    angle_y = 2 * np.arcsin(np.minimum(ratio, 1.0))
+    angle_z = 2 * (arg[2::2] - arg[:n_nodes])
+
+    return AngleTreeArray(angle_y, angle_z)
+
+
+def prune_angles_tree_array(angle_tree, start_level, max_fidelity_loss):
+    """
+    Rounds the angles of an ``AngleTreeArray`` with the smallest fidelity
+    contribution, as long as the fidelity loss does not exceed
+    ``max_fidelity_loss``. RZ angles are zeroed. RY angles are zeroed or, in
+    the top-down part, set to ``pi``, whichever loses less; in both cases one
+    of the children is no longer reached, and the angles of its subtree are
+    also zeroed, which does not change the prepared state. The loss is
+    computed exactly from the angles, without simulating the circuit (see
+    ``_PruningOverlap``).
+    :param angle_tree: output of create_angles_tree_array
+    :param start_level: level at which the tree is split (0 for top-down)
+    :param max_fidelity_loss: allowed fidelity loss (0 <= max_fidelity_loss <= 1)
+    :return: pruned angle tree and its fidelity loss
+    """
+    n_nodes = len(angle_tree.angle_y)
+    half_y = angle_tree.angle_y / 2
+    half_z = angle_tree.angle_z / 2
+    top_down = np.arange(n_nodes) >= 2**start_level - 1
+
+    # Probability of reaching each node from the root of its top-down subtree.
+    # The nodes above ``start_level`` are prepared as a product state, so the
+    # loss of each one is not weighted.
+    weight = np.ones(n_nodes)
+    for level in range(start_level, angle_tree.height - 1):
+        node_weight = weight[level_slice(level)]
+        children_weight = weight[level_slice(level + 1)]
+        children_weight[0::2] = node_weight * np.cos(half_y[level_slice(level)]) ** 2
+        children_weight[1::2] = node_weight * np.sin(half_y[level_slice(level)]) ** 2
+
+    # Loss of rounding each angle alone (the overlap of the node sub-state is
+    # cos(y/2) for y -> 0 and sin(y/2) for y -> pi).
+    def single_loss(node_overlap):
+        return 1.0 - np.abs(1.0 - weight * (1.0 - node_overlap)) ** 2
+
+    loss_y = single_loss(np.cos(half_y))
+    loss_y_pi = np.where(top_down, single_loss(np.sin(half_y)), np.inf)
+    target_y = np.where(loss_y_pi < loss_y, np.pi, 0.0)
+    loss_y = np.minimum(loss_y, loss_y_pi)
+    loss_z = single_loss(
+        np.cos(half_y) ** 2 * np.exp(1j * half_z) + np.sin(half_y) ** 2 * np.exp(-1j * half_z)
+    )
+
+    rounded = np.concatenate((target_y, np.zeros(n_nodes)))
+    angles = np.concatenate((angle_tree.angle_y, angle_tree.angle_z))
+    losses = np.concatenate((loss_y, loss_z))
+    candidates = np.flatnonzero(angles != rounded)
+    candidates = candidates[np.argsort(losses[candidates], kind="stable")]
+
+    # Longest prefix of the candidates within the budget. The loss is not
+    # monotonic in the prefix length, so the prefixes are scanned in order
+    # and the scan stops at the first one over the budget. Each step updates
+    # the loss incrementally, along the path from the pruned node to its root.
+    pruned = angles.copy()
+    overlap = _PruningOverlap(half_y, half_z, start_level)
+    count, fidelity_loss = 0, 0.0
+    for candidate in candidates:
+        pruned[candidate] = rounded[candidate]
+        node = candidate % n_nodes
+        overlap.update(node, pruned[node] / 2, pruned[n_nodes + node] / 2)
+        loss = overlap.loss()
+        if loss > max_fidelity_loss:
+            break
+        count, fidelity_loss = count + 1, loss
+
+    pruned = angles.copy()
+    pruned[candidates[:count]] = rounded[candidates[:count]]
+    angle_y, angle_z = pruned[:n_nodes], pruned[n_nodes:]
+
+    # Zero RY angles do not reach the right child and RY angles equal to pi do
+    # not reach the left child.
+    reachable = np.ones(n_nodes, dtype=bool)
+    for level in range(start_level, angle_tree.height - 1):
+        node_reachable = reachable[level_slice(level)]
+        node_angle_y = angle_y[level_slice(level)]
+        children_reachable = reachable[level_slice(level + 1)]
+        children_reachable[0::2] = node_reachable & (node_angle_y != np.pi)
+        children_reachable[1::2] = node_reachable & (node_angle_y != 0.0)
+    angle_y[~reachable] = 0.0
+    angle_z[~reachable] = 0.0
+
+    return AngleTreeArray(angle_y, angle_z), fidelity_loss
+
+
+class _PruningOverlap:
+    """
+    Exact fidelity loss ``1 - |<psi|psi'>|^2`` between the states prepared
+    with the original and with the pruned angles (including the ancillae of
+    the bottom-up part). Each node maps its normalized sub-state to
+    ``cos(y/2) e^{-iz/2} |0>|left> + sin(y/2) e^{iz/2} |1>|right>``, so the
+    overlap of a top-down subtree follows from its children's overlaps, and
+    the nodes above ``start_level`` (a product state before the CSWAPs)
+    contribute with their single-qubit overlaps.
+
+    The overlaps of the top-down subtrees are kept in heap order, so pruning
+    one node only updates the overlaps on the path to its subtree root.
+    """
+
+    def __init__(self, half_y, half_z, start_level):
+        self.half_y = half_y
+        self.half_z = half_z
+        self.start_level = start_level
+        self.n_product = 2**start_level - 1
+
+        # Nothing is pruned yet: the overlap of each node is its weight.
+        self.left = np.cos(half_y).astype(complex) ** 2
+        self.right = np.sin(half_y).astype(complex) ** 2
+
+        height = (len(half_y) + 1).bit_length() - 1
+        self.overlap = np.ones(2 ** (height + 1) - 1, dtype=complex)
+        for level in range(height - 1, start_level - 1, -1):
+            children = self.overlap[level_slice(level + 1)]
+            self.overlap[level_slice(level)] = (
+                self.left[level_slice(level)] * children[0::2]
+                + self.right[level_slice(level)] * children[1::2]
+            )
+
+    def update(self, node, pruned_half_y, pruned_half_z):
+        """Sets the pruned angles of ``node``."""
+        phase = np.exp(1j * (self.half_z[node] - pruned_half_z))
+        self.left[node] = np.cos(self.half_y[node]) * np.cos(pruned_half_y) * phase
+        self.right[node] = np.sin(self.half_y[node]) * np.sin(pruned_half_y) * np.conj(phase)
+
+        while node >= self.n_product:
+            self.overlap[node] = (
+                self.left[node] * self.overlap[2 * node + 1]
+                + self.right[node] * self.overlap[2 * node + 2]
+            )
+            if node == 0:
+                break
+            node = (node - 1) // 2
+
+    def loss(self):
+        """Fidelity loss of the current pruned angles."""
+        product_state = slice(0, self.n_product)
+        overlap = np.prod(self.overlap[level_slice(self.start_level)]) * np.prod(
+            self.left[product_state] + self.right[product_state]
+        )
+
+        return max(0.0, float(1.0 - np.abs(overlap) ** 2))
+
+
+@dataclass
+class SparseAngleTree:
+    """
+    Angle tree of a sparse state. For each level, ``index`` holds the sorted
+    indexes of the nodes with a nonzero amplitude below them; the angles of
+    the other nodes are zero.
+    """
+
+    index: list
+    angle_y: list
+    angle_z: list
+
+
+def create_sparse_angles_tree(levels):
+    """
+    Sparse version of ``create_angles_tree_array``.
+    :param levels: output of sparse_state_decomposition
+    :return: angle tree with the nodes of the nonzero paths
+    """
+    tree = SparseAngleTree([], [], [])
+    for (index, mag, arg), (child_index, child_mag, child_arg) in zip(
+        levels[:-1], levels[1:]
+    ):
+        # Right children (odd indexes) of each node, zero if missing.
+        right = child_index & 1 == 1
+        parent = np.searchsorted(index, child_index[right] >> 1)
+        right_mag = np.zeros(len(index))
+        right_arg = np.zeros(len(index))
+        right_mag[parent] = child_mag[right]
+        right_arg[parent] = child_arg[right]
+
+        ratio = np.divide(right_mag, mag, out=np.zeros(len(index)), where=mag != 0.0)
+
+        tree.index.append(index)
+        # Avoid out-of-domain value due to numerical error.
+        tree.angle_y.append(2 * np.arcsin(np.minimum(ratio, 1.0)))
+        tree.angle_z.append(2 * (right_arg - arg))
+
+    return tree
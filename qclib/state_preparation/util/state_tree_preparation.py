@@ -20,6 +20,8 @@ import math
 import cmath
 from dataclasses import dataclass
 from typing import NamedTuple
+import numpy as np
+from qclib.state_preparation.util.tree_utils import level_slice
 
 
 class Amplitude(NamedTuple):
@@ -100,3 +102,61 @@ def state_decomposition(nqubits, data):
 
     tree_root = new_nodes[0]
     return tree_root
+
+
+def state_decomposition_array(nqubits, amplitudes):
+    """
+    Heap-ordered version of ``state_decomposition``. The node ``index`` of
+    ``level`` is stored at position ``2**level - 1 + index``, so the children
+    of the node at position ``k`` are at ``2*k + 1`` and ``2*k + 2``.
+    :param nqubits: number of qubits required to generate a
+                    state with the same length as the data vector (2^nqubits)
+    :param amplitudes: vector with exactly 2^nqubits amplitudes
+    :return: magnitudes and phases of the state tree nodes
+    """
+    amplitudes = np.asarray(amplitudes)
+    mag = np.empty(2 ** (nqubits + 1) - 1)
+    arg = np.empty(2 ** (nqubits + 1) - 1)
+
+    # leafs
+    mag[level_slice(nqubits)] = np.abs(amplitudes)
+    arg[level_slice(nqubits)] = np.angle(amplitudes)
+
+    # build state tree, level by level
+    for level in range(nqubits - 1, -1, -1):
+        children_mag = mag[level_slice(level + 1)]
+        children_arg = arg[level_slice(level + 1)]
+        mag[level_slice(level)] = np.hypot(children_mag[0::2], children_mag[1::2])
+        arg[level_slice(level)] = (children_arg[0::2] + children_arg[1::2]) / 2
+
+    return mag, arg
+
+
+def sparse_state_decomposition(nqubits, indices, amplitudes):
+    """
+    Sparse version of ``state_decomposition_array``. Only the nodes with a
+    nonzero amplitude below them are stored.
+    :param nqubits: number of qubits of the state
+    :param indices: basis state indices of the nonzero amplitudes
+    :param amplitudes: nonzero amplitudes
+    :return: list with the sorted node indexes, magnitudes and phases of each
+             level, from the root (level 0) to the leafs (level nqubits)
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    amplitudes = np.asarray(amplitudes, dtype=complex)
+    order = np.argsort(indices)
+
+    index = indices[order]
+    mag = np.abs(amplitudes[order])
+    arg = np.angle(amplitudes[order])
+    levels = [(index, mag, arg)]
+
+    # build state tree, level by level. A missing sibling has zero magnitude
+    # and phase.
+    for _ in range(nqubits):
+        index, inverse = np.unique(index >> 1, return_inverse=True)
+        mag = np.sqrt(np.bincount(inverse, weights=mag**2))
+        arg = np.bincount(inverse, weights=arg) / 2
+        levels.append((index, mag, arg))
+
+    return levels[::-1]
@@ -16,8 +16,9 @@
 https://arxiv.org/abs/2108.10182
 """
 
+import numpy as np
 import qiskit
-from qclib.state_preparation.util.tree_utils import children
+from qclib.state_preparation.util.tree_utils import children, level_slice
 
 
 def output(angle_tree, output_qubits):
@@ -74,3 +75,50 @@ def add_register(circuit, angle_tree, start_level):
         qubits.extend([*ancilla_register[::-1]])
 
     _add_register(angle_tree, qubits, start_level)
+
+
+def add_register_array(circuit, angle_tree, start_level):
+    """
+    Version of ``add_register`` for ``AngleTreeArray``. The qubits are assigned
+    in the same order, but the preorder position of each node is computed
+    level by level from the sizes of the skipped subtrees.
+    """
+    n_levels = angle_tree.height
+    start_level = min(start_level, n_levels - 1)
+
+    noutput = n_levels  # one output qubits per level
+    # bottom-up qubits + top-down qubits: (number of sub-states) * (number of
+    # qubits per sub-state)
+    nqubits = 2**start_level - 1 + 2**start_level * (n_levels - start_level)
+    nancilla = nqubits - noutput
+
+    offset = circuit.num_qubits
+    circuit.add_register(qiskit.QuantumRegister(noutput, name="output"))
+    if nancilla > 0:
+        circuit.add_register(qiskit.QuantumRegister(nancilla, name="ancilla"))
+
+    # Number of nodes visited by the preorder walk of a subtree rooted at each
+    # level: below `start_level` only the leftmost branch is walked.
+    size = [n_levels - level for level in range(n_levels)]
+    for level in range(start_level - 1, -1, -1):
+        size[level] = 1 + 2 * size[level + 1]
+
+    position = np.full(2**n_levels - 1, -1)
+    for level in range(start_level + 1):
+        index = np.arange(2**level)
+        level_position = np.full(2**level, level)
+        for depth in range(1, level + 1):
+            # Going right skips the left sibling subtree.
+            level_position += ((index >> (level - depth)) & 1) * size[depth]
+        position[level_slice(level)] = level_position
+
+    roots = position[level_slice(start_level)]
+    for level in range(start_level + 1, n_levels):
+        leftmost = 2**level - 1 + np.arange(2**start_level) * 2 ** (level - start_level)
+        position[leftmost] = roots + level - start_level
+
+    # The walk takes the output qubits and then the ancillas, both reversed.
+    qubits = np.where(
+        position < noutput, noutput - 1 - position, nqubits + noutput - 1 - position
+    )
+    angle_tree.qubits = np.where(position < 0, -1, offset + qubits)
@@ -16,9 +16,13 @@
 https://arxiv.org/abs/2108.10182
 """
 
-from qiskit.circuit.library import RYGate, RZGate
+import numpy as np
+from qiskit.circuit import CircuitInstruction
+from qiskit.circuit.library import RYGate, RZGate, CSwapGate
+from qclib.gates.mcg import Mcg, mcg_cnot_count
 from qclib.gates.ucr import multiplexor
 from qclib.state_preparation.util.tree_utils import leftmost, children
+from qclib.state_preparation.util.angle_tree_preparation import SparseAngleTree
 
 
 def bottom_up(angle_tree, circuit, start_level):
@@ -92,3 +96,162 @@ def _apply_cswaps(angle_tree, circuit):
 
             left = left.left
             right = leftmost(right)
+
+
+def bottom_up_array(angle_tree, circuit, start_level):
+    """
+    bottom_up state preparation over an ``AngleTreeArray``. The tree is walked
+    with an explicit stack (rotations in preorder, CSWAPs in postorder) and the
+    instructions are appended to the circuit as a single batch.
+    """
+    stop_level = min(start_level, angle_tree.height)
+    if stop_level <= 0:
+        return
+
+    qubits = circuit.qubits
+    node_qubits = angle_tree.qubits.tolist()
+    angles_y = angle_tree.angle_y.tolist()
+    angles_z = angle_tree.angle_z.tolist()
+    height = angle_tree.height
+    cswap = CSwapGate()
+
+    instructions = []
+    stack = [(0, 0, False)]
+    while stack:
+        node, level, visited = stack.pop()
+        qubit = qubits[node_qubits[node]]
+
+        if visited:
+            if angles_y[node] != 0.0:
+                # Leftmost descendants of the left (2k+1) and right (2k+2)
+                # children.
+                for depth in range(height - level - 1):
+                    left = node_qubits[(2 * node + 2) * 2**depth - 1]
+                    right = node_qubits[(2 * node + 3) * 2**depth - 1]
+                    instructions.append(
+                        CircuitInstruction(cswap, (qubit, qubits[left], qubits[right]))
+                    )
+            continue
+
+        if angles_y[node] != 0.0:
+            instructions.append(CircuitInstruction(RYGate(angles_y[node]), (qubit,)))
+        if angles_z[node] != 0.0:
+            instructions.append(CircuitInstruction(RZGate(angles_z[node]), (qubit,)))
+
+        stack.append((node, level, True))
+        if level + 1 < stop_level:
+            stack.append((2 * node + 2, level + 1, False))
+            stack.append((2 * node + 1, level + 1, False))
+
+    for instruction in instructions:
+        circuit._append(instruction)  # pylint: disable=protected-access
+
+
+def top_down_array(angle_tree, circuit, start_level):
+    """top down state preparation over an ``AngleTreeArray``"""
+    qubits = circuit.qubits
+    n_levels = angle_tree.height
+
+    # One sub-state per node of `start_level`, from left to right.
+    for root in range(2**start_level):
+        control_qubits = []
+        for level in range(start_level, n_levels):
+            # The nodes of the subtree in the current level.
+            width = 2 ** (level - start_level)
+            first = 2**level - 1 + root * width
+            angles_y = angle_tree.angle_y[first : first + width]
+            angles_z = angle_tree.angle_z[first : first + width]
+            target_qubit = qubits[angle_tree.qubits[first]]
+
+            # If both multiplexors are used (RY and RZ), we can save two CNOTs.
+            # That is why the RZ multiplexor is reversed.
+            any_y = np.any(angles_y)
+            any_z = np.any(angles_z)
+            if any_y:
+                ucry = multiplexor(RYGate, angles_y, last_control=not any_z)
+                circuit.append(ucry, [target_qubit] + control_qubits[::-1])
+
+            if any_z:
+                ucrz = multiplexor(RZGate, angles_z, last_control=not any_y)
+                circuit.append(
+                    ucrz.reverse_ops(), [target_qubit] + control_qubits[::-1]
+                )
+
+            control_qubits.append(target_qubit)  # add current node to the controls
+
+
+def top_down_pruned(angle_tree, circuit, start_level):
+    """
+    top down state preparation over a pruned ``AngleTreeArray`` (see
+    ``prune_angles_tree_array``). Each subtree is emitted with
+    ``top_down_sparse``, so the levels whose angles all vanish are dropped and
+    the levels with few nonzero angles use multicontrolled gates instead of
+    multiplexors.
+    """
+    qubits = circuit.qubits
+    for root in range(2**start_level):
+        subtree = SparseAngleTree([], [], [])
+        level_qubits = []
+        for level in range(start_level, angle_tree.height):
+            width = 2 ** (level - start_level)
+            first = 2**level - 1 + root * width
+            angles_y = angle_tree.angle_y[first : first + width]
+            angles_z = angle_tree.angle_z[first : first + width]
+            index = np.flatnonzero((angles_y != 0.0) | (angles_z != 0.0))
+
+            subtree.index.append(index)
+            subtree.angle_y.append(angles_y[index])
+            subtree.angle_z.append(angles_z[index])
+            level_qubits.append(qubits[angle_tree.qubits[first]])
+
+        top_down_sparse(subtree, circuit, level_qubits)
+
+
+def top_down_sparse(angle_tree, circuit, level_qubits):
+    """
+    top down state preparation over a ``SparseAngleTree``. The qubit of each
+    level is given by ``level_qubits``. Each level is emitted as a pair of
+    multiplexors or, if cheaper, as one multicontrolled RZ.RY gate per node
+    with nonzero angles. The rotations of the other control patterns are
+    skipped, as their angles are zero.
+    """
+    for level, (index, angles_y, angles_z) in enumerate(
+        zip(angle_tree.index, angle_tree.angle_y, angle_tree.angle_z)
+    ):
+        active = (angles_y != 0.0) | (angles_z != 0.0)
+        if not np.any(active):
+            continue
+        index = index[active]
+        angles_y = angles_y[active]
+        angles_z = angles_z[active]
+
+        target_qubit = level_qubits[level]
+        control_qubits = list(level_qubits[:level])
+
+        any_y = np.any(angles_y)
+        any_z = np.any(angles_z)
+        n_multiplexors = int(any_y) + int(any_z)
+        if level == 0 or 2**level * n_multiplexors <= len(index) * mcg_cnot_count(level):
+            dense_y = np.zeros(2**level)
+            dense_z = np.zeros(2**level)
+            dense_y[index] = angles_y
+            dense_z[index] = angles_z
+
+            # If both multiplexors are used (RY and RZ), we can save two CNOTs.
+            # That is why the RZ multiplexor is reversed.
+            if any_y:
+                ucry = multiplexor(RYGate, dense_y, last_control=not any_z)
+                circuit.append(ucry, [target_qubit] + control_qubits[::-1])
+
+            if any_z:
+                ucrz = multiplexor(RZGate, dense_z, last_control=not any_y)
+                circuit.append(
+                    ucrz.reverse_ops(), [target_qubit] + control_qubits[::-1]
+                )
+        else:
+            for node, angle_y, angle_z in zip(index, angles_y, angles_z):
+                gate = RZGate(angle_z).to_matrix() @ RYGate(angle_y).to_matrix()
+                circuit.append(
+                    Mcg(gate, level, ctrl_state=f"{node:0{level}b}"),
+                    [*control_qubits[::-1], target_qubit],
+                )
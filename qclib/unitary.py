@@ -17,199 +17,930 @@ This module provides access to functions to
 implement generic quantum computations.
 """
 
-from math import ceil, log2
+from math import log2
+from functools import lru_cache
 import numpy as np
 import scipy as sp
 from qiskit import QuantumCircuit, QuantumRegister, transpile
-from qiskit.circuit.library import RYGate, CZGate
-from qiskit.circuit.library import UnitaryGate, UCRYGate, UCRZGate, MCXGate, MCMT
+from qiskit.circuit.library import RYGate, CZGate, CXGate, CCXGate, C3XGate, C4XGate
+from qiskit.circuit.library import UnitaryGate, UCRYGate, UCRZGate
+from qiskit.circuit.library import DiagonalGate
 
-from qiskit.quantum_info.operators.predicates import is_unitary_matrix
-from qiskit.synthesis.unitary.qsd import _apply_a2
+from qiskit.synthesis import two_qubit_cnot_decompose
 from qiskit.circuit.library import UCGate
 from qclib.gates.ucr import multiplexor
-
-
-def unitary(gate, decomposition="qsd", iso=0, apply_a2=True):
+from qclib.gates.mcg import Mcg, mcg_cnot_count
+from qclib.util import parallel_map
+
+
+
+# The decompositions are split into independent subtrees when they act on at
+# least ``_PARALLEL_MIN_QUBITS`` qubits. The subtrees are decomposed by the
+# executor, if there is one, or serially otherwise. Both paths run the same
+# computations. With an executor, chunks of the gate list are also converted
+# into circuits concurrently.
+_PARALLEL_MIN_QUBITS = 4
+# Minimum number of subtrees (and number of gate list chunks).
+_PARALLEL_TASKS = 4
+
+# Entries below this magnitude are treated as zeros by the structure analysis.
+_STRUCTURE_ATOL = 1e-10
+
+# Largest off-diagonal entry of the QR factor in ``_cossin`` accepted by the
+# batched cosine-sine decomposition. Larger entries (sines clustered near
+# zero) fall back to ``scipy.linalg.cossin``.
+_CSD_ATOL = 1e-12
+
+# Rotations of the multiplexors below this angle are omitted. The default of
+# ``multiplexor`` (1e-8) would dominate the error of near-identity inputs.
+_ROTATION_ATOL = 1e-14
+
+# Candidates of ``decomposition='auto'``. The cost model of ``'qr'`` counts
+# every Givens rotation, which is never below ``'qsd'``, so it is not included.
+_AUTO_DECOMPOSITIONS = ("qsd", "csd")
+
+
+def unitary(
+    gate,
+    decomposition="qsd",
+    iso=0,
+    apply_a2=True,
+    executor=None,
+    depth_weight=0.0,
+    detect_structure=True,
+):  # pylint: disable=too-many-arguments
     """
     Implements a generic quantum computation from a
     unitary matrix gate using the cosine sine decomposition.
+
+    ``decomposition='auto'`` evaluates the cost model of each candidate
+    (``'qsd'`` and ``'csd'``) and synthesizes the one that minimizes
+    ``cnots + depth_weight * cnot_depth``. The decomposition used is reported
+    in ``circuit.metadata["decomposition"]``.
+
+    ``executor`` is an optional ``concurrent.futures.Executor`` (usually a
+    ``ProcessPoolExecutor``). The independent subtrees of the ``'qsd'`` and
+    ``'csd'`` decompositions, and the conversion of the gate list into a
+    circuit, are dispatched to it. The output is identical to the serial one.
+
+    Diagonal, permutation (up to phases), block-diagonal and tensor product
+    unitaries are synthesized by cheaper specialized circuits. The structure
+    found is reported in ``circuit.metadata["structure"]`` (``'diagonal'``,
+    ``'permutation'``, ``'multiplexor'``, ``'tensor'`` or ``'generic'``).
+    ``detect_structure=False`` skips this analysis and always uses the generic
+    decomposition.
     """
-    circuit = build_unitary(gate, decomposition, iso)
+    if decomposition == "auto":
+        decomposition = _auto_decomposition(
+            gate, iso, apply_a2, depth_weight, detect_structure
+        )
+
+    gate_ir = _build_gate_ir(gate, decomposition, iso, executor, detect_structure)
     if decomposition == "qsd" and apply_a2:
-        return _apply_a2(circuit)
+        _apply_a2(gate_ir)
+
+    circuit = gate_ir.to_circuit(executor)
+    circuit.metadata = {
+        "structure": gate_ir.structure,
+        "decomposition": decomposition,
+    }
 
     return circuit
 
 
-def build_unitary(gate, decomposition="qsd", iso=0):
+def build_unitary(
+    gate, decomposition="qsd", iso=0, executor=None, depth_weight=0.0, detect_structure=True
+):  # pylint: disable=too-many-arguments
     """
     Implements a generic quantum computation from a
     unitary matrix gate using the cosine sine decomposition.
     """
-    size = len(gate)
-    if decomposition != "qr" and size > 4:
-        n_qubits = int(log2(size))
+    if decomposition == "auto":
+        decomposition = _auto_decomposition(
+            gate, iso, False, depth_weight, detect_structure
+        )
+
+    gate_ir = _build_gate_ir(gate, decomposition, iso, executor, detect_structure)
+
+    circuit = gate_ir.to_circuit(executor)
+    circuit.metadata = {
+        "structure": gate_ir.structure,
+        "decomposition": decomposition,
+    }
+
+    return circuit
+
+
+def _auto_decomposition(gate, iso=0, apply_a2=True, depth_weight=0.0, detect_structure=True):
+    """
+    Candidate of ``_AUTO_DECOMPOSITIONS`` with the lowest modeled cost
+    ``cnots + depth_weight * cnot_depth`` (the first one on ties).
+    """
+    def weighted_cost(decomposition):
+        cnots, depth = _cost_gate(gate, decomposition, iso, apply_a2, detect_structure)
+        return cnots + depth_weight * np.max(depth)
+
+    return min(_AUTO_DECOMPOSITIONS, key=weighted_cost)
+
+
+class _GateList:
+    """
+    Lightweight intermediate representation of a synthesized circuit.
+
+    Flat lists of gate kinds, qubits and parameters (angles or matrices). The
+    recursive decompositions append to it, and it is converted into a
+    ``QuantumCircuit`` only once, at the end of the synthesis.
+
+    Gate kinds:
+        ``'unitary'``: two-qubit (or single-qubit) unitary. Two-qubit unitaries
+        are synthesized with the minimum number of CNOTs.
+        ``'qsd2q'``: two-qubit QSD leaf, eligible for optimization (A.2).
+        ``'circuit'``: an already synthesized ``QuantumCircuit``.
+        ``'ucry_cz'``: ``multiplexor`` of RY gates with CZ gates (last CZ omitted).
+        ``'ucry'``: ``UCRYGate``.
+        ``'ucrz'``: ``UCRZGate``.
+        ``'ucg'``: ``UCGate``.
+        ``'diagonal'``: ``DiagonalGate``.
+    The first qubit of the multiplexed gates is the target.
+    """
+
+    def __init__(self, n_qubits):
+        self.n_qubits = n_qubits
+        self.kinds = []
+        self.qubits = []
+        self.params = []
+        # Structure of the synthesized unitary (see ``_analyze_structure``).
+        self.structure = "generic"
+
+    def append(self, kind, qubits, params):
+        """
+        Appends a gate to the end of the list.
+        """
+        self.kinds.append(kind)
+        self.qubits.append(qubits)
+        self.params.append(params)
+
+    def extend(self, other, qubits):
+        """
+        Appends the gates of the list ``other``, mapping its qubit ``i`` to
+        ``qubits[i]``.
+        """
+        for kind, other_qubits, params in zip(other.kinds, other.qubits, other.params):
+            self.append(kind, [qubits[i] for i in other_qubits], params)
+
+    def chunks(self, n_chunks):
+        """
+        Splits the gate list into ``n_chunks`` consecutive gate lists.
+        """
+        bounds = np.linspace(0, len(self.kinds), n_chunks + 1).astype(int)
+        chunks = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            chunk = _GateList(self.n_qubits)
+            chunk.kinds = self.kinds[start:stop]
+            chunk.qubits = self.qubits[start:stop]
+            chunk.params = self.params[start:stop]
+            chunks.append(chunk)
+
+        return chunks
+
+    def to_circuit(self, executor=None):
+        """
+        Converts the gate list into a ``QuantumCircuit``. If ``executor`` is
+        given, the chunks of the list are converted concurrently.
+        """
+        if executor is not None and self.n_qubits >= _PARALLEL_MIN_QUBITS:
+            circuit = QuantumCircuit(self.n_qubits)
+            chunks = parallel_map(
+                _GateList._to_circuit, self.chunks(_PARALLEL_TASKS), executor
+            )
+            for chunk, _ in chunks:
+                circuit.compose(chunk, inplace=True)
+
+            # Same summation order as the serial conversion.
+            circuit.global_phase = 0.0
+            for _, phases in chunks:
+                for phase in phases:
+                    circuit.global_phase += phase
 
-        qubits = QuantumRegister(n_qubits)
-        circuit = QuantumCircuit(qubits)
+            return circuit
 
-        right_gates, theta, left_gates = sp.linalg.cossin(
-            gate, size / 2, size / 2, separate=True
+        return self._to_circuit()[0]
+
+    def _to_circuit(self):
+        # Returns the circuit and the global phases of the circuits composed
+        # into it, in order (the other gates do not carry a global phase).
+        circuit = QuantumCircuit(self.n_qubits)
+        phases = []
+        for kind, qubits, params in zip(self.kinds, self.qubits, self.params):
+            if kind in ("unitary", "qsd2q") and len(qubits) == 2:
+                leaf = _two_qubit_circuit(params)
+                phases.append(leaf.global_phase)
+                circuit.compose(leaf, qubits, inplace=True)
+            elif kind in ("unitary", "qsd2q"):
+                circuit.append(UnitaryGate(params), qubits)
+            elif kind == "circuit":
+                phases.append(params.global_phase)
+                circuit.compose(params, qubits, inplace=True)
+            elif kind == "ucry_cz":
+                # Last CZGate is ommited and absorved into the neighboring multiplexor.
+                ucry = multiplexor(RYGate, list(params), CZGate, False, atol=_ROTATION_ATOL)
+                phases.append(ucry.global_phase)
+                circuit.compose(ucry, qubits, inplace=True)
+            elif kind == "ucry":
+                circuit.append(UCRYGate(list(params)), qubits)
+            elif kind == "ucrz":
+                circuit.append(UCRZGate(list(params)), qubits)
+            elif kind == "diagonal":
+                circuit.append(DiagonalGate(list(params)), qubits)
+            else:
+                # "ucg"
+                circuit.append(UCGate(list(params)), qubits)
+
+        return circuit, phases
+
+
+def _build_gate_ir(gate, decomposition="qsd", iso=0, executor=None, detect_structure=True):
+    n_qubits = int(log2(len(gate)))
+    gate_ir = _GateList(n_qubits)
+    qubits = list(range(n_qubits))
+    if detect_structure:
+        gate_ir.structure = _build_structured(
+            gate, gate_ir, qubits, decomposition, iso, executor
         )
+    else:
+        _build_unitary(gate, gate_ir, qubits, decomposition, iso, executor=executor)
+
+    return gate_ir
+
+
+def _build_structured(gate, gate_ir, qubits, decomposition="qsd", iso=0, executor=None):
+    """
+    Appends ``gate`` to ``gate_ir`` using the specialized synthesis of its
+    structure, or the generic decomposition. Returns the structure.
+    """
+    # pylint: disable=too-many-arguments
+    if iso:
+        # Only the first columns of an isometry are defined.
+        structure, data = "generic", None
+    else:
+        structure, data = _analyze_structure(gate, decomposition)
+
+    if structure == "diagonal":
+        gate_ir.append("diagonal", qubits, data)
+
+    elif structure == "permutation":
+        permutation, phases = data
+        gate_ir.append("diagonal", qubits, phases)
+        gate_ir.append("circuit", qubits, _permutation_circuit(permutation, len(qubits)))
+
+    elif structure == "multiplexor":
+        if data.shape[-1] == 2:
+            gate_ir.append("ucg", qubits, list(data))
+        else:
+            _unitary(data, gate_ir, qubits, decomposition, executor)
+
+    elif structure == "tensor":
+        gate_high, gate_low = data
+        n_low = int(log2(len(gate_low)))
+        _build_structured(gate_low, gate_ir, qubits[:n_low], decomposition, 0, executor)
+        _build_structured(gate_high, gate_ir, qubits[n_low:], decomposition, 0, executor)
+
+    else:
+        _build_unitary(gate, gate_ir, qubits, decomposition, iso, executor=executor)
 
-        # Left circuit
+    return structure
+
+
+def _build_unitary(
+    gate, gate_ir, qubits, decomposition="qsd", iso=0, leaf="unitary", executor=None
+):  # pylint: disable=too-many-arguments
+    """
+    Appends the decomposition of ``gate`` on ``qubits`` to ``gate_ir``.
+    ``leaf`` is the kind assigned to ``gate`` if it is a two-qubit leaf.
+    """
+    size = len(gate)
+    if decomposition != "qr" and size > 4:
         if iso:
-            gate_left = build_unitary(
-                left_gates[0], decomposition=decomposition, iso=iso - 1
+            right_gates, theta, left_gates = _cossin(gate[np.newaxis])
+
+            # Left circuit
+            _build_unitary(
+                left_gates[0, 0],
+                gate_ir,
+                qubits[:-1],
+                decomposition=decomposition,
+                iso=iso - 1,
+                executor=executor,
             )
-            circuit = circuit.compose(gate_left, qubits[:-1])
-        else:
-            gate_left = _unitary(list(left_gates), n_qubits, decomposition)
-            circuit.compose(gate_left, qubits, inplace=True)
 
-        # Middle circuit
-        # Last CZGate is ommited and absorved into the neighboring multiplexor.
-        ucry = multiplexor(RYGate, list(2 * theta), CZGate, False)
+            # Middle circuit
+            # Last CZGate is ommited and absorved into the neighboring multiplexor.
+            gate_ir.append("ucry_cz", [qubits[-1]] + qubits[:-1], 2 * theta[0])
 
-        circuit.append(
-            ucry.to_instruction(), [n_qubits - 1] + list(range(n_qubits - 1))
-        )
-        # Optimization (A.1) from "Synthesis of Quantum Logic Circuits".
-        # Last CZGate from ucry is absorbed here.
-        right_gates[1][:, len(theta) // 2 :] = -right_gates[1][:, len(theta) // 2 :]
+            # Optimization (A.1) from "Synthesis of Quantum Logic Circuits".
+            # Last CZGate from ucry is absorbed here.
+            _apply_a1(right_gates)
 
-        # Right circuit
-        gate_right = _unitary(list(right_gates), n_qubits, decomposition)
-        circuit.compose(gate_right, qubits, inplace=True)
+            # Right circuit
+            _unitary(right_gates[0], gate_ir, qubits, decomposition, executor)
 
-        return circuit
-    if decomposition == "qr":
-        return _qrd(gate)
+        elif decomposition == "csd":
+            right_gates, theta, left_gates = _cossin(gate[np.newaxis])
+            _apply_a1(right_gates)
 
-    circuit = QuantumCircuit(int(log2(size)), name="qsd2q")
-    circuit.append(UnitaryGate(gate), circuit.qubits)
+            levels, leaves = _csd_tree(np.concatenate((left_gates, right_gates)), executor)
+            _emit_csd(levels, leaves, 0, 0, gate_ir, qubits)
+            gate_ir.append("ucry_cz", [qubits[-1]] + qubits[:-1], 2 * theta[0])
+            _emit_csd(levels, leaves, 0, 1, gate_ir, qubits)
 
-    return circuit
+        else:
+            levels, leaves = _qsd_tree(gate[np.newaxis], executor)
+            _emit_qsd(levels, leaves, 0, 0, gate_ir, qubits)
+
+    elif decomposition == "qr" and size > 2:
+        gate_ir.append("circuit", qubits, _qrd(gate))
 
+    else:
+        gate_ir.append(leaf, qubits, gate)
 
-def _unitary(gate_list, n_qubits, decomposition="qsd"):
 
+def _unitary(gates, gate_ir, qubits, decomposition="qsd", executor=None):
+    """
+    Appends the multiplexor of the stacked blocks ``gates`` (shape
+    ``(k, size, size)``) to ``gate_ir``.
+    """
     if decomposition == "csd":
-        if len(gate_list[0]) == 2:
-            qubits = QuantumRegister(n_qubits)
-            circuit = QuantumCircuit(qubits)
-            circuit.append(UCGate(gate_list), qubits[[0]] + qubits[1:])
-            return circuit
+        levels, leaves = _csd_tree(gates[np.newaxis], executor)
+        _emit_csd(levels, leaves, 0, 0, gate_ir, qubits)
+    else:
+        # QSD
+        _qsd(gates[0], gates[1], gate_ir, qubits, executor)
 
-        return _csd(gate_list, n_qubits)
 
-    # QSD
-    return _qsd(*gate_list)
+def _apply_a1(right_gates):
+    """
+    Optimization (A.1) from "Synthesis of Quantum Logic Circuits".
+    Absorbs the last CZGate of the ucry into the second block of the
+    stacked right multiplexors (shape ``(m, 2, size, size)``), in place.
+    """
+    half = right_gates.shape[-1] // 2
+    right_gates[:, 1, :, half:] = -right_gates[:, 1, :, half:]
+
+
+def _cossin(gates):
+    """
+    Batched cosine-sine decomposition of the stacked unitaries ``gates``
+    (shape ``(m, size, size)``), with ``p = q = size / 2``.
+
+    Returns ``(u, theta, vdh)`` such that ``gates[i]`` is
+    ``block_diag(*u[i]) @ [[C, -S], [S, C]] @ block_diag(*vdh[i])``, where
+    ``C = diag(cos(theta[i]))`` and ``S = diag(sin(theta[i]))``. The blocks
+    ``u`` and ``vdh`` have shape ``(m, 2, size/2, size/2)``.
+
+    Same convention as ``scipy.linalg.cossin(..., separate=True)``, but all
+    blocks of a recursion level are decomposed with a few vectorized calls
+    instead of one LAPACK call per block. The vectorized algorithm is not
+    backward stable when the sines cluster near zero (e.g. near-identity or
+    near block-diagonal unitaries); these blocks are detected and decomposed
+    by ``scipy.linalg.cossin``.
+    """
+    half = gates.shape[-1] // 2
+    u00 = gates[:, :half, :half]
+    u01 = gates[:, :half, half:]
+    u10 = gates[:, half:, :half]
+    u11 = gates[:, half:, half:]
+
+    # u00 = u0 C v0h, with ascending cosines (descending sines).
+    u_0, cos, v0h = np.linalg.svd(u00)
+    u_0 = u_0[:, :, ::-1]
+    cos = cos[:, ::-1]
+    v0h = v0h[:, ::-1, :]
+
+    # u10 v0h^dagger = u1 S has orthogonal columns, sorted by decreasing norm.
+    # QR gives an orthonormal u1 even when the last sines vanish.
+    q_1, r_1 = np.linalg.qr(u10 @ _dagger(v0h))
+    r_diag = np.diagonal(r_1, axis1=-2, axis2=-1)
+    sin = np.abs(r_diag)
+    phase = np.ones_like(r_diag)
+    np.divide(r_diag, sin, out=phase, where=sin > 0)
+    u_1 = q_1 * phase[:, np.newaxis, :]
+
+    # [u01; u11] = [u0 0; 0 u1] [-S; C] v1h and S^2 + C^2 = I. The projection
+    # keeps the rounding errors of the input from accumulating in v1h.
+    v1h = _closest_unitary(
+        -sin[:, :, np.newaxis] * (_dagger(u_0) @ u01)
+        + cos[:, :, np.newaxis] * (_dagger(u_1) @ u11)
+    )
+
+    theta = np.arctan2(sin, cos)
+
+    # u1 S keeps only the diagonal of r_1. The columns of u10 v0h^dagger are
+    # orthogonal up to rounding errors, which are not negligible relative to
+    # small sines; then the dropped part of r_1 is the reconstruction error.
+    unstable = np.abs(np.triu(r_1, 1)).max(axis=(-2, -1)) > _CSD_ATOL
+    for i in np.flatnonzero(unstable):
+        (u_0[i], u_1[i]), theta[i], (v0h[i], v1h[i]) = sp.linalg.cossin(
+            gates[i], p=half, q=half, separate=True
+        )
+
+    u_blocks = np.stack((u_0, u_1), axis=1)
+    vdh_blocks = np.stack((v0h, v1h), axis=1)
+
+    return u_blocks, theta, vdh_blocks
+
+
+def _dagger(matrices):
+    return np.conj(np.swapaxes(matrices, -1, -2))
 
 
 # CSD decomposition
 
 
-def _csd(gate_list, n_qubits):
+def _csd_tree(multiplexors, executor=None):
     """
-    Cosine-sine decomposition
+    Same as ``_csd_levels``, but large trees are split: only the first levels
+    are decomposed here, and the independent multiplexors below them are
+    decomposed as separate tasks (see ``_map``). Their gate lists are returned
+    as the leaves.
     """
-    left, mid, right = _multiplexed_csd(gate_list)
+    levels, nodes = _csd_levels(multiplexors, _PARALLEL_TASKS)
+    if nodes.shape[1] * nodes.shape[-1] >= 2**_PARALLEL_MIN_QUBITS and nodes.shape[-1] > 2:
+        return levels, parallel_map(_csd_subtree, list(nodes), executor)
 
-    gate_left = _unitary(left, n_qubits, decomposition="csd")
-    gate_right = _unitary(right, n_qubits, decomposition="csd")
+    sub_levels, nodes = _csd_levels(nodes)
 
-    qubits = QuantumRegister(n_qubits)
-    circuit = QuantumCircuit(qubits)
+    return levels + sub_levels, nodes
 
-    circuit = circuit.compose(gate_left, qubits)
 
-    target = int(n_qubits - log2(len(left)))
-    control = list(range(0, target)) + list(range(target + 1, n_qubits))
-    circuit.append(UCRYGate(list(mid)), [target] + control)
+def _csd_subtree(multiplexor):
+    """
+    Gate list of the multiplexor ``multiplexor`` (shape ``(k, size, size)``).
+    """
+    n_qubits = int(log2(multiplexor.shape[0] * multiplexor.shape[-1]))
+    gate_ir = _GateList(n_qubits)
+    levels, leaves = _csd_levels(multiplexor[np.newaxis])
+    _emit_csd(levels, leaves, 0, 0, gate_ir, list(range(n_qubits)))
 
-    circuit = circuit.compose(gate_right, qubits)
+    return gate_ir
 
-    return circuit
 
+def _csd_levels(multiplexors, max_nodes=None):
+    """
+    Cosine-sine decomposition of the stacked multiplexors ``multiplexors``
+    (shape ``(m, k, size, size)``), one recursion level at a time.
+
+    At each level, the blocks of all multiplexors have the same size and are
+    decomposed by a single call to ``_cossin``. Returns the ``ucry`` angles and
+    the number of blocks of each level, and the single-qubit blocks of the leaf
+    multiplexors. If ``max_nodes`` is given, stops at the first level with at
+    least ``max_nodes`` multiplexors, and returns them instead of the leaves.
+    """
+    levels = []
+    while multiplexors.shape[-1] > 2 and (
+        max_nodes is None or multiplexors.shape[0] < max_nodes
+    ):
+        n_mux, n_blocks, size = multiplexors.shape[:3]
+        half = size // 2
+
+        right_gates, theta, left_gates = _cossin(multiplexors.reshape(-1, size, size))
+
+        left = left_gates.reshape(n_mux, 2 * n_blocks, half, half)
+        right = right_gates.reshape(n_mux, 2 * n_blocks, half, half)
 
-def _multiplexed_csd(gate_list):
-    left = []
-    mid = []
-    right = []
-    size = len(gate_list[0])
-    for gate in gate_list:
-        right_gates, theta, left_gates = sp.linalg.cossin(
-            gate, size / 2, size / 2, separate=True
+        levels.append(((2 * theta).reshape(n_mux, n_blocks * half), n_blocks))
+        multiplexors = np.stack((left, right), axis=1).reshape(
+            2 * n_mux, 2 * n_blocks, half, half
         )
 
-        left = left + list(left_gates)
-        right = right + list(right_gates)
-        mid = mid + list(2 * theta)
+    return levels, multiplexors
+
+
+def _emit_csd(levels, leaves, level, index, gate_ir, qubits):
+    """
+    Appends the multiplexor ``index`` of the recursion ``level`` to ``gate_ir``.
+    """
+    if level == len(levels):
+        if isinstance(leaves[index], _GateList):
+            gate_ir.extend(leaves[index], qubits)
+        else:
+            gate_ir.append("ucg", qubits, list(leaves[index]))
+        return
+
+    angles, n_blocks = levels[level]
+    mid = angles[index]
 
-    return left, mid, right
+    n_qubits = len(qubits)
+    target = int(n_qubits - log2(2 * n_blocks))
+    control = list(range(0, target)) + list(range(target + 1, n_qubits))
+
+    _emit_csd(levels, leaves, level + 1, 2 * index, gate_ir, qubits)
+
+    gate_ir.append("ucry", [qubits[target]] + [qubits[i] for i in control], mid)
+
+    _emit_csd(levels, leaves, level + 1, 2 * index + 1, gate_ir, qubits)
 
 
 # QSD decomposition
 
 
-def _qsd(gate1, gate2):
+def _qsd(gate1, gate2, gate_ir, qubits, executor=None):
     """
     Quantum Shannon Decomposition
     Shende, V. V., S. S. Bullock, and I. L. Markov. "Synthesis of quantum-logic circuits.
     " IEEE Transactions on Computer-Aided Design of Integrated Circuits and Systems 25.6
     (2006): 1000-1010.
     """
-    n_qubits = int(log2(len(gate1))) + 1
-    qubits = QuantumRegister(n_qubits)
-    circuit = QuantumCircuit(qubits)
-
     list_d, gate_v, gate_w = _compute_gates(gate1, gate2)
 
+    levels, leaves = _qsd_tree(np.stack((gate_w, gate_v)), executor)
+
     # Left circuit
-    left_gate = build_unitary(gate_w, "qsd")
-    circuit.append(left_gate.to_instruction(), qubits[0:-1])
+    _emit_qsd(levels, leaves, 0, 0, gate_ir, qubits[:-1])
 
     # Middle circuit
-    circuit.append(UCRZGate(list(-2 * np.angle(list_d))), qubits[[-1]] + qubits[0:-1])
+    gate_ir.append("ucrz", [qubits[-1]] + qubits[:-1], -2 * np.angle(list_d))
 
     # Right circuit
-    right_gate = build_unitary(gate_v, "qsd")
-    circuit.append(right_gate.to_instruction(), qubits[0:-1])
+    _emit_qsd(levels, leaves, 0, 1, gate_ir, qubits[:-1])
+
+
+def _qsd_tree(gates, executor=None):
+    """
+    Same as ``_qsd_levels``, but large trees are split: only the first levels
+    are decomposed here, and the independent unitaries below them are
+    decomposed as separate tasks (see ``_map``). Their gate lists are returned
+    as the leaves.
+    """
+    levels, nodes = _qsd_levels(gates, _PARALLEL_TASKS)
+    if nodes.shape[-1] >= 2**_PARALLEL_MIN_QUBITS:
+        return levels, parallel_map(_qsd_subtree, list(nodes), executor)
+
+    sub_levels, nodes = _qsd_levels(nodes)
+
+    return levels + sub_levels, nodes
+
+
+def _qsd_subtree(gate):
+    """
+    Gate list of the unitary ``gate``.
+    """
+    n_qubits = int(log2(gate.shape[-1]))
+    gate_ir = _GateList(n_qubits)
+    levels, leaves = _qsd_levels(gate[np.newaxis])
+    _emit_qsd(levels, leaves, 0, 0, gate_ir, list(range(n_qubits)))
+
+    return gate_ir
+
+
+def _qsd_levels(gates, max_nodes=None):
+    """
+    Quantum Shannon Decomposition of the stacked unitaries ``gates`` (shape
+    ``(m, size, size)``), one recursion level at a time.
+
+    Each level decomposes all of its blocks (which have the same size) with a
+    single call to ``_cossin`` and a single call to ``_compute_gates``. Returns
+    the ``ucry`` and ``ucrz`` angles of each level and the two-qubit leaves,
+    stacked in the order in which they are applied. If ``max_nodes`` is given,
+    stops at the first level with at least ``max_nodes`` unitaries, and returns
+    them instead of the leaves.
+    """
+    levels = []
+    while gates.shape[-1] > 4 and (max_nodes is None or gates.shape[0] < max_nodes):
+        n_gates = gates.shape[0]
+        half = gates.shape[-1] // 2
+
+        right_gates, theta, left_gates = _cossin(gates)
+        _apply_a1(right_gates)
+
+        # Demultiplexes the left and right multiplexors of every gate.
+        pairs = np.stack((left_gates, right_gates), axis=1).reshape(-1, 2, half, half)
+        list_d, gate_v, gate_w = _compute_gates(pairs[:, 0], pairs[:, 1])
+
+        levels.append(
+            (2 * theta, (-2 * np.angle(list_d)).reshape(n_gates, 2, half))
+        )
+        gates = np.stack((gate_w, gate_v), axis=1).reshape(-1, half, half)
+
+    return levels, gates
+
+
+def _emit_qsd(levels, leaves, level, index, gate_ir, qubits):
+    """
+    Appends the unitary ``index`` of the recursion ``level`` to ``gate_ir``.
+    """
+    if level == len(levels):
+        if isinstance(leaves[index], _GateList):
+            gate_ir.extend(leaves[index], qubits)
+        else:
+            gate_ir.append("qsd2q", qubits, leaves[index])
+        return
+
+    theta, angles = levels[level]
+    multiplexed = [qubits[-1]] + qubits[:-1]
+
+    for side in range(2):
+        if side:
+            # Last CZGate is ommited and absorved into the neighboring multiplexor.
+            gate_ir.append("ucry_cz", multiplexed, theta[index])
+
+        child = 4 * index + 2 * side
+        _emit_qsd(levels, leaves, level + 1, child, gate_ir, qubits[:-1])
+        gate_ir.append("ucrz", multiplexed, angles[index, side])
+        _emit_qsd(levels, leaves, level + 1, child + 1, gate_ir, qubits[:-1])
+
+
+def _apply_a2(gate_ir):
+    """
+    Optimization (A.2) from "Synthesis of Quantum Logic Circuits".
+    Decomposes each two-qubit QSD leaf into a diagonal gate and a two-CNOT
+    unitary. The diagonal is absorbed into the next two-qubit leaf, saving
+    ``4**(n_qubits-2)-1`` CNOTs. It operates in place on the gate list.
+    Leaves on different qubits (factors of a tensor product) are rolled over
+    separately.
+    """
+    groups = {}
+    for i, kind in enumerate(gate_ir.kinds):
+        if kind == "qsd2q":
+            groups.setdefault(tuple(gate_ir.qubits[i]), []).append(i)
+
+    for indexes in groups.values():
+        _apply_a2_leaves(gate_ir, indexes)
 
-    return circuit
+
+def _apply_a2_leaves(gate_ir, indexes):
+    if len(indexes) == 1:
+        # No neighbors to merge the diagonal into.
+        gate_ir.kinds[indexes[0]] = "unitary"
+
+    if len(indexes) < 2:
+        return
+
+    # Rolling over diagonals.
+    for ind1, ind2 in zip(indexes[:-1], indexes[1:]):
+        gate_ir.kinds[ind1] = "circuit"
+        if _two_qubit_cnots(gate_ir.params[ind1]) < 2:
+            # Already cheaper than the two CNOTs of the decomposition up to a
+            # diagonal. Nothing to roll over.
+            gate_ir.params[ind1] = _two_qubit_circuit(gate_ir.params[ind1])
+            continue
+
+        diag, circuit = _two_qubit_up_to_diagonal(gate_ir.params[ind1])
+        gate_ir.params[ind1] = circuit
+        gate_ir.params[ind2] = gate_ir.params[ind2] @ diag
+
+    last = indexes[-1]
+    gate_ir.kinds[last] = "circuit"
+    gate_ir.params[last] = _two_qubit_circuit(gate_ir.params[last])
+
+
+# Two-qubit unitaries
+
+
+_SIGMA_YY = np.fliplr(np.diag([-1.0, 1.0, 1.0, -1.0]))
+
+
+def _two_qubit_cnots(gate, atol=1e-9):
+    """
+    Minimum number of CNOTs to implement the two-qubit unitary ``gate``,
+    from the invariants of ``gamma(u) = u (Y x Y) u^T (Y x Y)``, with
+    ``u = gate / det(gate)^(1/4)``.
+    Shende, V. V., I. L. Markov, and S. S. Bullock. "Recognizing small-circuit
+    structure in two-qubit operators." Physical Review A 70.1 (2004): 012310.
+    """
+    special = gate / complex(np.linalg.det(gate)) ** 0.25
+    gamma = special @ _SIGMA_YY @ special.T @ _SIGMA_YY
+    trace = np.trace(gamma)
+
+    if np.isclose(trace, 4, rtol=0, atol=atol) or np.isclose(trace, -4, rtol=0, atol=atol):
+        # Local unitary.
+        return 0
+    if np.isclose(trace, 0, rtol=0, atol=atol) and np.isclose(
+        np.trace(gamma @ gamma), -4, rtol=0, atol=atol
+    ):
+        return 1
+    if np.isclose(trace.imag, 0, rtol=0, atol=atol):
+        return 2
+
+    return 3
+
+
+def _two_qubit_circuit(gate):
+    """
+    KAK (Weyl chamber) synthesis of the two-qubit unitary ``gate``, which
+    uses the minimum number of CNOTs (see ``_two_qubit_cnots``).
+    """
+    return two_qubit_cnot_decompose(gate)
+
+
+def _two_qubit_up_to_diagonal(gate):
+    """
+    Decomposes the two-qubit unitary ``gate`` as ``diag @ circuit``, where
+    ``diag`` is a diagonal matrix and ``circuit`` has two CNOTs. The diagonal
+    is chosen so that ``gamma`` of ``diag^dagger @ gate`` has a real trace.
+    Shende, V. V., I. L. Markov, and S. S. Bullock. "Minimal universal
+    two-qubit controlled-NOT-based circuits." Physical Review A 69.6 (2004):
+    062321.
+    """
+    scale = complex(np.linalg.det(gate)) ** -0.25
+    special = gate * scale
+
+    a_1 = (
+        -special[1, 3] * special[2, 0]
+        + special[1, 2] * special[2, 1]
+        + special[1, 1] * special[2, 2]
+        - special[1, 0] * special[2, 3]
+    )
+    a_2 = (
+        special[0, 3] * special[3, 0]
+        - special[0, 2] * special[3, 1]
+        - special[0, 1] * special[3, 2]
+        + special[0, 0] * special[3, 3]
+    )
+    psi = np.arctan2(a_1.imag + a_2.imag, a_1.real - a_2.real)
+    phases = np.exp(-1j * np.array([0.0, 0.0, psi, -psi]))
+
+    circuit = two_qubit_cnot_decompose(phases[:, np.newaxis] * special)
+    circuit.global_phase -= np.angle(scale)
+
+    return np.diag(phases.conj()), circuit
 
 
 def _closest_unitary(matrix):
     svd_u, _, svd_v = np.linalg.svd(matrix)
-    return svd_u.dot(svd_v)
+    return svd_u @ svd_v
 
 
 def _compute_gates(gate1, gate2):
-
-    d_square, gate_v = np.linalg.eig(gate1 @ gate2.conj().T)
+    """
+    Demultiplexes ``gate1 (+) gate2`` as ``(V (+) V)(D (+) D^dagger)(W (+) W)``.
+    Accepts single matrices or stacks of matrices (shape ``(m, size, size)``),
+    decomposed by a single batched eigendecomposition.
+    """
+    d_square, gate_v = np.linalg.eig(gate1 @ _dagger(gate2))
     list_d = np.sqrt(d_square, dtype=complex)
-    gate_d = np.diag(list_d)
 
-    if not is_unitary_matrix(gate_v):
-        # degeneracy
-        gate_v = _closest_unitary(gate_v)
+    # The eigenvectors are orthogonal only up to the eigenvalue gaps (or not
+    # at all under degeneracy). The projection stops the error from growing
+    # along the recursion levels.
+    gate_v = _closest_unitary(gate_v)
 
-    gate_w = gate_d @ gate_v.conj().T @ gate2
+    gate_w = list_d[..., :, np.newaxis] * (_dagger(gate_v) @ gate2)
 
     return list_d, gate_v, gate_w
 
 
-def cnot_count(gate, decomposition="qsd", method="estimate", iso=0, apply_a2=True):
+# Structure analysis
+
+
+def _analyze_structure(gate, decomposition="qsd"):
+    """
+    Cheap structural analysis of the unitary ``gate``. Returns the pair
+    ``(structure, data)``:
+        ``'diagonal'``: the phases of the diagonal.
+        ``'permutation'``: ``(permutation, phases)``, where ``gate`` maps the
+        basis state ``j`` to ``phases[j]`` times the basis state
+        ``permutation[j]``. Only if its circuit is cheaper than the generic one.
+        ``'multiplexor'``: the stacked diagonal blocks. Blocks of size two (any
+        decomposition) or two blocks selected by the most significant qubit
+        (``'qsd'`` and ``'csd'``).
+        ``'tensor'``: ``(gate_high, gate_low)``, with
+        ``gate = kron(gate_high, gate_low)``.
+        ``'generic'``: ``None``.
+    Two-qubit unitaries are always ``'generic'``, as their KAK synthesis is
+    already optimal.
+    """
+    size = len(gate)
+    if size < 8:
+        return "generic", None
+
+    n_qubits = int(log2(size))
+    nonzero = np.abs(gate) > _STRUCTURE_ATOL
+    index = np.arange(size)
+
+    if not np.any(nonzero[index[:, np.newaxis] != index]):
+        return "diagonal", _phases(np.diagonal(gate))
+
+    if np.all(np.sum(nonzero, axis=0) == 1):
+        permutation = np.argmax(nonzero, axis=0)
+        phases = _phases(gate[permutation, index])
+        cost = _cost_permutation(tuple(permutation))[0] + _primitive("diagonal", n_qubits)[0]
+        if cost < _cost(n_qubits, decomposition, 0, True)[0]:
+            return "permutation", (permutation, phases)
+
+    if not np.any(nonzero[(index[:, np.newaxis] >> 1) != (index >> 1)]):
+        block_index = np.arange(size // 2)
+        blocks = gate.reshape(size // 2, 2, size // 2, 2)[block_index, :, block_index]
+        return "multiplexor", blocks
+
+    half = size // 2
+    if (
+        decomposition != "qr"
+        and not np.any(nonzero[:half, half:])
+        and not np.any(nonzero[half:, :half])
+    ):
+        return "multiplexor", np.stack((gate[:half, :half], gate[half:, half:]))
+
+    for n_low in range(1, n_qubits):
+        factors = _tensor_factors(gate, n_low)
+        if factors is not None:
+            return "tensor", factors
+
+    return "generic", None
+
+
+def _phases(values):
+    return np.exp(1j * np.angle(values))
+
+
+def _tensor_factors(gate, n_low):
+    """
+    Factors ``(gate_high, gate_low)`` of ``gate = kron(gate_high, gate_low)``,
+    where ``gate_low`` acts on the ``n_low`` least significant qubits, or
+    ``None`` if there are no such factors. ``gate`` is a tensor product if,
+    and only if, its realignment has rank one.
+    """
+    low = 2**n_low
+    high = len(gate) // low
+    realigned = (
+        gate.reshape(high, low, high, low).transpose(0, 2, 1, 3).reshape(high**2, low**2)
+    )
+
+    row, col = np.unravel_index(np.argmax(np.abs(realigned)), realigned.shape)
+    gate_high = realigned[:, col]
+    gate_low = realigned[row, :] / realigned[row, col]
+    if not np.allclose(np.outer(gate_high, gate_low), realigned, rtol=0, atol=_STRUCTURE_ATOL):
+        return None
+
+    gate_high = gate_high.reshape(high, high)
+    gate_low = gate_low.reshape(low, low)
+
+    # Both factors unitary.
+    scale = np.linalg.norm(gate_low) / np.sqrt(low)
+
+    return gate_high * scale, gate_low / scale
+
+
+def _transpositions(permutation):
+    """
+    Transpositions of basis states that, applied in order, map each basis
+    state ``j`` to ``permutation[j]``.
+    """
+    visited = np.zeros(len(permutation), dtype=bool)
+    transpositions = []
+    for start in range(len(permutation)):
+        visited[start] = True
+        image = permutation[start]
+        while not visited[image]:
+            transpositions.append((start, image))
+            visited[image] = True
+            image = permutation[image]
+
+    return transpositions
+
+
+def _permutation_circuit(permutation, n_qubits):
+    """
+    Permutation network of basis states. Each transposition is a two-level
+    X gate (see ``_qr_rotation_ops``).
+    """
+    circuit = QuantumCircuit(n_qubits)
+    for first, second in _transpositions(permutation):
+        for kind, qubits in _qr_rotation_ops(max(first, second), min(first, second), n_qubits):
+            if kind == "x":
+                circuit.x(qubits)
+            else:
+                # The two-level X gate is also a multicontrolled X gate.
+                circuit.append(_mcx_gate(n_qubits - 1), qubits)
+
+    return circuit
+
+
+def cnot_count(
+    gate, decomposition="qsd", method="estimate", iso=0, apply_a2=True, detect_structure=True
+):  # pylint: disable=too-many-arguments
     """
     Count the number of CNOTs to decompose the unitary.
+
+    ``method='estimate'`` evaluates the analytic cost model, without building
+    the circuit. It is exact for ``'qsd'`` and ``'csd'`` when the two-qubit
+    blocks of the decomposition are generic (it is an upper bound otherwise).
+    It is exact for ``'qr'``, whose multicontrolled gates do not depend on the
+    rotation angles, except when the last rotation of the QR decomposition is
+    the identity (e.g. some real orthogonal matrices). That rotation is not
+    synthesized, so the estimate exceeds the count by
+    ``4 * (n - 1) * (n - 2) + 2`` CNOTs (``n`` qubits).
+    ``method='exact'`` synthesizes and transpiles the circuit.
+    ``decomposition='auto'`` counts the decomposition chosen by ``unitary``.
+    ``detect_structure`` has the same meaning as in ``unitary``.
     """
+    if decomposition == "auto":
+        decomposition = _auto_decomposition(gate, iso, apply_a2, 0.0, detect_structure)
+
     if method == "estimate":
-        return _cnot_count_estimate(gate, decomposition, iso, apply_a2)
+        return _cnot_count_estimate(gate, decomposition, iso, apply_a2, detect_structure)
 
     # Exact count
-    circuit = unitary(gate, decomposition, iso, apply_a2)
+    circuit = unitary(gate, decomposition, iso, apply_a2, detect_structure=detect_structure)
     transpiled_circuit = transpile(
         circuit, basis_gates=["u", "cx"], optimization_level=0
     )
@@ -220,76 +951,390 @@ def cnot_count(gate, decomposition="qsd", method="estimate", iso=0, apply_a2=Tru
     return 0
 
 
-def _cnot_count_estimate(gate, decomposition="qsd", iso=0, apply_a2=True):
+def cnot_depth(
+    gate, decomposition="qsd", method="estimate", iso=0, apply_a2=True, detect_structure=True
+):  # pylint: disable=too-many-arguments
+    """
+    Count the number of CNOT layers (depth of the CNOT gates) to decompose
+    the unitary. See ``cnot_count`` for the description of ``method``. The
+    estimate is exact for ``'qsd'`` and ``'csd'`` under the same conditions
+    as ``cnot_count``. For ``'qr'`` (and for unitaries synthesized as
+    permutations), every multicontrolled gate is counted as a chain of all its
+    CNOTs, so the estimate is an upper bound.
+    """
+    if decomposition == "auto":
+        decomposition = _auto_decomposition(gate, iso, apply_a2, 0.0, detect_structure)
+
+    if method == "estimate":
+        return _cnot_depth_estimate(gate, decomposition, iso, apply_a2, detect_structure)
+
+    # Exact depth
+    circuit = unitary(gate, decomposition, iso, apply_a2, detect_structure=detect_structure)
+    transpiled_circuit = transpile(
+        circuit, basis_gates=["u", "cx"], optimization_level=0
+    )
+    return transpiled_circuit.depth(
+        filter_function=lambda instruction: instruction.operation.name == "cx"
+    )
+
+
+def cnot_cost(gate, decomposition="qsd", iso=0, apply_a2=True, detect_structure=True):
+    """
+    Estimated ``(cnot_count, cnot_depth)`` of the decomposition of the
+    unitary, evaluated together by the cost model (see ``cnot_count`` and
+    ``cnot_depth``).
+    """
+    if decomposition == "auto":
+        decomposition = _auto_decomposition(gate, iso, apply_a2, 0.0, detect_structure)
+
+    cnots, depth = _cost_gate(gate, decomposition, iso, apply_a2, detect_structure)
+    return cnots, int(np.max(depth))
+
+
+def cnot_count_generic(n_qubits, decomposition="qsd", iso=0, apply_a2=True):
+    """
+    Estimated number of CNOTs to decompose a generic unitary on ``n_qubits``
+    qubits, from its size only. ``iso`` and ``apply_a2`` have the same meaning
+    as in ``unitary``.
+    """
+    return _cost(n_qubits, decomposition, iso, apply_a2)[0]
+
+
+def _cnot_count_estimate(gate, decomposition="qsd", iso=0, apply_a2=True, detect_structure=True):
     """
     Estimate the number of CNOTs to decompose the unitary.
     """
+    return _cost_gate(gate, decomposition, iso, apply_a2, detect_structure)[0]
+
+
+def _cnot_depth_estimate(gate, decomposition="qsd", iso=0, apply_a2=True, detect_structure=True):
+    """
+    Estimate the CNOT depth of the unitary decomposition.
+    """
+    return int(np.max(_cost_gate(gate, decomposition, iso, apply_a2, detect_structure)[1]))
+
+
+def _cost_gate(gate, decomposition="qsd", iso=0, apply_a2=True, detect_structure=True):
+    """
+    Cost of the synthesis of ``gate``, following the same structure analysis
+    as ``_build_structured``. Two-qubit unitaries are classified by the number
+    of CNOTs they need. The leaves inside the recursion are assumed generic.
+    """
     n_qubits = int(log2(gate.shape[0]))
+    qubits = list(range(n_qubits))
+
+    if n_qubits == 2 and decomposition != "qr":
+        # Iso or not, the two-qubit gate is a single leaf.
+        return _cost_two_qubit(_two_qubit_cnots(gate))
+
+    if iso or not detect_structure:
+        structure, data = "generic", None
+    else:
+        structure, data = _analyze_structure(gate, decomposition)
+
+    if structure == "diagonal":
+        return _primitive("diagonal", n_qubits)
+
+    if structure == "permutation":
+        return _cost_sequence(
+            n_qubits,
+            [
+                (_primitive("diagonal", n_qubits), qubits),
+                (_cost_permutation(tuple(data[0])), qubits),
+            ],
+        )
+
+    if structure == "multiplexor":
+        if data.shape[-1] == 2:
+            return _primitive("ucg", n_qubits)
+
+        apply_a2 = decomposition == "qsd" and apply_a2
+        return _cost_unitary(n_qubits, 2, decomposition, apply_a2, True)
+
+    if structure == "tensor":
+        gate_high, gate_low = data
+        n_low = int(log2(len(gate_low)))
+        return _cost_sequence(
+            n_qubits,
+            [
+                (_cost_gate(gate_low, decomposition, 0, apply_a2), qubits[:n_low]),
+                (_cost_gate(gate_high, decomposition, 0, apply_a2), qubits[n_low:]),
+            ],
+        )
+
+    return _cost(n_qubits, decomposition, iso, apply_a2)
+
+
+# Cost model
+#
+# The cost of a block of gates is the pair ``(cnots, depth)``, where ``depth`` is
+# a max-plus matrix: ``depth[p, q]`` is the number of CNOTs in the longest path
+# that enters the block through qubit ``p`` and leaves it through qubit ``q``
+# (``-inf`` if there is none). The cost of a sequence of blocks is the sum of the
+# CNOTs and the max-plus product of the matrices. The recursion of ``unitary`` is
+# mirrored and memoized on the number of qubits, so the cost does not depend on
+# the synthesis of the circuit. The costs of the primitive gates (multiplexors,
+# two-qubit leaves and multicontrolled gates) are closed-form functions of their
+# number of qubits (see ``_primitive``).
+
+
+@lru_cache(maxsize=None)
+def _cost(n_qubits, decomposition="qsd", iso=0, apply_a2=True):
+    if decomposition == "auto":
+        return min(
+            (_cost(n_qubits, dec, iso, apply_a2) for dec in _AUTO_DECOMPOSITIONS),
+            key=lambda cost: cost[0],
+        )
 
     if n_qubits == 1:
-        return 0
+        return _primitive("unitary", 1)
 
-    if n_qubits == 2:
-        return 3
+    if decomposition == "qr":
+        return _cost_qr(n_qubits)
 
-    if decomposition == "csd":
-        # Table 1 from "Synthesis of Quantum Logic Circuits", Shende et al.
-        return int(ceil(4**n_qubits - 2 * 2**n_qubits)) - 1
+    # Optimization (A.2) only applies to the QSD.
+    apply_a2 = decomposition == "qsd" and apply_a2
 
-    if iso:
-        # Replace this recursion with a mathematical expression.
-        last_2q_gate_cnot = 1 if apply_a2 else 0
-        return _cnot_count_iso(n_qubits, iso, apply_a2) + last_2q_gate_cnot
-
-    # Upper-bound expression for the unitary decomposition QSD
-    # Table 1 from "Synthesis of Quantum Logic Circuits", Shende et al.
-    if apply_a2:
-        # l=2 with optimizations (A.1) and (A.2) from "Synthesis of Quantum Logic Circuits".
-        return int(ceil((23 / 48) * 2 ** (2 * n_qubits) - 3 / 2 * 2**n_qubits + 4 / 3))
-
-    # l=2 only with optimization (A.1).
-    # Optimization (A.2) counts 4**(n_qubits-2)-1 CNOT gates.
-    return (
-        4 ** (n_qubits - 2)
-        - 1
-        + int(ceil((23 / 48) * 2 ** (2 * n_qubits) - 3 / 2 * 2**n_qubits + 4 / 3))
-    )
+    # The last two-qubit leaf of the circuit absorbs the diagonal of the previous
+    # ones and keeps its three CNOTs.
+    return _cost_build_unitary(n_qubits, decomposition, iso, apply_a2, "unitary", True)
 
 
-def _cnot_count_iso(n_qubits, iso, apply_a2=True):
+@lru_cache(maxsize=None)
+def _cost_build_unitary(n_qubits, decomposition, iso, apply_a2, leaf, last):
+    # pylint: disable=too-many-arguments
     if n_qubits > 2:
-        # Left circuit
+        qubits = list(range(n_qubits))
         if iso:
-            iso_cnot = 1 if n_qubits - 1 == 2 else 0
-            gate_left = _cnot_count_iso(n_qubits - 1, iso - 1, apply_a2) + iso_cnot
+            left = _cost_build_unitary(
+                n_qubits - 1, decomposition, iso - 1, apply_a2, "unitary", False
+            ), qubits[:-1]
         else:
-            gate_left = _cnot_count_iso_qsd(n_qubits, apply_a2)
+            left = _cost_unitary(n_qubits, 2, decomposition, apply_a2, False), qubits
 
-        # Middle circuit
-        ucry = 2 ** (n_qubits - 1) - 1
+        middle = _primitive("ucry_cz", n_qubits), qubits[-1:] + qubits[:-1]
 
-        # Right circuit
-        gate_right = _cnot_count_iso_qsd(n_qubits, apply_a2)
+        right = _cost_unitary(n_qubits, 2, decomposition, apply_a2, last), qubits
 
-        return gate_left + ucry + gate_right
+        return _cost_sequence(n_qubits, [left, middle, right])
 
-    if apply_a2:
-        return 2
+    if leaf == "qsd2q" and apply_a2:
+        if last:
+            return _primitive("a2_last", n_qubits)
+        return _primitive("a2", n_qubits)
 
-    return 3
+    return _primitive("unitary", n_qubits)
 
 
-def _cnot_count_iso_qsd(n_qubits, apply_a2):
-    # Left circuit
-    left_gate = _cnot_count_iso(n_qubits - 1, 0, apply_a2)
+@lru_cache(maxsize=None)
+def _cost_unitary(n_qubits, n_blocks, decomposition, apply_a2, last):
+    # Cost of ``_unitary`` for a list of ``n_blocks`` gates.
+    qubits = list(range(n_qubits))
 
-    # Middle circuit
-    middle_gate = 2 ** (n_qubits - 1)
+    if decomposition == "csd":
+        if 2**n_qubits // n_blocks == 2:
+            return _primitive("ucg", n_qubits)
+
+        target = int(n_qubits - log2(2 * n_blocks))
+        control = qubits[:target] + qubits[target + 1 :]
+
+        left = _cost_unitary(n_qubits, 2 * n_blocks, decomposition, apply_a2, False)
+        middle = _primitive("ucry", n_qubits)
+        right = _cost_unitary(n_qubits, 2 * n_blocks, decomposition, apply_a2, False)
+
+        return _cost_sequence(
+            n_qubits, [(left, qubits), (middle, [target] + control), (right, qubits)]
+        )
+
+    # QSD
+    left = _cost_build_unitary(n_qubits - 1, "qsd", 0, apply_a2, "qsd2q", False)
+    middle = _primitive("ucrz", n_qubits)
+    right = _cost_build_unitary(n_qubits - 1, "qsd", 0, apply_a2, "qsd2q", last)
+
+    return _cost_sequence(
+        n_qubits,
+        [(left, qubits[:-1]), (middle, qubits[-1:] + qubits[:-1]), (right, qubits[:-1])]
+    )
+
+
+@lru_cache(maxsize=None)
+def _cost_qr(n_qubits):
+    size = 2**n_qubits
+
+    # The remaining diagonal (up to numerical noise) is applied as a rotation
+    # between the two last basis states, followed by the Givens rotations.
+    pairs = [(size - 1, size - 2)] + [
+        (row, col)
+        for col in reversed(range(size - 1))
+        for row in reversed(range(col + 1, size))
+    ]
+
+    blocks = []
+    for row, col in pairs:
+        for kind, qubits in _qr_rotation_ops(row, col, n_qubits):
+            if kind == "x":
+                blocks.extend((_primitive("x", 1), [qubit]) for qubit in qubits)
+            else:
+                blocks.append((_primitive(kind, n_qubits), qubits))
+
+    return _cost_sequence(n_qubits, blocks)
+
+
+def _cost_two_qubit(cnots):
+    depth_matrix = _max_plus_identity(2)
+    if cnots:
+        depth_matrix[:, :] = cnots
+
+    return cnots, depth_matrix
+
+
+@lru_cache(maxsize=None)
+def _cost_permutation(permutation):
+    n_qubits = int(log2(len(permutation)))
+
+    blocks = []
+    for first, second in _transpositions(permutation):
+        for kind, qubits in _qr_rotation_ops(max(first, second), min(first, second), n_qubits):
+            if kind == "x":
+                blocks.extend((_primitive("x", 1), [qubit]) for qubit in qubits)
+            else:
+                blocks.append((_primitive("mcx", n_qubits), qubits))
+
+    return _cost_sequence(n_qubits, blocks)
+
+
+def _cost_sequence(n_qubits, blocks):
+    """
+    Cost of a sequence of ``(cost, qubits)`` blocks on ``n_qubits``.
+    """
+    cnots = 0
+    depth_matrix = _max_plus_identity(n_qubits)
+    for (block_cnots, block_depth), qubits in blocks:
+        embedded = _max_plus_identity(n_qubits)
+        embedded[np.ix_(qubits, qubits)] = block_depth
+
+        cnots += block_cnots
+        depth_matrix = np.max(depth_matrix[:, :, None] + embedded[None, :, :], axis=1)
+
+    return cnots, depth_matrix
+
+
+def _max_plus_identity(n_qubits):
+    identity = np.full((n_qubits, n_qubits), -np.inf)
+    np.fill_diagonal(identity, 0.0)
+    return identity
+
+
+@lru_cache(maxsize=None)
+def _primitive(kind, n_qubits):
+    """
+    Closed-form cost of a primitive gate with generic parameters. The first
+    qubit of the multiplexed gates is the target. The last qubit of the
+    multicontrolled gates is the target.
+    """
+    qubits = list(range(n_qubits))
+
+    if kind == "x" or n_qubits == 1:
+        return 0, _max_plus_identity(n_qubits)
+
+    if kind in _TWO_QUBIT_CNOTS:
+        return _cost_two_qubit(_TWO_QUBIT_CNOTS[kind])
+
+    if kind in ("ucry", "ucrz"):
+        return _cost_multiplexor(n_qubits, True)
+
+    if kind == "ucry_cz":
+        # The last CZ is omitted.
+        return _cost_multiplexor(n_qubits, False)
+
+    if kind == "diagonal":
+        # ``DiagonalGate``: a RZ multiplexor on the first qubit followed by the
+        # diagonal of the remaining qubits.
+        return _cost_sequence(
+            n_qubits,
+            [
+                (_cost_multiplexor(n_qubits, True), qubits),
+                (_primitive("diagonal", n_qubits - 1), qubits[1:]),
+            ],
+        )
+
+    if kind == "ucg":
+        # ``UCGate``: a multiplexor without the last CNOT followed by the
+        # diagonal it leaves.
+        return _cost_sequence(
+            n_qubits,
+            [
+                (_cost_multiplexor(n_qubits, False), qubits),
+                (_primitive("diagonal", n_qubits), qubits),
+            ],
+        )
+
+    # "mcx" and "mcmt". The depth is bounded by the CNOT count.
+    if kind == "mcx":
+        cnots = _mcx_cnots(n_qubits - 1)
+    else:
+        cnots = mcg_cnot_count(n_qubits - 1, special_unitary=False)
+
+    return cnots, np.full((n_qubits, n_qubits), float(cnots))
 
-    # Right circuit
-    right_gate = _cnot_count_iso(n_qubits - 1, 0, apply_a2)
 
-    return left_gate + middle_gate + right_gate
+# Generic two-qubit leaves: KAK synthesis ('unitary' and 'a2_last') and up to a
+# diagonal ('a2').
+_TWO_QUBIT_CNOTS = {"unitary": 3, "a2": 2, "a2_last": 3}
+
+
+def _cost_multiplexor(n_qubits, last_control):
+    """
+    Cost of a multiplexed rotation with the target on the first qubit. Its
+    CNOTs follow the Gray code: the ``i``-th CNOT (from 1) is controlled by
+    the qubit ``1 + v(i)``, where ``v(i)`` is the number of trailing zeros of
+    ``i``, and the last one by the last qubit. So, the qubit ``j`` is first
+    used by the CNOT ``2**(j-1) - 1`` and lastly by the CNOT
+    ``2**k - 2**(j-1) - 1`` (from 0), with ``k = n_qubits - 1`` controls.
+    Every CNOT targets the first qubit, so the longest path from ``p`` to
+    ``q`` goes from the first CNOT of ``p`` to the last CNOT of ``q``.
+    """
+    size = 2 ** (n_qubits - 1)
+    cnots = size if last_control else size - 1
+
+    controls = np.arange(1, n_qubits)
+    first = 2 ** (controls - 1) - 1
+    last = size - 2 ** (controls - 1) - 1
+    if last_control:
+        last[-1] = size - 1
+
+    depth_matrix = _max_plus_identity(n_qubits)
+    depth_matrix[0, 0] = cnots
+    depth_matrix[controls, 0] = cnots - first
+    depth_matrix[0, controls] = last + 1
+    depth_matrix[np.ix_(controls, controls)] = np.where(
+        last[np.newaxis, :] >= first[:, np.newaxis],
+        last[np.newaxis, :] - first[:, np.newaxis] + 1,
+        -np.inf,
+    )
+
+    return cnots, depth_matrix
+
+
+def _mcx_cnots(n_controls):
+    """
+    CNOT count of ``_mcx_gate``: Toffoli gates up to four controls and the
+    U(2) decomposition of ``Mcg`` beyond that.
+    """
+    return {0: 0, 1: 1, 2: 6, 3: 14, 4: 36}.get(
+        n_controls, mcg_cnot_count(n_controls, special_unitary=False)
+    )
+
+
+def _mcx_gate(n_controls):
+    """
+    Multicontrolled X gate whose CNOT count is ``_mcx_cnots(n_controls)``.
+    """
+    toffoli = {1: CXGate, 2: CCXGate, 3: C3XGate, 4: C4XGate}
+    if n_controls in toffoli:
+        return toffoli[n_controls]()
+
+    return Mcg(np.array([[0, 1], [1, 0]]), n_controls)
 
 
 # QR decomposition
@@ -302,9 +1347,6 @@ def _qrd(gate: np.ndarray):
 
     n_qubits = int(np.log2(len(gate)))
 
-    qubits = QuantumRegister(n_qubits)
-    circuit = QuantumCircuit(qubits)
-
     gate_sequence = _build_qr_gate_sequence(gate, n_qubits)
     circuit = _build_qr_circuit(gate_sequence, n_qubits)
 
@@ -312,185 +1354,107 @@ def _qrd(gate: np.ndarray):
 
 
 def _build_qr_gate_sequence(gate, n_qubits):
-    gate_sequence = []
-    for col_idx in range(2**n_qubits - 1):
-        for row_idx in range(col_idx + 1, 2**n_qubits):
-            # create matrix_rotation
+    """
+    Givens rotations ``(row, col, block)`` whose product is ``gate``, in the
+    order they are applied. ``block`` is the 2x2 matrix that acts on the basis
+    states ``col`` and ``row`` (``col < row``). The rotations are applied in
+    place to the two rows involved, without building ``2^n x 2^n`` matrices.
+    """
+    gate = np.array(gate, dtype=complex)
+    size = 2**n_qubits
 
-            matrix_rotation = np.eye(2**n_qubits, dtype=gate.dtype)
+    rotations = []
+    for col in range(size - 1):
+        for row in range(col + 1, size):
             # computing norm
-            norm = np.linalg.norm([gate[col_idx, col_idx], gate[row_idx, col_idx]])
-
-            # computing matrix_rotation
-            a = gate[col_idx, col_idx] / norm
-            b = gate[row_idx, col_idx] / norm
-            matrix_rotation[col_idx, col_idx] = np.conj(a)
-            matrix_rotation[col_idx, row_idx] = np.conj(b)
+            norm = np.hypot(abs(gate[col, col]), abs(gate[row, col]))
+            if norm == 0.0:
+                a, b = 1.0, 0.0
+            else:
+                a = gate[col, col] / norm
+                b = gate[row, col] / norm
 
-            matrix_rotation[row_idx, col_idx] = b
-            matrix_rotation[row_idx, row_idx] = -a
+            givens = np.array([[np.conj(a), np.conj(b)], [b, -a]])
 
-            # applyting matrix_rotation to the unitary
-            gate = matrix_rotation @ gate
-            gate_sequence.append(matrix_rotation.conj().T)
+            # applying the rotation to the two rows of the unitary. The first
+            # ``col`` columns of both rows are already zero.
+            rows = [col, row]
+            gate[rows, col:] = givens @ gate[rows, col:]
 
-    gate_sequence.append(gate)
-    gate_sequence = list(reversed(gate_sequence))
-    return np.array(gate_sequence)
+            rotations.append((row, col, givens.conj().T))
 
+    # The remaining matrix is diag(1, ..., 1, phase).
+    residual = gate[size - 2 :, size - 2 :]
+    rotations.append((size - 1, size - 2, residual))
 
-def _get_row_col(matrix_rotation, n_qubits):
-    a, b, c, d = 1.0, 0.0, 0.0, 1.0
-    for row_idx in range(2 ** n_qubits):
-        for col_idx in range(row_idx):
-            if matrix_rotation[row_idx][col_idx] != 0 and np.not_equal(
-                matrix_rotation[row_idx][col_idx], 1
-            ):
-
-                a = matrix_rotation[col_idx][col_idx]
-                b = matrix_rotation[row_idx][col_idx]
-                c = matrix_rotation[col_idx][row_idx]
-                d = matrix_rotation[row_idx][row_idx]
-                col = col_idx
-                row = row_idx
-
-    col_qubits, n_diff, row_qubits = _row_and_col_qubits(col, n_qubits, row)
-    return np.array([[a, c], [b, d]]), row_qubits, col_qubits, n_diff
-
-
-def _apply_mcxs(n_qubits, row_qubits_new, col_qubits_new):
-    qubits = QuantumRegister(n_qubits)
-    circuit = QuantumCircuit(qubits)
-    for m in range(n_qubits):
-        if row_qubits_new[m] == 0 and col_qubits_new[m] == 1:
-            qubits_list = []
-            memory = np.ones(shape=n_qubits, dtype=int)
-            for n in range(n_qubits):
-                if n != m:
-                    if row_qubits_new[n] == 0:
-                        circuit.x(n)
-                        memory[n] = 0
-                    qubits_list.append(n)
-            qubits_list.append(m)
-            # for the target qubit
-            memory[m] = 2
-            circuit.append(MCXGate(n_qubits - 1), qubits_list)
-            row_qubits_new[m] = 1
-            _apply_cx(circuit, m, n_qubits, row_qubits_new)
-            break
-        if row_qubits_new[m] == 1 and col_qubits_new[m] == 0:
-            qubits_list = []
-            memory = np.ones(shape=n_qubits, dtype=int)
-
-            for n in range(n_qubits):
-                if n != m:
-                    if col_qubits_new[n] == 0:
-                        circuit.x(n)
-                        memory[n] = 0
-                    qubits_list.append(n)
-            qubits_list.append(m)
-            # for the target qubit
-            memory[m] = 2
-            circuit.append(MCXGate(n_qubits - 1), qubits_list)
-            col_qubits_new[m] = 1
-            _apply_cx(circuit, m, n_qubits, col_qubits_new)
-
-            break
-    return circuit, memory, row_qubits_new, col_qubits_new
-
-
-def _apply_cx(circuit, m, n_qubits, row_qubits_new):
-    for n in range(n_qubits):
-        if n != m and row_qubits_new[n] == 0:
-            circuit.x(n)
-
-
-def _undo_mcxs(prep_gates, n_qubits, circuit):
-    sz = len(prep_gates)
-    qubits = QuantumRegister(n_qubits)
-    diff_circuit = QuantumCircuit(qubits)
-    for i in range(sz):
-        qubits_list = []
-        # We are going through the list backwards
-        aux = prep_gates[sz - 1 - i]
-        for m in range(n_qubits):
-            if aux[m] == 0:
-                qubits_list.append(m)
-                diff_circuit.x(m)
-            if aux[m] == 1:
-                qubits_list.append(m)
-            if aux[m] == 2:
-                target = m
-        qubits_list.append(target)
-        diff_circuit.append(MCXGate(n_qubits - 1), qubits_list)
-        # Don't forget the X/NOT at the end
-        for m in range(n_qubits):
-            if aux[m] == 0:
-                diff_circuit.x(m)
-    qubits_list = range(n_qubits)
-    circuit.append(diff_circuit, qubits_list)
+    return list(reversed(rotations))
 
 
 def _build_qr_circuit(gate_sequence, n_qubits):
     """
-    This function was coded for real numbers only
-    Input:
-    gate_sequence: Sequence of unitary matrixes with the majority of the elements being 1s in
-    the diagonal, except for 4 elements: "a and -a" in the diagonal and "2 elements b" outside
-    the diagonal. Since they are unitary, the position of the two b's outside the diagonal are
-    related n_qubits: Number of qubits
-
-
+    Builds the circuit of a sequence of Givens rotations ``(row, col, block)``
+    (see ``_build_qr_gate_sequence``). Each rotation is a multicontrolled
+    ``block`` between two basis states, conjugated by MCXs.
     """
-
-    # invert and take the complex conjugate of gate_sequence
     circuit = QuantumCircuit(n_qubits)
-    for matrix_rotation in gate_sequence:
+    for row, col, block in gate_sequence:
+        if np.allclose(block, np.eye(2)):
+            continue
+
+        for kind, qubits in _qr_rotation_ops(row, col, n_qubits):
+            if kind == "x":
+                circuit.x(qubits)
+            elif kind == "mcx":
+                circuit.append(_mcx_gate(n_qubits - 1), qubits)
+            else:
+                # "mcmt"
+                circuit.append(Mcg(block, n_qubits - 1), qubits)
 
-        unitary_matrix, row_qubits, col_qubits, n_diff = _get_row_col(matrix_rotation, n_qubits)
+    return circuit
 
-        # col_qubits, n_diff, row_qubits = _row_and_col_qubits(col, n_qubits, row)
-        row_qubits_new = row_qubits
-        col_qubits_new = col_qubits
 
-        # Apply MCXs to only have one qubit different
-        # prep_gates and memory saves information about the gates we used,
-        # so we can use them again later
-        prep_gates = []
+def _qr_rotation_ops(row, col, n_qubits):
+    """
+    Sequence of operations ``(kind, qubits)`` that applies a two-level rotation
+    between the basis states ``row`` and ``col``. The kind of the operation is
+    ``'x'``, ``'mcx'`` or ``'mcmt'`` (the multicontrolled rotation). The last
+    qubit of ``'mcx'`` and ``'mcmt'`` is the target.
+    """
+    col_qubits, n_diff, row_qubits = _row_and_col_qubits(col, n_qubits, row)
 
-        while n_diff > 1:
-            diff_circ, memory, row_qubits_new, col_qubits_new = _apply_mcxs(
-                n_qubits, row_qubits_new, col_qubits_new
-            )
-            circuit.append(diff_circ, range(n_qubits))
-            prep_gates.append(memory)
-            n_diff -= 1
+    # Apply MCXs to only have one qubit different.
+    # ``prep_ops`` saves the MCXs, so we can use them again later.
+    prep_ops = []
+    while n_diff > 1:
+        target = next(m for m in range(n_qubits) if row_qubits[m] != col_qubits[m])
+        # The basis state with the bit ``0`` at ``target`` is flipped.
+        flipped = row_qubits if row_qubits[target] == 0 else col_qubits
+        controls = [m for m in range(n_qubits) if m != target]
+        zeros = [m for m in controls if flipped[m] == 0]
+        flipped[target] = 1
 
-        _append_mcmt_gate(circuit, col_qubits_new, n_qubits, row_qubits_new, unitary_matrix)
-        for m in range(n_qubits):
-            if col_qubits_new[m] == row_qubits_new[m]:
-                if row_qubits[m] == 0:
-                    circuit.x(m)
+        prep_ops.append(_x_wrapped(zeros, ("mcx", controls + [target])))
+        n_diff -= 1
 
-        # Do all the MCXs again
-        _undo_mcxs(prep_gates, n_qubits, circuit)
+    ops = [op for prep_op in prep_ops for op in prep_op]
 
+    controls = [m for m in range(n_qubits) if row_qubits[m] == col_qubits[m]]
+    target = next(m for m in range(n_qubits) if row_qubits[m] != col_qubits[m])
+    zeros = [m for m in controls if row_qubits[m] == 0]
+    ops.extend(_x_wrapped(zeros, ("mcmt", controls + [target])))
 
-    return circuit
+    # Do all the MCXs again.
+    for prep_op in reversed(prep_ops):
+        ops.extend(prep_op)
 
+    return ops
 
-def _append_mcmt_gate(circuit, col_qubits_new, n_qubits, row_qubits_new, unitary_matrix):
-    gate = UnitaryGate(unitary_matrix)
-    qubits_list = []
-    for m in range(n_qubits):
-        if col_qubits_new[m] == row_qubits_new[m]:
-            if row_qubits_new[m] == 0:
-                circuit.x(m)
-            qubits_list.append(m)
-        else:
-            diffqubit = m
-    qubits_list.append(diffqubit)
-    circuit.append(MCMT(gate, n_qubits - 1, 1), qubits_list)
+
+def _x_wrapped(qubits, operation):
+    if len(qubits) == 0:
+        return [operation]
+
+    return [("x", qubits), operation, ("x", qubits)]
 
 
 def _row_and_col_qubits(col, n_qubits, row):
@@ -40,11 +40,13 @@ def get_counts(circ):
     return counts
 
 
-def get_state(circ):
+def get_state(circ, optimization_level=None):
     """
     Parameters
     ----------
     circ: QuantumCircuit
+    optimization_level: transpiler optimization level (``None`` for the
+        transpiler default, which may drop near-identity rotations)
 
     Returns
     -------
@@ -52,7 +54,7 @@ def get_state(circ):
     """
 
     backend = AerSimulator()
-    tcirc = transpile(circ, backend)
+    tcirc = transpile(circ, backend, optimization_level=optimization_level)
     tcirc.save_statevector()
     state_vector = backend.run(tcirc).result().get_statevector()
 
@@ -306,3 +308,18 @@ def measurement(circuit, n_qubits, classical_register, backend, shots):
             count_s2[pattern] = 0.0
 
     return [value / shots for (key, value) in count_s2.items()]
+
+
+def parallel_map(function, items, executor=None):
+    """
+    Maps ``function`` over ``items`` with ``executor`` (e.g. a
+    ``concurrent.futures`` executor), or serially if ``executor`` is ``None``.
+
+    Returns
+    -------
+    results: list with the value of ``function`` for each item, in order
+    """
+    if executor is None:
+        return list(map(function, items))
+
+    return list(executor.map(function, items))
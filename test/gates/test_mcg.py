@@ -21,7 +21,7 @@ from scipy.stats import unitary_group
 from qiskit import QuantumCircuit
 from qiskit.quantum_info import Operator
 from qclib.util import get_cnot_count, get_depth
-from qclib.gates.mcg import Mcg
+from qclib.gates.mcg import Mcg, mcg_cnot_count
 
 
 # pylint: disable=maybe-no-member
@@ -157,3 +157,18 @@ class TestMcg(TestCase):
         for n_qubits in range(1, 10):
             self._u2_count(unitary, n_qubits)
 
+    def test_cnot_count(self):
+        unitary = unitary_group.rvs(2)
+
+        for num_controls in range(10):
+            n_qubits = num_controls + 1
+            su2_circuit, _ = self._build_su2_circuit(
+                np.random.rand() + 1.j * np.random.rand(), np.random.rand(), n_qubits
+            )
+            u2_circuit, _ = self._build_circuit(unitary, n_qubits)
+
+            self.assertEqual(get_cnot_count(su2_circuit), mcg_cnot_count(num_controls))
+            self.assertEqual(
+                get_cnot_count(u2_circuit),
+                mcg_cnot_count(num_controls, special_unitary=False)
+            )
@@ -0,0 +1,51 @@
+# Copyright 2021 qclib project.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Test qclib.gate.ucg """
+
+from unittest import TestCase
+
+import numpy as np
+from scipy.linalg import block_diag
+from scipy.stats import unitary_group
+from qiskit.quantum_info import Operator
+from qclib.util import get_cnot_count
+from qclib.gates.ucg import Ucg
+
+
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+
+
+class TestUcg(TestCase):
+    """ Testing qclib.gate.ucg """
+
+    def test_ucg(self):
+        for n_controls in range(5):
+            unitaries = [unitary_group.rvs(2) for _ in range(2**n_controls)]
+            gate = Ucg(unitaries)
+            self.assertTrue(np.allclose(Operator(gate.definition).data, block_diag(*unitaries)))
+
+    def test_ucg_up_to_diagonal(self):
+        x_gate = np.array([[0, 1], [1, 0]])
+        u_gate = unitary_group.rvs(2)
+        for unitaries in [[unitary_group.rvs(2) for _ in range(8)],
+                          [u_gate, u_gate, np.identity(2), x_gate],
+                          [np.identity(2)] * 4]:
+            gate = Ucg(unitaries, up_to_diagonal=True)
+            operator = np.diag(gate.diagonal()) @ Operator(gate.definition).data
+            self.assertTrue(np.allclose(operator, block_diag(*unitaries)))
+
+            n_controls = gate.num_qubits - 1
+            self.assertEqual(get_cnot_count(gate.definition), 2**n_controls - 1)
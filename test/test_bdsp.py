@@ -16,10 +16,11 @@
 
 from unittest import TestCase
 import numpy as np
-from qiskit import ClassicalRegister
+from qiskit import ClassicalRegister, transpile
 from qiskit_aer import AerSimulator
 from qclib.state_preparation import BdspInitialize
-from qclib.util import measurement
+from qclib.state_preparation.bdsp import cost_model
+from qclib.util import get_state, measurement
 
 backend = AerSimulator()
 SHOTS = 8192
@@ -67,3 +68,63 @@ class TestBdsp(TestCase):
         state = TestBdsp.bdsp_experiment(vector)
 
         self.assertTrue(np.allclose(np.power(np.abs(vector), 2), state, rtol=1e-01, atol=0.005))
+
+    def test_cost_model(self):
+        """ Testing the bdsp cost model against the transpiled circuits """
+        for n_qubits in range(2, 9):
+            vector = np.random.rand(2**n_qubits) + np.random.rand(2**n_qubits) * 1j
+            vector = vector / np.linalg.norm(vector)
+
+            for split in range(1, n_qubits + 1):
+                circuit = BdspInitialize(vector, opt_params={'split': split}).definition
+                circuit = transpile(circuit, basis_gates=['u', 'cx'], optimization_level=0)
+                depth = circuit.depth(lambda instruction: instruction.operation.num_qubits > 1)
+                self.assertEqual(
+                    cost_model(n_qubits, split),
+                    (circuit.num_qubits, circuit.count_ops()['cx'], depth)
+                )
+
+    def test_auto_split(self):
+        """ Testing bdsp with split='auto' """
+        vector = np.random.rand(64) + np.random.rand(64) * 1j
+        vector = vector / np.linalg.norm(vector)
+
+        gate = BdspInitialize(vector, opt_params={'split': 'auto', 'max_qubits': 20})
+        self.assertEqual(gate.split, 4)
+        self.assertLessEqual(gate.num_qubits, 20)
+
+        gate = BdspInitialize(vector, opt_params={'split': 'auto', 'max_depth': 100})
+        self.assertEqual(gate.split, 5)
+
+        with self.assertRaises(ValueError):
+            BdspInitialize(vector, opt_params={'split': 'auto', 'max_qubits': 5})
+
+        state = TestBdsp.bdsp_experiment(vector, 'auto')
+        self.assertTrue(np.allclose(np.power(np.abs(vector), 2), state, rtol=1e-01, atol=0.005))
+
+    def test_max_fidelity_loss(self):
+        """ Testing bdsp with max_fidelity_loss """
+        vector = 1e-3 * (np.random.rand(32) + np.random.rand(32) * 1j)
+        # Dominant amplitudes in the first subtree: the other subtrees are cut
+        # by zeroing RY angles above the split level.
+        vector[:3] += 1.0
+        vector = vector / np.linalg.norm(vector)
+
+        for split in [2, 3]:
+            exact = BdspInitialize(vector, opt_params={'split': split}).definition
+            circuit = BdspInitialize(
+                vector, opt_params={'split': split, 'max_fidelity_loss': 0.01}
+            ).definition
+
+            # Fidelity between the approximated and the exact circuits (ancillae
+            # included), without optimization, which may drop the near-identity
+            # rotations.
+            state = get_state(circuit, optimization_level=0)
+            state_exact = get_state(exact, optimization_level=0)
+            fidelity = np.abs(np.vdot(state_exact, state)) ** 2
+            self.assertLessEqual(circuit.metadata['fidelity_loss'], 0.01)
+            self.assertAlmostEqual(circuit.metadata['fidelity_loss'], 1.0 - fidelity)
+
+            cnots = transpile(circuit, basis_gates=['u', 'cx'], optimization_level=0)
+            cnots_exact = transpile(exact, basis_gates=['u', 'cx'], optimization_level=0)
+            self.assertLess(cnots.count_ops()['cx'], cnots_exact.count_ops()['cx'])
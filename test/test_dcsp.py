@@ -48,3 +48,20 @@ class TestInitialize(TestCase):
         state = TestInitialize.dcsp_experiment(vector)
 
         self.assertTrue(np.allclose(np.power(np.abs(vector), 2), state, rtol=1e-01, atol=0.005))
+
+    def test_large_structure(self):
+        """ Testing the structure of a large divide-and-conquer circuit """
+        n_qubits = 12
+        vector = np.random.rand(2**n_qubits) + np.random.rand(2**n_qubits) * 1j
+        vector = vector / np.linalg.norm(vector)
+
+        circuit = DcspInitialize(vector).definition
+        ops = circuit.count_ops()
+
+        self.assertEqual(circuit.num_qubits, 2**n_qubits - 1)
+        self.assertEqual(ops['ry'], 2**n_qubits - 1)
+        # Each node of level l swaps the n-l-1 qubits of its children branches.
+        self.assertEqual(
+            ops['cswap'],
+            sum(2**level * (n_qubits - level - 1) for level in range(n_qubits))
+        )
@@ -21,6 +21,8 @@ from qclib.entanglement import (
     geometric_entanglement,
     schmidt_decomposition,
     schmidt_composition,
+    schmidt_coefficients,
+    effective_rank,
     randomized_svd,
     _separation_matrix,
     qb_approximation,
@@ -94,6 +96,20 @@ class TestEntanglement(TestCase):
         self.assertTrue(np.allclose(result[2], singular_values))
         self.assertTrue(np.allclose(result[3], vh_matrix[:result[0], :]))
 
+    def test_schmidt_coefficients(self):
+        state = np.zeros(8)
+        state[0] = 1 / np.sqrt(2)
+        state[7] = 1 / np.sqrt(2)
+
+        singular_values = schmidt_coefficients(state, [0, 1])
+        self.assertTrue(np.allclose(singular_values, [0.70710678, 0.70710678]))
+        self.assertEqual(effective_rank(singular_values), 2)
+
+        state = np.random.rand(2**6) + np.random.rand(2**6) * 1.0j
+        state = state / np.linalg.norm(state)
+        _, _, svd_s, _ = schmidt_decomposition(state, [0, 2, 4])
+        self.assertTrue(np.allclose(schmidt_coefficients(state, [0, 2, 4]), svd_s))
+
     def test_schmidt_composition(self):
         state = np.random.rand(2**8) + np.random.rand(2**8) * 1.0j
         state = state / np.linalg.norm(state)
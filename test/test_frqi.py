@@ -20,7 +20,9 @@ from unittest import TestCase
 import numpy as np
 from qiskit import QuantumCircuit
 from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
-from qiskit.quantum_info import Statevector
+from qiskit.circuit.library import RYGate, RZGate, UCRYGate, UCRZGate
+from qiskit.quantum_info import Operator, Statevector
+from qclib.gates.ucr import Ucr, multiplexor, simplify_logic
 from qclib.state_preparation import FrqiInitialize
 
 
@@ -302,3 +304,56 @@ class TestFrqi(TestCase):
 
         self.assertTrue(n_cx1 >= n_cx2)
         self.assertTrue(np.allclose(state1, state2))
+
+    def test_multiplexor(self):
+        for n_controls in range(5):
+            angles = np.random.rand(2**n_controls) * np.pi
+            for r_gate, uc_gate in [(RYGate, UCRYGate), (RZGate, UCRZGate)]:
+                circuit = multiplexor(r_gate, angles)
+                expected = QuantumCircuit(n_controls + 1)
+                expected.append(uc_gate(list(angles)), range(n_controls + 1))
+                self.assertTrue(Operator(circuit).equiv(Operator(expected)))
+                self.assertEqual(
+                    circuit.count_ops().get('cx', 0), 2**n_controls if n_controls else 0
+                )
+
+    def test_simplify_logic(self):
+        self.assertEqual(simplify_logic(['000', '001', '011']), ['0-1', '00-'])
+        self.assertEqual(simplify_logic(['10', '11']), ['1-'])
+        self.assertEqual(simplify_logic(['00', '01', '10', '11']), ['--'])
+        # Budget exceeded: no simplification.
+        self.assertEqual(simplify_logic(['10', '11'], max_terms=2), ['10', '11'])
+
+        n_bits = 10
+        minterms = set(np.random.choice(2**n_bits, 2**(n_bits-1), replace=False))
+        patterns = simplify_logic([f'{i:0{n_bits}b}' for i in sorted(minterms)])
+        covered = set()
+        for pattern in patterns:
+            dontcares = [i for i, char in enumerate(pattern) if char == '-']
+            for k in range(2**len(dontcares)):
+                bits = list(pattern)
+                for j, i in enumerate(dontcares):
+                    bits[i] = str(k >> j & 1)
+                covered.add(int(''.join(bits), 2))
+        self.assertEqual(covered, minterms)
+
+    def test_group_angles(self):
+        values = [0.3, 0.1, 0.3 + 1e-9, 0.2, 0.1, 0.3]
+        leaders, labels = Ucr._group_angles(values)
+        self.assertTrue(np.allclose(leaders, [0.1, 0.2, 0.3]))
+        self.assertEqual(labels.tolist(), [2, 0, 2, 1, 0, 2])
+
+    def test_encode_batch(self):
+        images = np.random.rand(4, 2**N_QUBITS) * np.pi
+        images[0, :4] = 0.0
+        for opt_params in [{'simplify': False},
+                           {'simplify': False, 'rescale': True, 'init_index_register': False},
+                           {'simplify': True}]:
+            circuits = FrqiInitialize.encode_batch(images, opt_params)
+            self.assertEqual(len(circuits), len(images))
+            for image, circuit in zip(images, circuits):
+                expected = FrqiInitialize(image, opt_params=opt_params).definition
+                self.assertTrue(Operator(circuit).equiv(Operator(expected)))
+
+        circuits = FrqiInitialize.encode_batch(images, {'simplify': False}, stream=True)
+        self.assertEqual(next(circuits).num_parameters, 0)
@@ -17,11 +17,16 @@ Tests for the isometry.py module.
 """
 
 from unittest import TestCase
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import scipy
 from qiskit import QuantumCircuit, transpile
+from qiskit.circuit.library import UCGate
+from qclib.gates.ucg import Ucg
+from qiskit.quantum_info import Operator
 from scipy.stats import unitary_group
-from qclib.isometry import decompose, cnot_count
+from qclib.isometry import decompose, cnot_count, knill_eigendecomposition
+from qclib.isometry import _update_isometry, _unitaries, _uc_gate, _sparse_uc_gate
 from qclib.util import get_state
 from qclib.state_preparation import IsometryInitialize
 
@@ -60,6 +65,29 @@ class TestIsometry(TestCase):
     def test_global_phase_knill(self):
         self._test_global_phase('knill')
 
+    def test_executor_knill(self):
+        isometry = unitary_group.rvs(2**4)[:, :2**2]
+        serial = decompose(isometry, scheme='knill')
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            parallel = decompose(isometry, scheme='knill', executor=executor)
+
+        self.assertEqual(serial.count_ops(), parallel.count_ops())
+        self.assertTrue(np.allclose(Operator(serial).data, Operator(parallel).data))
+        self.assertTrue(np.allclose(Operator(parallel).data[:, :2**2], isometry))
+
+    def test_shared_eig_knill(self):
+        isometry = unitary_group.rvs(2**4)[:, :2**2]
+        eig = knill_eigendecomposition(isometry)
+        for scheme in ['knill', 'auto']:
+            self.assertEqual(
+                cnot_count(isometry, scheme=scheme, eig=eig), cnot_count(isometry, scheme=scheme)
+            )
+            circuit = decompose(isometry, scheme=scheme, eig=eig)
+            self.assertEqual(
+                circuit.count_ops(), decompose(isometry, scheme=scheme).count_ops()
+            )
+            self.assertTrue(np.allclose(Operator(circuit).data[:, :2**2], isometry))
+
     # scheme='ccd' (column-by-column decomposition) isometry tests
 
     def test_state_preparation_real_ccd(self):
@@ -80,6 +108,20 @@ class TestIsometry(TestCase):
     def test_counting_ccd(self):
         self._test_counting('ccd')
 
+    def test_sparse_ccd(self):
+        # Columns supported on a few basis states.
+        isometry = np.zeros((2**6, 2), dtype=complex)
+        rows = [5, 12, 40, 63]
+        isometry[rows] = unitary_group.rvs(4)[:, :2]
+
+        gate = decompose(isometry, scheme='ccd', sparse=True)
+        self.assertTrue(np.allclose(Operator(gate).data[:, :2], isometry))
+
+        n_cx_sparse = cnot_count(isometry, 'ccd', 'exact', sparse=True)
+        n_cx_estimate = cnot_count(isometry, 'ccd', 'estimate', sparse=True)
+        self.assertEqual(n_cx_sparse, n_cx_estimate)
+        self.assertLess(n_cx_sparse, cnot_count(isometry, 'ccd', 'exact'))
+
     def test_initialize_ccd(self):
         self._test_initialize('ccd')
 
@@ -112,6 +154,82 @@ class TestIsometry(TestCase):
     def test_global_phase_csd(self):
         self._test_global_phase('csd')
 
+    def test_check_isometry(self):
+        isometry = unitary_group.rvs(16)[:, :4]
+        decompose(isometry, scheme='ccd')
+
+        non_orthonormal = isometry.copy()
+        non_orthonormal[:, 1] = (non_orthonormal[:, 0] + non_orthonormal[:, 1]) / np.sqrt(2)
+        with self.assertRaises(ValueError):
+            decompose(non_orthonormal, scheme='ccd')
+        with self.assertRaises(ValueError):
+            decompose(2 * isometry, scheme='ccd')
+        with self.assertRaises(ValueError):
+            decompose(non_orthonormal[:, :2], scheme='ccd')
+
+        # A trusted input skips the orthonormality test, but not the shape one.
+        decompose(non_orthonormal, scheme='ccd', trusted=True)
+        with self.assertRaises(ValueError):
+            decompose(isometry[:12], scheme='ccd', trusted=True)
+
+    def test_auto(self):
+        for log_lines, log_cols in [(3, 0), (4, 2), (5, 4)]:
+            isometry = unitary_group.rvs(2**log_lines)[:, :2**log_cols]
+            gate = decompose(isometry, scheme='auto')
+            scheme = gate.metadata['scheme']
+            self.assertTrue(np.allclose(Operator(gate).data[:, :2**log_cols], isometry))
+
+            n_cx = cnot_count(isometry, 'auto')
+            self.assertEqual(n_cx, cnot_count(isometry, scheme))
+            self.assertEqual(
+                n_cx, min(cnot_count(isometry, sch) for sch in ['ccd', 'csd', 'knill'])
+            )
+
+    def test_update_isometry(self):
+        # Direct application of a (possibly simplified) UCGate or of a Ucg to
+        # the columns must match its operator, including the diagonal it leaves.
+        u_0, u_1 = unitary_group.rvs(2), unitary_group.rvs(2)
+        for gate_class in [UCGate, Ucg]:
+            for unitaries in [[u_0, u_1, u_0, u_1], [u_0, u_0, u_1, u_1],
+                              [np.identity(2)] * 3 + [u_1]]:
+                circuit = QuantumCircuit(4)
+                circuit.append(gate_class(unitaries, up_to_diagonal=True), [2, 0, 3])
+                isometry = unitary_group.rvs(16)[:, :4]
+                expected = Operator(circuit).data @ isometry
+                _update_isometry(isometry, circuit)
+                self.assertTrue(np.allclose(isometry, expected))
+
+    def test_uc_gate(self):
+        # The default CCD emits the qiskit UCGate with all of its controls;
+        # only the sparse CCD drops the controls the blocks do not depend on.
+        u_0, u_1 = unitary_group.rvs(2), unitary_group.rvs(2)
+        unitaries = [u_0, u_0, u_1, u_1]
+        operation = _uc_gate(unitaries, 3, [0, 1], 2).data[0].operation
+        self.assertIsInstance(operation, UCGate)
+        self.assertEqual(operation.num_qubits, 3)
+        operation = _uc_gate(unitaries, 3, [0, 1], 2, sparse=True).data[0].operation
+        self.assertEqual(operation.num_qubits, 2)
+
+    def test_sparse_uc_gate_tolerance(self):
+        # Blocks that differ by ~1e-6 are distinct: the control and the block
+        # must be kept (the tolerance is absolute).
+        phase = np.diag([1.0, np.exp(1e-6j)])
+        gate = _sparse_uc_gate([np.identity(2), phase], 2, [1], 0)
+        self.assertEqual(len(gate.data), 1)
+        self.assertEqual(gate.data[0].operation.num_qubits, 2)
+
+    def test_unitaries(self):
+        pairs = unitary_group.rvs(8)[:, :2]
+        pairs[0] = 0.0
+        for basis in [0, 1]:
+            unitaries = _unitaries(pairs, basis=basis)
+            self.assertEqual(unitaries.shape, (8, 2, 2))
+            for unitary, pair in zip(unitaries, pairs):
+                expected = np.zeros(2)
+                expected[basis] = np.linalg.norm(pair)
+                self.assertTrue(np.allclose(unitary @ unitary.conj().T, np.identity(2)))
+                self.assertTrue(np.allclose(unitary @ pair, expected))
+
     # scheme='qiskit' isometry tests
 
     #def test_global_phase_qiskit(self):
@@ -22,7 +22,7 @@ import numpy as np
 from qiskit import QuantumCircuit, ClassicalRegister, transpile
 from qiskit_aer import AerSimulator
 from qclib.state_preparation import LowRankInitialize
-from qclib.state_preparation.lowrank import cnot_count
+from qclib.state_preparation.lowrank import cnot_count, cnot_count_generic
 
 from qclib.util import get_state
 
@@ -148,6 +148,37 @@ class TestLowRank(TestCase):
 
         self.assertTrue(cnot_count(state_vector) == n_cx)
 
+    def test_auto_schemes(self):
+        n_qubits = 7
+        state_vector = np.random.rand(2**n_qubits) + np.random.rand(2**n_qubits) * 1j
+        state_vector = state_vector / np.linalg.norm(state_vector)
+
+        opt_params = {'iso_scheme': 'auto', 'unitary_scheme': 'auto', 'depth_weight': 0.5}
+        circuit = QuantumCircuit(n_qubits)
+        LowRankInitialize.initialize(circuit, state_vector, opt_params=opt_params)
+        self.assertTrue(np.allclose(state_vector, get_state(circuit)))
+
+        # The automatic choice is never worse than the default schemes.
+        self.assertTrue(
+            cnot_count(state_vector, isometry_scheme='auto', unitary_scheme='auto') <=
+            cnot_count(state_vector)
+        )
+
+    def test_cnot_count_spectrum(self):
+        # For generic states the closed-form model matches the full estimate.
+        for n_qubits, rank in [(5, 0), (7, 0), (8, 2)]:
+            state_vector = np.random.rand(2**n_qubits) + np.random.rand(2**n_qubits) * 1j
+            state_vector = state_vector / np.linalg.norm(state_vector)
+
+            self.assertEqual(
+                cnot_count(state_vector, low_rank=rank, method='spectrum'),
+                cnot_count(state_vector, low_rank=rank)
+            )
+            if rank == 0:
+                self.assertEqual(
+                    cnot_count_generic(n_qubits), cnot_count(state_vector, method='spectrum')
+                )
+
     def test_cnot_count_rank_1(self):
 
         # Builds a rank 1 state.
@@ -196,3 +227,59 @@ class TestLowRank(TestCase):
         state = get_state(circuit)
 
         self.assertTrue(np.allclose(state_vector, state))
+
+    def test_max_fidelity_loss(self):
+        n_qubits = 8
+
+        # Builds a state with a decaying Schmidt spectrum.
+        matrix = np.random.rand(16, 16) + np.random.rand(16, 16) * 1j
+        svd_u, _, svd_v = np.linalg.svd(matrix)
+        singular_values = np.exp(-0.6 * np.arange(16))
+        state_vector = ((svd_u * singular_values) @ svd_v).reshape(-1)
+        state_vector = state_vector / np.linalg.norm(state_vector)
+
+        exact_cnots = cnot_count(state_vector)
+        for max_fidelity_loss in [0.01, 0.05, 0.1, 0.3]:
+            circuit = QuantumCircuit(n_qubits)
+            opt_params = {'max_fidelity_loss': max_fidelity_loss}
+            LowRankInitialize.initialize(circuit, state_vector, opt_params=opt_params)
+
+            state = get_state(circuit)
+            fidelity = np.abs(np.vdot(state_vector, state))**2
+
+            transpiled_circuit = transpile(circuit, basis_gates=['u', 'cx'], optimization_level=0)
+            n_cx = transpiled_circuit.count_ops()['cx']
+
+            self.assertTrue(fidelity >= 1.0 - max_fidelity_loss)
+            self.assertTrue(n_cx < exact_cnots)
+            self.assertTrue(
+                cnot_count(state_vector, max_fidelity_loss=max_fidelity_loss) == n_cx
+            )
+
+    def test_max_fidelity_loss_zero(self):
+        n_qubits = 5
+        state_vector = np.random.rand(2**n_qubits) + np.random.rand(2**n_qubits) * 1j
+        state_vector = state_vector / np.linalg.norm(state_vector)
+
+        circuit = QuantumCircuit(n_qubits)
+        LowRankInitialize.initialize(
+            circuit, state_vector, opt_params={'max_fidelity_loss': 0.0}
+        )
+
+        state = get_state(circuit)
+
+        self.assertTrue(np.allclose(state_vector, state))
+
+    def test_flat_definition(self):
+        n_qubits = 7
+        state_vector = np.random.rand(2**n_qubits) + np.random.rand(2**n_qubits) * 1j
+        state_vector = state_vector / np.linalg.norm(state_vector)
+
+        circuit = LowRankInitialize(state_vector).definition
+
+        # Sub-states are emitted in place, without nested LowRankInitialize gates.
+        self.assertTrue('low_rank' not in circuit.count_ops())
+
+        state = get_state(circuit)
+
+        self.assertTrue(np.allclose(state_vector, state))
@@ -19,9 +19,21 @@ Tests for the topdown.py module.
 from unittest import TestCase
 import numpy as np
 
-from qiskit import ClassicalRegister, transpile
+from qiskit import ClassicalRegister, QuantumCircuit, transpile
 from qiskit_aer import AerSimulator
 from qclib.state_preparation import TopDownInitialize
+from qclib.state_preparation.util.state_tree_preparation import (
+    Amplitude,
+    state_decomposition,
+    state_decomposition_array,
+)
+from qclib.state_preparation.util.angle_tree_preparation import (
+    create_angles_tree,
+    create_angles_tree_array,
+)
+from qclib.state_preparation.util.tree_register import add_register
+from qclib.state_preparation.util.tree_walk import top_down
+from qclib.state_preparation.util.tree_utils import children
 from qclib.util import get_state, measurement
 
 # pylint: disable=missing-function-docstring
@@ -107,3 +119,123 @@ class TestTopDown(TestCase):
         state = get_state(circuit)
 
         self.assertTrue(np.allclose(state_vector, state))
+
+    def test_topdown_tuple_state(self):
+        for state_vector in [(0.6, 0.8), tuple(np.ones(4) / 2)]:
+            circuit = TopDownInitialize(state_vector).definition
+            self.assertTrue(np.allclose(state_vector, get_state(circuit)))
+
+    def test_angle_tree_array(self):
+        n_qubits = 5
+        state = np.random.rand(2**n_qubits) + np.random.rand(2**n_qubits) * 1j
+        state[3:7] = 0.0
+        state = state / np.linalg.norm(state)
+
+        mag, arg = state_decomposition_array(n_qubits, state)
+        angle_tree_array = create_angles_tree_array(mag, arg)
+        self.assertTrue(np.isclose(mag[0], 1.0))
+
+        # Heap order: level by level, from left to right. The node splits its
+        # block of amplitudes in two halves.
+        angles_y, angles_z = [], []
+        for level in range(n_qubits):
+            for block in np.split(state, 2**level):
+                left, right = np.split(block, 2)
+                norm = np.linalg.norm(block)
+                ratio = np.linalg.norm(right) / norm if norm > 0 else 0.0
+                angles_y.append(2 * np.arcsin(min(ratio, 1.0)))
+                angles_z.append(2 * (np.mean(np.angle(right)) - np.mean(np.angle(block))))
+        self.assertEqual(angle_tree_array.height, n_qubits)
+        self.assertTrue(np.allclose(angle_tree_array.angle_y, angles_y))
+        self.assertTrue(np.allclose(angle_tree_array.angle_z, angles_z))
+
+    def test_angle_tree(self):
+        # The linked-node tree matches the heap-ordered one.
+        n_qubits = 5
+        state = np.random.rand(2**n_qubits) + np.random.rand(2**n_qubits) * 1j
+        state[3:7] = 0.0
+        state = state / np.linalg.norm(state)
+
+        angle_tree = create_angles_tree(
+            state_decomposition(n_qubits, [Amplitude(i, a) for i, a in enumerate(state)])
+        )
+        angle_tree_array = create_angles_tree_array(*state_decomposition_array(n_qubits, state))
+
+        # Heap order: level by level, from left to right.
+        nodes = [angle_tree]
+        angles_y, angles_z = [], []
+        while nodes:
+            angles_y.extend(node.angle_y for node in nodes)
+            angles_z.extend(node.angle_z for node in nodes)
+            nodes = children(nodes)
+        self.assertTrue(np.allclose(angle_tree_array.angle_y, angles_y))
+        self.assertTrue(np.allclose(angle_tree_array.angle_z, angles_z))
+
+        circuit = QuantumCircuit()
+        add_register(circuit, angle_tree, 0)
+        top_down(angle_tree, circuit, 0)
+        circuit.global_phase += np.mean(np.angle(state))
+        self.assertTrue(np.allclose(state, get_state(circuit)))
+
+    def test_topdown_sparse(self):
+        n_qubits = 7
+        indices = np.random.choice(2**n_qubits, 6, replace=False)
+        values = np.random.rand(6) + np.random.rand(6) * 1j
+        values = values / np.linalg.norm(values)
+        state_vector = np.zeros(2**n_qubits, dtype=complex)
+        state_vector[indices] = values
+
+        sparse_dict = {f'{i:0{n_qubits}b}': a for i, a in zip(indices, values)}
+        for params, opt_params in [(sparse_dict, None),
+                                   ((indices, values), {'n_qubits': n_qubits}),
+                                   (sparse_dict, {'lib': 'qiskit'})]:
+            circuit = TopDownInitialize(params, opt_params=opt_params).definition
+            self.assertTrue(np.allclose(state_vector, get_state(circuit)))
+
+        # Large sparse state: only the nonzero paths are built.
+        n_qubits = 14
+        indices = np.random.choice(2**n_qubits, 3, replace=False)
+        values = np.ones(3) / np.sqrt(3)
+        circuit = TopDownInitialize(
+            (indices, values), opt_params={'n_qubits': n_qubits}
+        ).definition
+        transpiled = transpile(circuit, basis_gates=['u', 'cx'], optimization_level=0)
+        self.assertTrue(transpiled.count_ops().get('cx', 0) < 2**n_qubits)
+
+        # Four nodes with RY and RZ angles in the last level: the four
+        # multicontrolled gates are cheaper than the two multiplexors.
+        n_qubits = 9
+        parents = np.array([5, 77, 130, 201])
+        indices = np.concatenate((2 * parents, 2 * parents + 1))
+        values = np.random.rand(8) + np.random.rand(8) * 1j
+        values = values / np.linalg.norm(values)
+        state_vector = np.zeros(2**n_qubits, dtype=complex)
+        state_vector[indices] = values
+
+        circuit = TopDownInitialize(
+            (indices, values), opt_params={'n_qubits': n_qubits}
+        ).definition
+        self.assertEqual(circuit.count_ops().get('mcg', 0), 4)
+        self.assertTrue(np.allclose(state_vector, get_state(circuit)))
+
+    def test_topdown_max_fidelity_loss(self):
+        n_qubits = 9
+        state_vector = 1e-3 * (np.random.rand(2**n_qubits) + np.random.rand(2**n_qubits) * 1j)
+        state_vector[np.random.choice(2**n_qubits, 4, replace=False)] += 1.0
+        state_vector = state_vector / np.linalg.norm(state_vector)
+
+        exact = TopDownInitialize(state_vector).definition
+        for max_fidelity_loss in [0.01, 0.1]:
+            circuit = TopDownInitialize(
+                state_vector, opt_params={'max_fidelity_loss': max_fidelity_loss}
+            ).definition
+            fidelity_loss = circuit.metadata['fidelity_loss']
+            # Without optimization, which may drop the near-identity rotations.
+            state = get_state(circuit, optimization_level=0)
+            fidelity = np.abs(np.vdot(state_vector, state)) ** 2
+            self.assertLessEqual(fidelity_loss, max_fidelity_loss)
+            self.assertAlmostEqual(fidelity_loss, 1.0 - fidelity)
+
+            cnots = transpile(circuit, basis_gates=['u', 'cx'], optimization_level=0)
+            cnots_exact = transpile(exact, basis_gates=['u', 'cx'], optimization_level=0)
+            self.assertLess(cnots.count_ops()['cx'], cnots_exact.count_ops()['cx'])
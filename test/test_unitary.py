@@ -15,10 +15,16 @@
 """ Test creation of quantum circuits from matrices """
 
 from unittest import TestCase
+from concurrent.futures import ProcessPoolExecutor
 from scipy.stats import unitary_group
+from scipy.linalg import block_diag, expm
 import numpy as np
 import qiskit
-from qclib.unitary import unitary, _compute_gates, cnot_count, _build_qr_gate_sequence
+from qiskit.quantum_info import Operator
+from qclib.unitary import unitary, _compute_gates, cnot_count, cnot_depth, _build_qr_gate_sequence
+from qclib.unitary import _build_gate_ir, _apply_a2, _cossin, _two_qubit_cnots
+from qclib.unitary import _two_qubit_up_to_diagonal
+from qclib.unitary import cnot_cost, cnot_count_generic
 from qclib.util import get_state
 
 class TestUnitary(TestCase):
@@ -48,6 +54,11 @@ class TestUnitary(TestCase):
 
         self.assertTrue(n_cx_exact == n_cx_estimate)
 
+        depth_exact = cnot_depth(unitary_matrix, decomposition, 'exact', iso, apply_a2)
+        depth_estimate = cnot_depth(unitary_matrix, decomposition, 'estimate', iso, apply_a2)
+
+        self.assertTrue(depth_exact == depth_estimate)
+
     def test_compute_gates(self):
         """ test auxiliar function compute gates"""
         gate1 = unitary_group.rvs(8)
@@ -59,6 +70,49 @@ class TestUnitary(TestCase):
         self.assertTrue(np.allclose(calc1, gate1))
         self.assertTrue(np.allclose(calc2, gate2))
 
+    def test_cossin(self):
+        """ test auxiliar function batched cosine-sine decomposition"""
+        permutation = np.eye(16)[np.random.permutation(16)]
+        diagonal = np.diag(np.exp(1j * np.random.rand(16)))
+        gates = np.stack((unitary_group.rvs(16), permutation, diagonal))
+
+        u_gates, theta, vdh_gates = _cossin(gates)
+        for gate, u_gate, angles, vdh_gate in zip(gates, u_gates, theta, vdh_gates):
+            cos = np.diag(np.cos(angles))
+            sin = np.diag(np.sin(angles))
+            calc = (
+                block_diag(*u_gate) @ np.block([[cos, -sin], [sin, cos]]) @ block_diag(*vdh_gate)
+            )
+            self.assertTrue(np.allclose(calc, gate))
+
+    def test_cossin_near_identity(self):
+        """ sines clustered near zero: near-identity and near-block-diagonal inputs"""
+        dim = 2**6
+        rand = np.random.rand(dim, dim) + np.random.rand(dim, dim) * 1j
+        hermitian = (rand + rand.conj().T) / 2
+        half = dim // 2
+        for eps in [1e-6, 1e-9]:
+            near_identity = expm(1j * eps * hermitian)
+            near_block_diagonal = (
+                block_diag(unitary_group.rvs(half), unitary_group.rvs(half)) @ near_identity
+            )
+            gates = np.stack((near_identity, near_block_diagonal))
+
+            u_gates, theta, vdh_gates = _cossin(gates)
+            for gate, u_gate, angles, vdh_gate in zip(gates, u_gates, theta, vdh_gates):
+                cos = np.diag(np.cos(angles))
+                sin = np.diag(np.sin(angles))
+                calc = (
+                    block_diag(*u_gate) @ np.block([[cos, -sin], [sin, cos]])
+                    @ block_diag(*vdh_gate)
+                )
+                self.assertTrue(np.allclose(calc, gate, rtol=0, atol=1e-12))
+
+            for gate in gates:
+                for decomposition in ['csd', 'qsd']:
+                    calc = Operator(unitary(gate, decomposition)).data
+                    self.assertTrue(np.allclose(calc, gate, rtol=0, atol=1e-12))
+
     # CSD
 
     def test_unitary_csd(self):
@@ -71,6 +125,12 @@ class TestUnitary(TestCase):
         for n_qubits in range(2, 6):
             self._test_counting('csd', n_qubits)
 
+    def test_counting_csd_iso(self):
+        """ Testing qclib.unitary.cnot_count csd with isometries"""
+        for n_qubits in range(3, 6):
+            for iso in range(1, n_qubits-1):
+                self._test_counting('csd', n_qubits, iso)
+
     # QR
     def test_unitary_qr(self):
         """ Testing qclib.unitary csd"""
@@ -82,13 +142,41 @@ class TestUnitary(TestCase):
         for n_qubits in range(2, 5):
             unitary_matrix = unitary_group.rvs(2**n_qubits)
             gate_sequence = _build_qr_gate_sequence(unitary_matrix, n_qubits)
-            
-            unitary_rebuilt = np.eye(2**n_qubits)
-            for g in gate_sequence:
-                unitary_rebuilt = g @ unitary_rebuilt
+
+            unitary_rebuilt = np.eye(2**n_qubits, dtype=complex)
+            for row, col, block in gate_sequence:
+                unitary_rebuilt[[col, row]] = block @ unitary_rebuilt[[col, row]]
 
             self.assertTrue(np.allclose(unitary_rebuilt, unitary_matrix))
 
+    def test_counting_qr(self):
+        """ Testing qclib.unitary.cnot_count qr"""
+        for n_qubits in range(2, 5):
+            unitary_matrix = unitary_group.rvs(2**n_qubits)
+
+            n_cx_exact = cnot_count(unitary_matrix, 'qr', 'exact')
+            n_cx_estimate = cnot_count(unitary_matrix, 'qr', 'estimate')
+            self.assertEqual(n_cx_exact, n_cx_estimate)
+
+            depth_exact = cnot_depth(unitary_matrix, 'qr', 'exact')
+            depth_estimate = cnot_depth(unitary_matrix, 'qr', 'estimate')
+            self.assertLessEqual(depth_exact, depth_estimate)
+
+    def test_auto(self):
+        """ Testing qclib.unitary decomposition='auto'"""
+        for unitary_matrix in [unitary_group.rvs(16),
+                               block_diag(*[unitary_group.rvs(4) for _ in range(4)])]:
+            circuit = unitary(unitary_matrix, 'auto')
+            decomposition = circuit.metadata['decomposition']
+            self.assertIn(decomposition, ['qsd', 'csd'])
+            self.assertTrue(np.allclose(Operator(circuit).data, unitary_matrix))
+
+            n_cx = cnot_count(unitary_matrix, 'auto')
+            self.assertEqual(n_cx, cnot_count(unitary_matrix, decomposition))
+            self.assertEqual(
+                n_cx, min(cnot_count(unitary_matrix, 'qsd'), cnot_count(unitary_matrix, 'csd'))
+            )
+
     # QSD
 
     def test_unitary_qsd(self):
@@ -107,6 +195,144 @@ class TestUnitary(TestCase):
         for n_qubits in range(2, 6):
             self._test_counting('qsd', n_qubits, 0, True)
 
+    def test_counting_qsd_iso(self):
+        """ Testing qclib.unitary.cnot_count qsd with isometries"""
+        for n_qubits in range(3, 6):
+            for iso in range(1, n_qubits-1):
+                self._test_counting('qsd', n_qubits, iso, False)
+                self._test_counting('qsd', n_qubits, iso, True)
+
+    def test_gate_ir_qsd(self):
+        """ Testing the gate list built by qclib.unitary qsd"""
+        for n_qubits in range(3, 6):
+            unitary_matrix = unitary_group.rvs(2**n_qubits)
+            gate_ir = _build_gate_ir(unitary_matrix, 'qsd')
+
+            # Two-qubit leaves of the recursion.
+            self.assertEqual(gate_ir.kinds.count('qsd2q'), 4**(n_qubits-2))
+
+            _apply_a2(gate_ir)
+            self.assertTrue('qsd2q' not in gate_ir.kinds)
+
+            circuit = gate_ir.to_circuit()
+            state = get_state(circuit)
+            self.assertTrue(np.allclose(unitary_matrix[:, 0], state))
+
+    def test_unitary_executor(self):
+        """ Testing qclib.unitary with a process pool"""
+        unitary_matrix = unitary_group.rvs(32)
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            for decomposition in ['qsd', 'csd']:
+                serial = _build_gate_ir(unitary_matrix, decomposition)
+                parallel = _build_gate_ir(unitary_matrix, decomposition, executor=executor)
+
+                self.assertEqual(serial.kinds, parallel.kinds)
+                self.assertEqual(serial.qubits, parallel.qubits)
+                for params1, params2 in zip(serial.params, parallel.params):
+                    self.assertTrue(np.array_equal(np.asarray(params1), np.asarray(params2)))
+
+                circuit = unitary(unitary_matrix, decomposition, executor=executor)
+                state = get_state(circuit)
+                self.assertTrue(np.allclose(unitary_matrix[:, 0], state))
+
+                # Isometries keep generic two-qubit leaves, which carry a phase.
+                circuit = unitary(unitary_matrix, decomposition, iso=2)
+                parallel = unitary(unitary_matrix, decomposition, iso=2, executor=executor)
+                self.assertEqual(circuit.global_phase, parallel.global_phase)
+                self.assertTrue(np.allclose(Operator(circuit).data, Operator(parallel).data))
+
+    def test_two_qubit_cnots(self):
+        """ Testing the minimum number of CNOTs of two-qubit unitaries"""
+        def local():
+            return np.kron(unitary_group.rvs(2), unitary_group.rvs(2))
+
+        cnot = Operator(qiskit.circuit.library.CXGate()).data
+        swap = Operator(qiskit.circuit.library.SwapGate()).data
+        crx = Operator(qiskit.circuit.library.CRXGate(0.3)).data
+
+        gates = [
+            (local(), 0),
+            (local() @ cnot @ local(), 1),
+            (local() @ crx @ local(), 2),
+            (local() @ swap @ local(), 3),
+            (unitary_group.rvs(4), 3),
+        ]
+        for gate, n_cx in gates:
+            self.assertEqual(_two_qubit_cnots(gate), n_cx)
+            for apply_a2 in [False, True]:
+                circuit = unitary(gate, 'qsd', apply_a2=apply_a2)
+                self.assertTrue(np.allclose(Operator(circuit).data, gate))
+                self.assertEqual(cnot_count(gate, 'qsd', 'exact', apply_a2=apply_a2), n_cx)
+                self.assertEqual(cnot_count(gate, 'qsd', 'estimate', apply_a2=apply_a2), n_cx)
+
+    def test_two_qubit_up_to_diagonal(self):
+        """ Testing the two-qubit decomposition up to a diagonal """
+        for _ in range(10):
+            gate = unitary_group.rvs(4)
+            diag, circuit = _two_qubit_up_to_diagonal(gate)
+            self.assertTrue(np.allclose(diag, np.diag(np.diag(diag))))
+            self.assertTrue(np.allclose(diag @ Operator(circuit).data, gate))
+            self.assertEqual(circuit.count_ops().get('cx', 0), 2)
+
+    # Structure
+
+    def _test_structure(self, unitary_matrix, structure, decomposition='qsd'):
+        circuit = unitary(unitary_matrix, decomposition)
+        self.assertEqual(circuit.metadata['structure'], structure)
+        self.assertTrue(np.allclose(Operator(circuit).data, unitary_matrix))
+
+        if decomposition != 'qr':
+            n_cx_exact = cnot_count(unitary_matrix, decomposition, 'exact')
+            n_cx_estimate = cnot_count(unitary_matrix, decomposition, 'estimate')
+            self.assertEqual(n_cx_exact, n_cx_estimate)
+
+    def test_cnot_cost(self):
+        unitary_matrix = unitary_group.rvs(16)
+        for decomposition in ['qsd', 'csd']:
+            cnots, depth = cnot_cost(unitary_matrix, decomposition)
+            self.assertEqual(cnots, cnot_count(unitary_matrix, decomposition))
+            self.assertEqual(depth, cnot_depth(unitary_matrix, decomposition))
+            self.assertEqual(cnots, cnot_count_generic(4, decomposition))
+
+    def test_structure_diagonal(self):
+        """ Testing qclib.unitary with a diagonal unitary"""
+        unitary_matrix = np.diag(np.exp(1j * np.random.rand(16)))
+        self._test_structure(unitary_matrix, 'diagonal')
+
+    def test_structure_permutation(self):
+        """ Testing qclib.unitary with a permutation unitary"""
+        permutation = np.random.permutation(16)
+        unitary_matrix = np.zeros((16, 16), dtype=complex)
+        unitary_matrix[permutation, np.arange(16)] = np.exp(1j * np.random.rand(16))
+        self._test_structure(unitary_matrix, 'permutation', 'qr')
+
+    def test_structure_multiplexor(self):
+        """ Testing qclib.unitary with block-diagonal unitaries"""
+        blocks = [unitary_group.rvs(2) for _ in range(8)]
+        self._test_structure(block_diag(*blocks), 'multiplexor')
+
+        blocks = [unitary_group.rvs(8) for _ in range(2)]
+        for decomposition in ['qsd', 'csd']:
+            self._test_structure(block_diag(*blocks), 'multiplexor', decomposition)
+
+    def test_structure_tensor(self):
+        """ Testing qclib.unitary with a tensor product unitary"""
+        unitary_matrix = np.kron(unitary_group.rvs(4), unitary_group.rvs(8))
+        for decomposition in ['qsd', 'csd']:
+            self._test_structure(unitary_matrix, 'tensor', decomposition)
+
+    def test_structure_disabled(self):
+        """ Testing qclib.unitary with the structure analysis disabled"""
+        unitary_matrix = np.diag(np.exp(1j * np.random.rand(16)))
+        gate = unitary(unitary_matrix, 'qsd', detect_structure=False)
+        self.assertEqual(gate.metadata['structure'], 'generic')
+        self.assertTrue(np.allclose(Operator(gate).data, unitary_matrix))
+
+        n_cx_exact = cnot_count(unitary_matrix, 'qsd', 'exact', detect_structure=False)
+        n_cx_estimate = cnot_count(unitary_matrix, 'qsd', 'estimate', detect_structure=False)
+        self.assertEqual(n_cx_exact, n_cx_estimate)
+        self.assertLess(cnot_count(unitary_matrix, 'qsd'), n_cx_estimate)
+
     def test_unitary_qsd_count(self):
         """ Testing qclib.unitary 4 qubits gate qsd"""
         unitary_matrix = unitary_group.rvs(16)